@@ -1,27 +1,48 @@
 import streamlit as st
 import altair as alt
 
-import os
-import json
-import time
-import duckdb
 from datetime import timedelta
+import logging
 import pytz
 import pandas as pd
 
-import io
 import chess
-import chess.pgn
+import chess.svg
 
-# dlt
-from chess_dlt.chess import source
-import dlt
+from chess_pipeline import RefreshResult
+from chess_dbt.lib.movetext import pgn_to_board
+from jobs import Job, JobQueue
+import queries
 
-# dbt
-from dbt.cli.main import dbtRunner, dbtRunnerResult
+logger = logging.getLogger(__name__)
+
+
+def export_user_data(job: Job, result: RefreshResult) -> None:
+    """Runs once a refresh succeeded, before its job is marked done"""
+    # Save data into parquet file, the warehouse data source reads main.games directly
+    if queries.DATA_SOURCE == 'parquet':
+        conn = queries.connect_warehouse(job.username)
+        queries.export_user_data(conn, job.username)
+        conn.close()
+    logger.info("Refreshed %s: %s", job.username, ', '.join(f'{phase} {seconds:.2f}s' for phase, seconds in result.timings.items()))
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    """Refresh jobs shared by every session, a player asked for twice is refreshed once"""
+    return JobQueue(on_done=export_user_data)
+
+
+@st.fragment(run_every=1)
+def show_job_progress(username: str) -> None:
+    """Polls the player's refresh, the rest of the page stays usable meanwhile"""
+    job = get_job_queue().get(username)
+    if job is not None and job.is_active:
+        st.progress(job.progress, text=job.describe())
+    else:
+        # the refreshed data changes the cache keys of every query
+        st.rerun()
 
-data_folder = 'data'
-db_path = f'{data_folder}/chess.duckdb'
 
 st.set_page_config(layout="wide")
 
@@ -30,81 +51,43 @@ st.title("Welcome to Chess Dashboard")
 username = st.text_input("Enter chess.com username", placeholder="magnuscarlsen")
 if st.button("Get Data"):
     try:
-        progress_bar = st.progress(0, text=f'Getting data for {username}')
-        is_data_ready = False
-
-        # Get data from chess.com API
-        # configure the pipeline: provide the destination and dataset name to which the data should go
-        pipeline = dlt.pipeline(
-            pipeline_name="chess_pipeline",
-            destination=dlt.destinations.duckdb(db_path),
-            dataset_name="chess_data_raw",
-        )
-        data=source(username=username),
-        info = pipeline.run(data)
-        
-        # initialize
-        dbt = dbtRunner()
-
-        # create CLI args as a list of strings
-        project_dir = ['--project-dir', 'src/chess_dbt']
-        profiles_dir = ['--profiles-dir', 'src/chess_dbt/profiles']
-        target = ['--target', 'prod']
-        
-        json_str = json.dumps({"username": username})
-        args = ['--vars', json_str]
-        
-        debug = ["debug"] + project_dir + profiles_dir + target
-        build = ["build"] + project_dir + profiles_dir + target + args
+        # Get data from chess.com API and build the insights in a worker process
+        get_job_queue().submit(username)
+    except ValueError as e:
+        st.error(e)
+
+job = get_job_queue().get(username) if username else None
+if job is not None and job.is_active:
+    show_job_progress(username)
+elif job is not None and job.state == 'failed':
+    st.error(job.describe())
+
+# Check if the player's data exists
+try:
+    user_has_data = bool(username) and queries.has_user_data(username)
+except queries.WarehouseBusy as e:
+    # a writer, e.g. the batch CLI, still holds the warehouse after the retries
+    st.info(e)
+    st.stop()
 
-        # run the command
-        res: dbtRunnerResult = dbt.invoke(debug)
-        progress_bar.progress(50, text=f'Getting insights... This may take a few minutes')
-        
-        res: dbtRunnerResult = dbt.invoke(build)
-        progress_bar.progress(100, text=f'Completed! Showing dashboard...')
-        time.sleep(1)
-        progress_bar.empty()
-
-    except Exception as e:
-        print(e)
-    
-    # Save data into parquet file
-    conn = duckdb.connect(database=db_path, read_only=True)
-    df = conn.sql("SELECT * FROM main.games").df()
-    df.to_parquet(f'{data_folder}/{username}.parquet')
-    conn.close()
-    
-
-# Check if username parquet file exists
 if username is None or username == "":
     st.warning(f"Please enter a valid username and click 'Get Data'")
 
-elif not os.path.exists(f'{data_folder}/{username}.parquet'):
+elif not user_has_data:
     st.warning(f"Data for {username} does not exist. Please enter a valid username and click 'Get Data'")
 
 else:
     st.header(f"Username: {username}")
-    user_df = pd.read_parquet(f'{data_folder}/{username}.parquet')
-
-    # Connect to the database    
-    conn = duckdb.connect()
+    # every query below is cached on the player, the filters it uses and the export's mtime
+    mtime = queries.user_data_mtime(username)
 
     filter_1, filter_2, filter_3 = st.columns(3)
     with filter_1: 
-        df_time_class = conn.sql("""
-            SELECT DISTINCT time_class
-            FROM user_df
-            order by time_class
-        """).df()
+        df_time_class = queries.get_distinct_values(username, mtime, 'time_class')
         time_class = st.selectbox('Time Class', df_time_class, index=2)
         
     with filter_2: 
-        filter_player_color = conn.sql("""
-            SELECT DISTINCT player_color
-            FROM user_df
-            order by player_color
-        """).df()['player_color'].tolist()
+        filter_player_color = queries.get_distinct_values(username, mtime, 'player_color')
         filter_player_color = ['All'] + filter_player_color
         player_color = st.selectbox('Player Color', filter_player_color)
         player_color = [player_color]
@@ -116,12 +99,7 @@ else:
         utc_index = timezones.index("UTC")
         selected_timezone = st.selectbox("Select a timezone", timezones, index=utc_index)
 
-    ts_min, ts_max = conn.sql(f"""
-        select min(game_start_date), max(game_start_date)
-        from user_df
-        WHERE time_class = '{time_class}'
-        AND player_color in ({', '.join([f"'{color}'" for color in player_color])}) 
-    """).df().iloc[0]
+    ts_min, ts_max = queries.get_date_range(username, mtime, time_class, tuple(player_color))
     ts_min = pd.Timestamp(ts_min).date()
     ts_max = pd.Timestamp(ts_max).date()
 
@@ -134,43 +112,31 @@ else:
 
     st.divider()
 
-    # Get base data
-    query = f"""
-        SELECT *
-        FROM user_df
-        WHERE time_class = '{time_class}'
-        AND player_color in ({', '.join([f"'{color}'" for color in player_color])})
-        AND game_start_date between '{slider_min}' and '{slider_max}'
-    """
-    df = conn.sql(query).df()
+    # Filters of the base data
+    filters = queries.Filters(time_class, tuple(player_color), str(slider_min), str(slider_max))
+    df_summary = queries.get_summary(username, mtime, filters)
 
-    tab_overview, tab_opening, tab_latest_games = st.tabs(["Overview", "Openings", "Latest Games"])
+    tab_overview, tab_opening, tab_positions, tab_latest_games = st.tabs(["Overview", "Openings", "Positions", "Latest Games"])
 
     # Row 1
     row_1a, row_1b, row_1c, row_1d = tab_overview.columns(4)
 
 
     row_1a.subheader('# Games')
-    row_1a.header(df.shape[0])
-
+    row_1a.header(df_summary['num_games'])
 
-    df_player_wdl = conn.sql("""
-        SELECT 
-        sum(if(player_wdl = 'win', 1, 0)) / count(1) as win_perc
-        FROM df
-    """).df()
 
     row_1b.subheader('Win %')
-    row_1b.header(f"{df_player_wdl['win_perc'].iloc[0]:.2%}")
+    row_1b.header(f"{df_summary['win_perc']:.2%}")
 
 
     row_1c.subheader('# Moves Made')
-    row_1c.header(df['player_num_moves'].sum())
+    row_1c.header(df_summary['num_moves'])
 
 
     row_1d.subheader('Total Move time')
     if time_class != 'daily':
-        move_time = df['player_total_move_time'].sum()
+        move_time = float(df_summary['total_move_time'])
         move_time = timedelta(seconds=move_time)
         move_time = timedelta(days=move_time.days, seconds=move_time.seconds)
         row_1d.header(str(move_time))
@@ -179,22 +145,7 @@ else:
 
     # Row 2
     tab_overview.subheader('Elo across time')
-    df_daily_games = conn.sql("""
-        with data as (
-            SELECT
-            game_start_date
-            , player_rating
-            , game_start_timestamp
-            , row_number() over (partition by game_start_date order by game_start_timestamp) as game_num
-            FROM df
-        )
-        select
-        game_start_date
-        , max_by(player_rating, game_num) as player_rating
-        , count(1) as num_games
-        from data
-        group by game_start_date
-    """).df()
+    df_daily_games = queries.get_daily_games(username, mtime, filters)
 
     base = alt.Chart(df_daily_games).encode(x='game_start_date')
     line =  base.mark_line(color='red').encode(
@@ -213,27 +164,12 @@ else:
 
 
     row_3a.subheader('Win/Draw/Loss')
-    df_wdl = conn.sql("""
-        SELECT 
-        player_wdl
-        , count(1) as num_games
-        , 100.0 * count(1) / sum(count(1)) over() as win_perc
-        FROM df
-        group by player_wdl
-    """).df()
+    df_wdl = queries.get_wdl(username, mtime, filters)
     row_3a.bar_chart(data=df_wdl, x='player_wdl', y='win_perc')
 
 
     row_3b.subheader('Win/Draw/Loss with Reason')
-    df_wdl_reason = conn.sql("""
-        SELECT
-        player_wdl
-        , player_wdl_reason
-        , count(1) as num_games
-        , 100.0 * count(1) / sum(count(1)) over() as win_perc
-        FROM df
-        group by player_wdl, player_wdl_reason
-    """).df()
+    df_wdl_reason = queries.get_wdl_reason(username, mtime, filters)
 
     bar = alt.Chart(df_wdl_reason).mark_bar().encode(
         x='player_wdl',
@@ -245,37 +181,13 @@ else:
 
     # Row 4
     row_4a, row_4b = tab_overview.columns(2)
-    df_dow_hour = conn.sql(f"""
-        set timezone='{selected_timezone}';
-        with base as (
-            select
-            game_start_timestamp::VARCHAR || ' UTC' as game_start_timestamp_utc
-            , game_start_timestamp_utc::TIMESTAMPTZ as ts
-            , player_wdl
-            from df
-        )
-        select
-            hour(ts) as ts_hour
-            , dayofweek(ts) as ts_day_of_week
-            , case ts_day_of_week
-                when 0 then 'Sunday'
-                when 1 then 'Monday'
-                when 2 then 'Tuesday'
-                when 3 then 'Wednesday'
-                when 4 then 'Thursday'
-                when 5 then 'Friday'
-                when 6 then 'Saturday'
-                else 'Unknown'
-            end as ts_day_of_week_name
-            , *
-        from base;
-    """).df()
+    df_dow_hour = queries.get_dow_hour(username, mtime, filters, selected_timezone)
 
 
     row_4a.subheader('Games by Day of Week')
     base = alt.Chart(df_dow_hour).encode(
         alt.X('ts_day_of_week_name', sort=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']),
-        y="count()",
+        y="sum(num_games)",
     )
     row_4a.altair_chart(base.mark_bar())
 
@@ -285,7 +197,7 @@ else:
         alt.X('ts_day_of_week_name', 
                 sort=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         ),
-        alt.Y('count()', stack='normalize'),
+        alt.Y('sum(num_games)', stack='normalize'),
         color='player_wdl'
     )
     row_4b.altair_chart(base.mark_bar())
@@ -296,29 +208,21 @@ else:
     row_5a.subheader('Games by Hour')
     base = alt.Chart(df_dow_hour).encode(
         alt.X('ts_hour', bin={"binned": True, "step": 1}),
-        y="count()",
+        y="sum(num_games)",
     )
     row_5a.altair_chart(base.mark_bar())
 
     row_5b.subheader('Win rate by Hour')
     base = alt.Chart(df_dow_hour).encode(
         alt.X('ts_hour', bin={"binned": True, "step": 1}),
-        alt.Y('count()', stack='normalize'),
+        alt.Y('sum(num_games)', stack='normalize'),
         color='player_wdl'
     )
     row_5b.altair_chart(base.mark_bar())
 
 
     tab_overview.subheader('Win rate by Day of Week X Hour')
-    df_heatmap = conn.sql(f"""
-        select
-        ts_day_of_week_name
-        , ts_hour
-        , 100.0 * count_if(player_wdl = 'win') / count(1) as perc
-        , count(1) as num_games
-        from df_dow_hour
-        group by ts_day_of_week_name, ts_hour
-    """).df()
+    df_heatmap = queries.get_dow_hour_heatmap(username, mtime, filters, selected_timezone)
 
     heatmap = alt.Chart(df_heatmap).mark_rect().encode(
         alt.Y('ts_day_of_week_name', sort=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']),
@@ -330,16 +234,7 @@ else:
 
 
     row_6a, row_6b = tab_overview.columns(2)
-    df_checkmate_pieces = conn.sql("""
-            select
-            player_wdl
-            , checkmate_pieces
-            , count(1) as num_games
-            from df
-            where player_wdl_reason = 'checkmated'
-            group by all
-            order by player_wdl, num_games desc;
-        """).df()
+    df_checkmate_pieces = queries.get_checkmate_pieces(username, mtime, filters)
 
 
     row_6a.subheader('Winning checkmate Pieces')
@@ -353,15 +248,7 @@ else:
 
 
     row_7a, row_7b = tab_overview.columns(2)
-    df_game_phase = conn.sql("""
-        select
-        ended_game_phase
-        , player_wdl
-        , count(1) as num_games
-        , sum(count(1)) over() as total_games
-        from df
-        group by all
-    """).df()
+    df_game_phase = queries.get_game_phase(username, mtime, filters)
 
     row_7a.subheader('Phases the game ended at')
     base = alt.Chart(df_game_phase).encode(
@@ -382,48 +269,15 @@ else:
 
 
     ########## Openings ##########
-    move_num = tab_opening.slider('1st N moves', min_value=1, max_value=7, value=5)
+    move_num = tab_opening.slider('1st N moves', min_value=1, max_value=queries.OPENING_TREE_DEPTH, value=5)
     tab_opening.header(f'Most played starting {move_num} moves')
 
-    df_starting_moves = conn.sql(f"""
-        with cte as (
-            SELECT
-            player_color
-            , player_wdl
-            , list_reduce(pgn_move_extract[1:{move_num}], (s, x) -> s || ' ' || x) as starting_moves
-            , count(1) as wdl_num_games
-            , sum(count(1)) over(partition by player_color, starting_moves) as num_games
-            FROM df
-            group by player_color, player_wdl, starting_moves
-        )
-        select
-            *
-            , dense_rank() over(partition by player_color order by num_games desc) as rn
-            , 100.0 * wdl_num_games / num_games as perc
-        from cte
-        qualify rn <= 5
-    """).df()
+    df_starting_moves = queries.get_starting_moves(username, mtime, filters, move_num)
 
     if 'White' in player_color:
-        df_winning_opening_white = conn.sql(f"""
-                select
-                *
-                , row_number() over(order by perc desc) as win_order
-                from df_starting_moves
-                where player_color = 'White'
-                and player_wdl = 'win'
-                qualify win_order <= 3
-            """).df()
+        df_winning_opening_white = queries.get_top_openings(username, mtime, filters, move_num, 'White', 'win')
         
-        df_losing_opening_white = conn.sql(f"""
-                select
-                *
-                , row_number() over(order by perc desc) as lose_order
-                from df_starting_moves
-                where player_color = 'White'
-                and player_wdl = 'lose'
-                qualify lose_order <= 3
-            """).df()
+        df_losing_opening_white = queries.get_top_openings(username, mtime, filters, move_num, 'White', 'lose')
         
         tab_opening.subheader('Top 3 Best/Worst opening moves: White')
         total_white = len(df_winning_opening_white) + len(df_losing_opening_white)
@@ -433,25 +287,14 @@ else:
                     opening = df_winning_opening_white['starting_moves'].iloc[i]
                     perc = df_winning_opening_white['perc'].iloc[i].round(2)
                     
-                    pgn = io.StringIO(opening)
-                    game = chess.pgn.read_game(pgn)
-                    board = game.end().board()
+                    board = pgn_to_board(opening)
                     
                     col.write(f'Win {perc}%')
                     col.write(chess.svg.board(board), unsafe_allow_html=True)
+                    num_games = queries.get_position_num_games(username, mtime, filters, queries.position_hash(board), 'White')
+                    col.caption(f'Position reached in {num_games} games by any move order')
                     if col.toggle('List Games', key=f'White_{i}'):
-                        df_display = conn.sql(f"""
-                            select *
-                            from (
-                                select
-                                game_analysis_url
-                                from df
-                                where player_color = 'White'
-                                and player_wdl = 'win'
-                                and list_reduce(pgn_move_extract[1:{move_num}], (s, x) -> s || ' ' || x) = '{opening}'
-                            )
-                            using sample 5 rows;
-                        """).df()
+                        df_display = queries.get_opening_games(username, mtime, filters, move_num, 'White', 'win', opening)
 
                         col.dataframe(df_display, 
                                     column_config={
@@ -466,25 +309,14 @@ else:
                     opening = df_losing_opening_white['starting_moves'].iloc[len(df_winning_opening_white)-i]
                     perc = df_losing_opening_white['perc'].iloc[len(df_winning_opening_white)-i].round(2)
                     
-                    pgn = io.StringIO(opening)
-                    game = chess.pgn.read_game(pgn)
-                    board = game.end().board()
+                    board = pgn_to_board(opening)
                     
                     col.write(f'Lose {perc}%')
                     col.write(chess.svg.board(board), unsafe_allow_html=True)
+                    num_games = queries.get_position_num_games(username, mtime, filters, queries.position_hash(board), 'White')
+                    col.caption(f'Position reached in {num_games} games by any move order')
                     if col.toggle('List Games', key=f'White_{i}'):
-                        df_display = conn.sql(f"""
-                            select *
-                            from (
-                                select
-                                game_analysis_url
-                                from df
-                                where player_color = 'White'
-                                and player_wdl = 'lose'
-                                and list_reduce(pgn_move_extract[1:{move_num}], (s, x) -> s || ' ' || x) = '{opening}'
-                            )
-                            using sample 5 rows;
-                        """).df()
+                        df_display = queries.get_opening_games(username, mtime, filters, move_num, 'White', 'lose', opening)
 
                         col.dataframe(df_display, 
                                     column_config={
@@ -495,25 +327,9 @@ else:
         
 
     if 'Black' in player_color:
-        df_winning_opening_black = conn.sql(f"""
-                select
-                *
-                , row_number() over(order by perc desc) as win_order
-                from df_starting_moves
-                where player_color = 'Black'
-                and player_wdl = 'win'
-                qualify win_order <= 3
-            """).df()
+        df_winning_opening_black = queries.get_top_openings(username, mtime, filters, move_num, 'Black', 'win')
         
-        df_losing_opening_black = conn.sql(f"""
-                select
-                *
-                , row_number() over(order by perc desc) as lose_order
-                from df_starting_moves
-                where player_color = 'Black'
-                and player_wdl = 'lose'
-                qualify lose_order <= 3
-            """).df()
+        df_losing_opening_black = queries.get_top_openings(username, mtime, filters, move_num, 'Black', 'lose')
         
         tab_opening.subheader('Top 3 Best/Worst opening moves: Black')
         total_black = len(df_winning_opening_black) + len(df_losing_opening_black)
@@ -523,25 +339,14 @@ else:
                     opening = df_winning_opening_black['starting_moves'].iloc[i]
                     perc = df_winning_opening_black['perc'].iloc[i].round(2)
                     
-                    pgn = io.StringIO(opening)
-                    game = chess.pgn.read_game(pgn)
-                    board = game.end().board()
+                    board = pgn_to_board(opening)
                     
                     col.write(f'Win {perc}%')
                     col.write(chess.svg.board(board, orientation=chess.BLACK), unsafe_allow_html=True)
+                    num_games = queries.get_position_num_games(username, mtime, filters, queries.position_hash(board), 'Black')
+                    col.caption(f'Position reached in {num_games} games by any move order')
                     if col.toggle('List Games', key=f'Black_{i}'):
-                        df_display = conn.sql(f"""
-                            select *
-                            from (
-                                select
-                                game_analysis_url
-                                from df
-                                where player_color = 'Black'
-                                and player_wdl = 'win'
-                                and list_reduce(pgn_move_extract[1:{move_num}], (s, x) -> s || ' ' || x) = '{opening}'
-                            )
-                            using sample 5 rows;
-                        """).df()
+                        df_display = queries.get_opening_games(username, mtime, filters, move_num, 'Black', 'win', opening)
 
                         col.dataframe(df_display, 
                                     column_config={
@@ -554,25 +359,14 @@ else:
                     opening = df_losing_opening_black['starting_moves'].iloc[len(df_winning_opening_black)-i]
                     perc = df_losing_opening_black['perc'].iloc[len(df_winning_opening_black)-i].round(2) 
                     
-                    pgn = io.StringIO(opening)
-                    game = chess.pgn.read_game(pgn)
-                    board = game.end().board()
+                    board = pgn_to_board(opening)
                     
                     col.write(f'Lose {perc}%')
                     col.write(chess.svg.board(board, orientation=chess.BLACK), unsafe_allow_html=True)
+                    num_games = queries.get_position_num_games(username, mtime, filters, queries.position_hash(board), 'Black')
+                    col.caption(f'Position reached in {num_games} games by any move order')
                     if col.toggle('List Games', key=f'Black_{i}'):
-                        df_display = conn.sql(f"""
-                            select *
-                            from (
-                                select
-                                game_analysis_url
-                                from df
-                                where player_color = 'Black'
-                                and player_wdl = 'lose'
-                                and list_reduce(pgn_move_extract[1:{move_num}], (s, x) -> s || ' ' || x) = '{opening}'
-                            )
-                            using sample 5 rows;
-                        """).df()
+                        df_display = queries.get_opening_games(username, mtime, filters, move_num, 'Black', 'lose', opening)
 
                         col.dataframe(df_display, 
                                     column_config={
@@ -582,25 +376,48 @@ else:
                                     )
 
 
+    ########## Positions ##########
+    tab_positions.header('Games reaching a position')
+    position = tab_positions.text_input('FEN or moves', placeholder='1. e4 e5 2. Nf3 Nc6 3. Bc4')
+    if position:
+        try:
+            # the 8 ranks of a FEN are separated by '/', anything else is read as movetext.
+            # Read as Chess960, a FEN keeps the castling rights of its rooks whatever their files,
+            # hashing like the Chess960 games (standard positions hash the same either way)
+            board = chess.Board(position, chess960=True) if position.count('/') == 7 else pgn_to_board(position)
+        except ValueError:
+            board = None
+            tab_positions.warning(f"'{position}' is not a valid FEN or movetext")
+
+        if board is not None:
+            row_8a, row_8b = tab_positions.columns(2)
+            row_8a.write(chess.svg.board(board), unsafe_allow_html=True)
+
+            position_hash = queries.position_hash(board)
+            df_position_wdl = queries.get_position_wdl(username, mtime, filters, position_hash)
+            if df_position_wdl.empty:
+                row_8b.info('No games reached this position')
+            else:
+                row_8b.subheader(f"Reached in {df_position_wdl['num_games'].sum()} games by any move order")
+                row_8b.altair_chart(alt.Chart(df_position_wdl).mark_bar().encode(
+                    alt.X('sum(num_games)', stack='normalize', title='Games'),
+                    alt.Y('player_color', title=None),
+                    color='player_wdl'
+                ))
+                row_8b.dataframe(queries.get_position_games(username, mtime, filters, position_hash),
+                    column_config={
+                        'game_analysis_url': st.column_config.LinkColumn(
+                        "URL", display_text="Game URL")
+                    }
+                )
+
+
     tab_latest_games.subheader('Latest Games')
-    df_latest_games = conn.sql(f"""
-        select
-        player_color
-        , player_wdl
-        , player_wdl_reason
-        , opponent_rating
-        , game_analysis_url
-        from df
-        order by game_start_timestamp desc
-        limit 20;
-    """).df()
+    df_latest_games = queries.get_latest_games(username, mtime, filters)
 
     tab_latest_games.dataframe(df_latest_games, 
         column_config={
             'game_analysis_url': st.column_config.LinkColumn(
             "URL", display_text="Game URL")
         }
-    )
-
-    # Close connection
-    conn.close()
\ No newline at end of file
+    )
\ No newline at end of file
@@ -0,0 +1,9 @@
+"""Benchmarks for the chess dashboard pipeline"""
+
+import os
+import sys
+
+# dbt imports the UDF modules through `module_paths` in profiles.yml, do the same here
+LIB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'chess_dbt', 'lib'))
+if LIB_PATH not in sys.path:
+    sys.path.insert(0, LIB_PATH)
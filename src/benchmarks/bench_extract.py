@@ -0,0 +1,69 @@
+"""Times the `chess` source extracting a player's full history from the local stub API
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.bench_extract --months 180 --workers 1 8
+    PYTHONPATH=src python -m benchmarks.bench_extract --months 3 --games-per-month 5000 --workers 4 --stream
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import dlt
+
+from chess_dlt.chess import source
+
+from .stub_api import StubChessApi
+
+
+def run(tmp: str, months: int, games_per_month: int, workers: int, latency: float, server_rate_limit: float, requests_per_second: float, stream: bool = False) -> dict:
+    with StubChessApi(months, games_per_month, latency=latency, max_requests_per_second=server_rate_limit) as api:
+        pipeline = dlt.pipeline(
+            pipeline_name=f"bench_extract_{workers}_{int(stream)}",
+            destination=dlt.destinations.duckdb(os.path.join(tmp, f"bench_{workers}_{int(stream)}.duckdb")),
+            dataset_name="chess_data_raw",
+            pipelines_dir=tmp,
+        )
+        data = source(
+            username="synthetic_player",
+            max_workers=workers,
+            requests_per_second=requests_per_second,
+            api_url=api.api_url,
+            stream_archives=stream,
+        )
+        tracemalloc.start()
+        start = time.perf_counter()
+        pipeline.extract(data)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = api.get_stats()
+        return {"peak_mb": peak / 2**20, "seconds": elapsed, "requests": stats["requests"], "archives": stats["archives"], "throttled": stats["throttled"]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--months', type=int, default=180, help='monthly archives served by the stub')
+    parser.add_argument('--games-per-month', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05, help='stub response latency in seconds')
+    parser.add_argument('--server-rate-limit', type=float, default=None, help='stub answers 429 above this many requests/s')
+    parser.add_argument('--requests-per-second', type=float, default=0, help='client side rate limit, 0 disables it')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--stream', action='store_true', help='also run with streamed archives')
+    args = parser.parse_args()
+
+    # deferred archive fetches run on dlt's extract thread pool
+    os.environ.setdefault("EXTRACT__WORKERS", str(max(args.workers)))
+
+    print(f"{'workers':>8}{'stream':>8}{'seconds':>10}{'peak MB':>10}{'requests':>10}{'archives':>10}{'throttled':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for stream in ([False, True] if args.stream else [False]):
+            for workers in args.workers:
+                result = run(tmp, args.months, args.games_per_month, workers, args.latency, args.server_rate_limit, args.requests_per_second, stream)
+                print(f"{workers:>8}{str(stream):>8}{result['seconds']:>10.2f}{result['peak_mb']:>10.1f}{result['requests']:>10}{result['archives']:>10}{result['throttled']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Compares the rows/s of loading games through the pydantic contract and as Arrow tables
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.bench_load --months 24 --games-per-month 2000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import dlt
+
+from chess_dlt.chess import source
+
+from .stub_api import StubChessApi
+
+
+def run(tmp: str, api: StubChessApi, arrow: bool) -> dict:
+    name = "arrow" if arrow else "pydantic"
+    pipeline = dlt.pipeline(
+        pipeline_name=f"bench_load_{name}",
+        destination=dlt.destinations.duckdb(os.path.join(tmp, f"bench_{name}.duckdb")),
+        dataset_name="chess_data_raw",
+        pipelines_dir=tmp,
+    )
+    data = source(username="synthetic_player", requests_per_second=0, api_url=api.api_url, arrow=arrow)
+    timings = {}
+    for step, run_step in (("extract", lambda: pipeline.extract(data)), ("normalize", pipeline.normalize), ("load", pipeline.load)):
+        start = time.perf_counter()
+        run_step()
+        timings[step] = time.perf_counter() - start
+
+    with pipeline.sql_client() as client:
+        timings["rows"] = client.execute_sql("select count(*) from players_games")[0][0]
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--months', type=int, default=24, help='monthly archives served by the stub')
+    parser.add_argument('--games-per-month', type=int, default=2000)
+    args = parser.parse_args()
+
+    # the Arrow tables only get the dlt columns when asked, as in chess_pipeline
+    dlt.config["normalize.parquet_normalizer.add_dlt_id"] = True
+    dlt.config["normalize.parquet_normalizer.add_dlt_load_id"] = True
+
+    print(f"{'path':>10}{'rows':>10}{'extract':>12}{'normalize':>12}{'load':>12}{'total':>12}")
+    with tempfile.TemporaryDirectory() as tmp, StubChessApi(args.months, args.games_per_month) as api:
+        for arrow in (False, True):
+            result = run(tmp, api, arrow)
+            rows = result.pop("rows")
+            result["total"] = sum(result.values())
+            rates = "".join(f"{rows / seconds:>12.0f}" for seconds in result.values())
+            print(f"{'arrow' if arrow else 'pydantic':>10}{rows:>10}{rates}")
+    print("(rows/s of each step)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Compares the clock and move history columns of prep_game_moves with the window functions they replaced
+
+Each variant runs in its own process, which reports the peak memory the query added.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.bench_moves --moves 5000000
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import duckdb
+
+from .synthetic import generate_games
+
+# The moves of the games, as unnested by prep_game_moves
+MOVES = r"""
+    select
+        game_uuid
+        , player_username
+        , time_control_base
+        , time_control_add_seconds
+        , generate_subscripts(pgn_move_extract, 1) as game_move_index
+        , unnest(pgn_move_extract) as move_unnest
+        , {clock_unnest}
+        , split(move_unnest, ' ')[1] as color_move_index_raw
+        , regexp_replace(color_move_index_raw, '\.+', '') as color_move_index_str
+        , if(regexp_matches(color_move_index_raw, '\.\.\.'), 'Black', 'White') as color_move
+        {columns}
+    from {games}
+"""
+
+CLOCK_POST_MOVE = "epoch(cast(replace(split({clock}, ' ')[2], ']}}}}', '') as interval))"
+
+# The cumulative PGN and the mover's previous clock of every move
+QUERIES = {
+    "window functions": f"""
+        with moves as (
+            {MOVES.format(
+                games='games',
+                clock_unnest='unnest(pgn_clock_extract) as clock_unnest',
+                columns=f", {CLOCK_POST_MOVE.format(clock='clock_unnest')} as clock_interval_post_move",
+            )}
+        )
+        select
+            game_uuid
+            , player_username
+            , game_move_index
+            , string_agg(move_unnest, ' ')
+                over (partition by game_uuid, player_username order by game_move_index)
+                as pgn_cum_move
+            , clock_interval_post_move
+            , coalesce(
+                lag(clock_interval_post_move)
+                    over (
+                        partition by game_uuid, player_username, color_move
+                        order by cast(color_move_index_str as int)
+                    )
+                , time_control_base
+            ) as prev_clock_interval
+            , prev_clock_interval - (clock_interval_post_move - time_control_add_seconds) as move_time_seconds
+        from moves
+    """,
+    "per game lists": f"""
+        with games_clocks as (
+            select
+                *
+                , list_transform(pgn_clock_extract, clock -> {CLOCK_POST_MOVE.format(clock='clock')}) as clocks_post_move
+            from games
+        )
+        , moves as (
+            {MOVES.format(
+                games='games_clocks',
+                clock_unnest='unnest(clocks_post_move) as clock_interval_post_move',
+                columns='''
+                , coalesce(
+                    if(game_move_index > 2, clocks_post_move[game_move_index - 2], null)
+                    , time_control_base
+                ) as prev_clock_interval
+                ''',
+            )}
+        )
+        select
+            game_uuid
+            , player_username
+            , game_move_index
+            , clock_interval_post_move
+            , prev_clock_interval
+            , prev_clock_interval - (clock_interval_post_move - time_control_add_seconds) as move_time_seconds
+        from moves
+    """,
+}
+
+# The move lists of prep_player_games
+EXTRACT = r"""
+    select
+        game_uuid
+        , 'synthetic_player' as player_username
+        , time_control_base
+        , time_control_add_seconds
+        , regexp_extract_all(pgn_moves, '\d+\.+ [\S]+') as pgn_move_extract
+        , regexp_extract_all(pgn_moves, '{\[%clk \S+\]}') as pgn_clock_extract
+    from (
+        select
+            *
+            , string_split(pgn, E'\n\n')[2] as pgn_moves
+            , split_part(time_control, '+', 1)::int as time_control_base
+            , coalesce(nullif(split_part(time_control, '+', 2), ''), '0')::int as time_control_add_seconds
+        from read_parquet($path)
+    )
+"""
+
+
+def _peak_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_query(path: str, name: str, out: str, results: dict) -> None:
+    conn = duckdb.connect(os.path.join(out, f"{name.replace(' ', '_')}.duckdb"), config={'enable_progress_bar': False})
+    conn.execute("create table games as select * from read_parquet($path)", {'path': path})
+    before = _peak_mb()
+    start = time.perf_counter()
+    # materialized, as the model stores the moves
+    conn.execute(f"create table result as {QUERIES[name]}")
+    results[name] = {'seconds': time.perf_counter() - start, 'peak_mb': _peak_mb() - before}
+    conn.close()
+
+
+def run(num_moves: int, pool_size: int) -> dict:
+    pool = list(generate_games(pool_size))
+    with tempfile.TemporaryDirectory() as tmp:
+        # the pool is repeated under new uuids up to `num_moves` moves
+        conn = duckdb.connect()
+        conn.execute("create table pool as select unnest($pgns) as pgn, unnest($time_controls) as time_control", {
+            'pgns': [game['pgn'] for game in pool],
+            'time_controls': [game['time_control'] for game in pool],
+        })
+        path = os.path.join(tmp, 'games.parquet')
+        conn.execute(f"create table pool_games as {EXTRACT.replace('read_parquet($path)', '(select *, uuid()::varchar as game_uuid from pool)')}")
+        pool_moves = conn.sql("select sum(len(pgn_move_extract)) from pool_games").fetchone()[0]
+        copies = max(1, round(num_moves / pool_moves))
+        conn.execute(f"""
+            copy (
+                select * replace (game_uuid || '-' || copy as game_uuid)
+                from pool_games, range({copies}) as copies(copy)
+            ) to '{path}' (format parquet)
+        """)
+        conn.close()
+
+        # a process per variant so its peak memory is its own
+        context = multiprocessing.get_context('spawn')
+        with context.Manager() as manager:
+            results = manager.dict()
+            for name in QUERIES:
+                process = context.Process(target=_run_query, args=(path, name, tmp, results))
+                process.start()
+                process.join()
+            results = dict(results)
+
+        conn = duckdb.connect()
+        for name in QUERIES:
+            conn.execute(f"attach '{os.path.join(tmp, name.replace(' ', '_'))}.duckdb' as {name.replace(' ', '_')} (read_only)")
+        common = "game_uuid, player_username, game_move_index, clock_interval_post_move, prev_clock_interval, move_time_seconds"
+        mismatches = conn.sql(f"""
+            select count(*) from (
+                select {common} from window_functions.result
+                except all
+                select {common} from per_game_lists.result
+            )
+        """).fetchone()[0]
+        rows = conn.sql("select count(*) from per_game_lists.result").fetchone()[0]
+        conn.close()
+    if mismatches:
+        raise AssertionError(f"{mismatches} moves have different clocks")
+    return {'rows': rows, **results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--moves', type=int, default=5_000_000, help='number of moves in the corpus')
+    parser.add_argument('--pool', type=int, default=500, help='distinct synthetic games the corpus is drawn from')
+    args = parser.parse_args()
+
+    results = run(args.moves, args.pool)
+    print(f"moves: {results.pop('rows')}")
+    baseline = results['window functions']
+    print(f"{'columns':<20}{'seconds':>10}{'speedup':>10}{'peak MB':>10}")
+    for name, result in results.items():
+        print(f"{name:<20}{result['seconds']:>10.2f}{baseline['seconds'] / result['seconds']:>9.2f}x{result['peak_mb']:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Times the starting moves of the Openings tab from the opening_tree mart and from the queries it replaced
+
+Reads the warehouse of a player built by bench_pipeline, e.g. with every game distinct (`--pool`
+as large as the games), the worst case for the tree as no two games share a deep prefix. For each
+depth and date range of the Openings tab, the starting moves with their results are counted from:
+- opening_tree: the mart, nodes per player, time class, color, UTC date and result
+- opening_tree without dates: the same nodes summed over the dates, which only answers the full range
+- games: the first moves sliced from the move list of every game, the query before the mart
+- prep_game_moves: the first moves of every game aggregated from its rows of moves
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.bench_pipeline --months 24 --games-per-month 500 --pool 12000
+    PYTHONPATH=src python -m benchmarks.bench_opening_tree --depths 1 5 10 15
+"""
+
+import argparse
+import statistics
+import time
+from datetime import timedelta
+from typing import Dict, List
+
+import duckdb
+
+from chess_pipeline import warehouse_path
+
+# The player of bench_pipeline
+USERNAME = 'bench_player'
+
+FILTER = """
+    player_username = $username
+    and time_class = $time_class
+    and list_contains($player_color, player_color)
+    and game_start_date between $date_min::date and $date_max::date
+"""
+
+# The counts of get_starting_moves in queries.py, from the nodes of `tree` at the depth
+STARTING_MOVES = """
+    select
+        player_color
+        , player_wdl
+        , opening_prefix as starting_moves
+        , sum(num_games)::bigint as wdl_num_games
+        , sum(sum(num_games)) over(partition by player_color, starting_moves)::bigint as num_games
+    from {tree}
+    where depth = $move_num and {filter}
+    group by player_color, player_wdl, starting_moves
+"""
+
+QUERIES = {
+    'opening_tree': STARTING_MOVES.format(tree='main.opening_tree', filter=FILTER),
+    'opening_tree without dates': STARTING_MOVES.format(
+        tree='tree_without_dates', filter=FILTER.split('and game_start_date')[0]
+    ),
+    'games': f"""
+        select
+            player_color
+            , player_wdl
+            , list_reduce(pgn_move_extract[1:$move_num], (s, x) -> s || ' ' || x) as starting_moves
+            , count(1) as wdl_num_games
+            , sum(count(1)) over(partition by player_color, starting_moves) as num_games
+        from main.games
+        where {FILTER}
+        group by player_color, player_wdl, starting_moves
+    """,
+    'prep_game_moves': f"""
+        with starts as (
+            select
+                moves.game_uuid
+                -- the moves as in pgn_move_extract, e.g. "1. e4 1... e5"
+                , string_agg(
+                    moves.color_move_index || if(moves.color_move = 'White', '. ', '... ') || moves.game_move, ' '
+                    order by moves.game_move_index
+                ) as starting_moves
+            from main.prep_game_moves as moves
+            where moves.game_move_index <= $move_num
+                and moves.player_username = $username
+            group by moves.game_uuid
+        )
+        select
+            games.player_color
+            , games.player_wdl
+            , starts.starting_moves
+            , count(1) as wdl_num_games
+            , sum(count(1)) over(partition by games.player_color, starts.starting_moves) as num_games
+        from main.games as games
+        inner join starts on games.game_uuid = starts.game_uuid
+        where {FILTER.replace('player_username', 'games.player_username')}
+        group by games.player_color, games.player_wdl, starts.starting_moves
+    """,
+}
+
+TREE_WITHOUT_DATES = """
+    create temp table tree_without_dates as
+    select
+        player_username, time_class, player_color, depth, opening_prefix, player_wdl
+        , sum(num_games) as num_games
+    from main.opening_tree
+    group by all
+    order by player_username, depth, opening_prefix
+"""
+
+
+def run(username: str, depths: List[int], repeat: int) -> Dict[str, Dict[str, float]]:
+    conn = duckdb.connect(warehouse_path(username), read_only=True)
+    conn.execute(TREE_WITHOUT_DATES)
+    print('rows: ' + ', '.join(
+        f"{table} {conn.sql(f'select count(*) from {table}').fetchone()[0]}"
+        for table in ('main.games', 'main.prep_game_moves', 'main.opening_tree', 'tree_without_dates')
+    ))
+
+    time_class, date_min, date_max = conn.sql("""
+        select time_class, min(game_start_date), max(game_start_date)
+        from main.games group by time_class order by count(*) desc limit 1
+    """).fetchone()
+    date_ranges = {'all dates': (date_min, date_max), 'last 30 days': (date_max - timedelta(days=29), date_max)}
+
+    results = {}
+    for range_name, (start, end) in date_ranges.items():
+        for depth in depths:
+            params = {
+                'username': username, 'time_class': time_class, 'player_color': ['White', 'Black'],
+                'date_min': str(start), 'date_max': str(end), 'move_num': depth,
+            }
+            counts = {}
+            for name, query in QUERIES.items():
+                if name == 'opening_tree without dates' and range_name != 'all dates':
+                    continue
+                query_params = {key: value for key, value in params.items() if f'${key}' in query}
+                seconds = []
+                for _ in range(repeat + 1):
+                    start_time = time.perf_counter()
+                    df = conn.execute(query, query_params).df()
+                    seconds.append(time.perf_counter() - start_time)
+                counts[name] = sorted(map(tuple, df[['player_color', 'player_wdl', 'starting_moves', 'wdl_num_games']].values.tolist()))
+                results[f'{range_name}, depth {depth}, {name}'] = {
+                    'median': statistics.median(seconds[1:]) if repeat else seconds[0], 'nodes': len(df),
+                }
+            if len({str(count) for count in counts.values()}) != 1:
+                raise AssertionError(f'The starting moves of depth {depth} over {range_name} differ between the queries')
+    conn.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--username', default=USERNAME, help='player of the warehouse, built by bench_pipeline')
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 5, 10, 15], help='plies of the Openings slider')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs of each query after the first')
+    args = parser.parse_args()
+
+    print(f"{'query':<60}{'median ms':>10}{'rows':>8}")
+    for name, result in run(args.username, args.depths, args.repeat).items():
+        print(f"{name:<60}{result['median'] * 1000:>10.1f}{result['nodes']:>8}")
+
+
+if __name__ == '__main__':
+    main()
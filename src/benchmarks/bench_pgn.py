@@ -0,0 +1,96 @@
+"""Compares the PGN extraction of prep_player_games with the per-column regexes it replaced
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.bench_pgn --games 100000
+"""
+
+import argparse
+import time
+
+import duckdb
+
+from .synthetic import generate_games
+
+# The PGN header block, movetext, moves, clocks, joined moves and header tags of each game
+QUERIES = {
+    "regex per column": r"""
+        select
+            regexp_split_to_array(pgn, '\n\n')[1] as pgn_header
+            , regexp_split_to_array(pgn, '\n\n')[2] as pgn_moves
+            , regexp_extract_all(pgn_moves, '\d+\.+ [\S]+') as pgn_move_extract
+            , regexp_extract_all(pgn_moves, '{\[%clk \S+\]}') as pgn_clock_extract
+            , if(
+                len(pgn_move_extract) > 0
+                , list_reduce(pgn_move_extract, (s, x) -> s || ' ' || x)
+                , ''
+            ) as pgn_move_extract_string
+            , regexp_extract(pgn, '(ECO )"(.*)"', 2) as eco
+            , regexp_extract(pgn, '(ECOUrl )"(.*)"', 2) as eco_url
+            , regexp_extract(pgn, '(UTCDate )"(.*)"', 2) as utc_date
+            , regexp_extract(pgn, '(StartTime )"(.*)"', 2) as game_start_time
+        from games
+    """,
+    "sections split once": r"""
+        with pgn_sections as (
+            select string_split(pgn, E'\n\n') as pgn_sections
+            from games
+        )
+        select
+            pgn_sections[1] as pgn_header
+            , pgn_sections[2] as pgn_moves
+            , regexp_extract_all(pgn_moves, '\d+\.+ [\S]+') as pgn_move_extract
+            , regexp_extract_all(pgn_moves, '{\[%clk \S+\]}') as pgn_clock_extract
+            , if(
+                len(pgn_move_extract) > 0
+                , array_to_string(pgn_move_extract, ' ')
+                , ''
+            ) as pgn_move_extract_string
+            , regexp_extract(pgn_header, '(ECO )"(.*)"', 2) as eco
+            , regexp_extract(pgn_header, '(ECOUrl )"(.*)"', 2) as eco_url
+            , regexp_extract(pgn_header, '(UTCDate )"(.*)"', 2) as utc_date
+            , regexp_extract(pgn_header, '(StartTime )"(.*)"', 2) as game_start_time
+        from pgn_sections
+    """,
+}
+
+
+def run(num_games: int, pool_size: int, repeat: int) -> dict:
+    # the cost of reading a PGN does not depend on it being unique, so the corpus repeats a pool
+    pool = [game['pgn'] for game in generate_games(min(pool_size, num_games))]
+    pgns = [pool[i % len(pool)] for i in range(num_games)]
+
+    conn = duckdb.connect()
+    conn.execute("create table games as select unnest($pgns) as pgn", {'pgns': pgns})
+    results = {}
+    for i, (name, query) in enumerate(QUERIES.items()):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            # materialized, as the model stores the extracted lists
+            conn.execute(f"create or replace table result_{i} as {query}")
+            timings.append(time.perf_counter() - start)
+        results[name] = min(timings)
+
+    mismatches = conn.sql("select count(*) from (select * from result_0 except all select * from result_1)").fetchone()[0]
+    if mismatches:
+        raise AssertionError(f"{mismatches} games are extracted differently")
+    conn.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100_000, help='number of games in the corpus')
+    parser.add_argument('--pool', type=int, default=1000, help='distinct synthetic games the corpus is drawn from')
+    parser.add_argument('--repeat', type=int, default=3, help='best-of-N timing')
+    args = parser.parse_args()
+
+    results = run(args.games, args.pool, args.repeat)
+    baseline = results['regex per column']
+    print(f"{'extraction':<24}{'seconds':>10}{'speedup':>10}")
+    for name, seconds in results.items():
+        print(f"{name:<24}{seconds:>10.3f}{baseline / seconds:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Times a full refresh of a synthetic player end to end and writes the results to a JSON file
+
+Serves `--months` synthetic monthly archives from the local stub API, then times each stage:
+the `players_games` extract, the dlt normalize and load, the dbt parse and every dbt node of the
+build, and the latency of each dashboard query over the built warehouse. Run it from the root of
+the repository, dbt is pointed at `src/chess_dbt` as in chess_pipeline.py.
+
+The player gets a fresh warehouse, `data/players/bench_player/chess.duckdb`, and fresh dlt state
+on every run. A results file is written per run so regressions can be tracked across commits.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.bench_pipeline --months 12 --games-per-month 500
+    PYTHONPATH=src python -m benchmarks.bench_pipeline --arrow --output bench.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict
+
+import chess
+import dbt.version
+import dlt
+import duckdb
+import streamlit as st
+
+import queries
+from chess_pipeline import WAREHOUSE_LAYOUT, build_models, load_players, warehouse_path
+
+from .stub_api import StubChessApi
+
+USERNAME = 'bench_player'
+RESULTS_FOLDER = 'data/benchmarks'
+
+# Tables counted after the build
+ROW_COUNTS = {
+    'players_games': 'chess_data_raw.players_games',
+    'stg_player_games': 'main.stg_player_games',
+    'prep_player_games': 'main.prep_player_games',
+    'prep_game_moves': 'main.prep_game_moves',
+    'games': 'main.games',
+}
+
+
+def dashboard_queries(username: str, mtime: float) -> Dict[str, Callable[[], Any]]:
+    """The queries of a first load of the dashboard, with its default filters, uncached"""
+    time_classes = queries.get_distinct_values.__wrapped__(username, mtime, 'time_class')
+    time_class = 'blitz' if 'blitz' in time_classes else time_classes[0]
+    player_color = ('White', 'Black')
+    date_min, date_max = (str(ts)[:10] for ts in queries.get_date_range.__wrapped__(username, mtime, time_class, player_color))
+    filters = queries.Filters(time_class, player_color, date_min, date_max)
+    start_position = queries.position_hash(chess.Board())
+    move_num = 5
+    return {
+        'get_distinct_values': lambda: queries.get_distinct_values.__wrapped__(username, mtime, 'time_class'),
+        'get_date_range': lambda: queries.get_date_range.__wrapped__(username, mtime, time_class, player_color),
+        'get_summary': lambda: queries.get_summary.__wrapped__(username, mtime, filters),
+        'get_daily_games': lambda: queries.get_daily_games.__wrapped__(username, mtime, filters),
+        'get_wdl': lambda: queries.get_wdl.__wrapped__(username, mtime, filters),
+        'get_wdl_reason': lambda: queries.get_wdl_reason.__wrapped__(username, mtime, filters),
+        'get_dow_hour': lambda: queries.get_dow_hour.__wrapped__(username, mtime, filters, 'UTC'),
+        'get_dow_hour_heatmap': lambda: queries.get_dow_hour_heatmap.__wrapped__(username, mtime, filters, 'UTC'),
+        'get_checkmate_pieces': lambda: queries.get_checkmate_pieces.__wrapped__(username, mtime, filters),
+        'get_game_phase': lambda: queries.get_game_phase.__wrapped__(username, mtime, filters),
+        'get_starting_moves': lambda: queries.get_starting_moves.__wrapped__(username, mtime, filters, move_num),
+        'get_top_openings': lambda: queries.get_top_openings.__wrapped__(username, mtime, filters, move_num, 'White', 'win'),
+        'get_latest_games': lambda: queries.get_latest_games.__wrapped__(username, mtime, filters),
+        'get_position_wdl': lambda: queries.get_position_wdl.__wrapped__(username, mtime, filters, start_position),
+        'get_position_games': lambda: queries.get_position_games.__wrapped__(username, mtime, filters, start_position),
+    }
+
+
+def time_queries(username: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Seconds of the first call of each dashboard query and the median of `repeat` more"""
+    # outside of `streamlit run` the caches warn on every call
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    results = {}
+    for name, query in dashboard_queries(username, queries.user_data_mtime(username)).items():
+        seconds = []
+        for _ in range(repeat + 1):
+            # some queries are built on another cached query, e.g. the heatmap on the day/hour counts
+            st.cache_data.clear()
+            start = time.perf_counter()
+            query()
+            seconds.append(time.perf_counter() - start)
+        results[name] = {'first': seconds[0], 'median': statistics.median(seconds[1:]) if repeat else seconds[0]}
+    return results
+
+
+def node_timings(res: Any) -> Dict[str, Dict[str, Any]]:
+    """Seconds and status of every node of a `dbt build`, from its `dbtRunnerResult`"""
+    return {
+        result.node.name: {
+            'resource_type': str(result.node.resource_type),
+            'status': str(result.status),
+            'seconds': result.execution_time,
+        }
+        for result in res.result.results
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(months: int, games_per_month: int, arrow: bool, repeat: int, pool: int) -> Dict[str, Any]:
+    db_path = warehouse_path(USERNAME)
+    shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+    for table in queries.USER_TABLES.values():
+        if os.path.exists(queries.user_data_path(USERNAME, table)):
+            os.remove(queries.user_data_path(USERNAME, table))
+
+    with tempfile.TemporaryDirectory() as tmp, StubChessApi(months, games_per_month, pool_size=pool) as api:
+        # fresh dlt state, and a full parse of the dbt project in its own target folder
+        os.environ['DLT_DATA_DIR'] = os.path.join(tmp, 'dlt')
+        os.environ['DBT_TARGET_PATH'] = os.path.join(tmp, 'target')
+        os.environ['DBT_LOG_PATH'] = os.path.join(tmp, 'logs')
+
+        stages: Dict[str, float] = {}
+        load_players([USERNAME], db_path, stages, api_url=api.api_url, requests_per_second=0, arrow=arrow)
+        res = build_models([USERNAME], stages, db_path)
+        if not res.success:
+            raise SystemExit(f"dbt build failed: {res.exception or 'see the dbt logs'}")
+
+    with duckdb.connect(db_path, read_only=True) as conn:
+        rows = {name: conn.sql(f"select count(*) from {table}").fetchone()[0] for name, table in ROW_COUNTS.items()}
+    if queries.DATA_SOURCE == 'parquet':
+        with duckdb.connect(db_path) as conn:
+            start = time.perf_counter()
+            queries.export_user_data(conn, USERNAME)
+            stages['parquet_export'] = time.perf_counter() - start
+
+    return {
+        'stages': stages,
+        'dbt_nodes': node_timings(res),
+        'dashboard_queries': time_queries(USERNAME, repeat),
+        'rows': rows,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--months', type=int, default=12, help='monthly archives served by the stub')
+    parser.add_argument('--games-per-month', type=int, default=500)
+    parser.add_argument('--pool', type=int, default=200, help='distinct synthetic games the archives are drawn from')
+    parser.add_argument('--arrow', action='store_true', help='load the games as Arrow tables, skipping pydantic')
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls of each dashboard query after the first')
+    parser.add_argument('--output', help=f'results file, defaults to a new file in {RESULTS_FOLDER}')
+    args = parser.parse_args()
+    if WAREHOUSE_LAYOUT != 'sharded':
+        # the single layout would rebuild the shared data/chess.duckdb
+        parser.error('run with CHESS_WAREHOUSE_LAYOUT=sharded')
+
+    started_at = datetime.now(timezone.utc)
+    results = run(args.months, args.games_per_month, args.arrow, args.repeat, args.pool)
+    report = {
+        'started_at': started_at.isoformat(),
+        'commit': git_commit(),
+        'params': {
+            'months': args.months,
+            'games_per_month': args.games_per_month,
+            'pool': args.pool,
+            'arrow': args.arrow,
+            'repeat': args.repeat,
+            'data_source': queries.DATA_SOURCE,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'duckdb': duckdb.__version__,
+            'dlt': dlt.__version__,
+            'dbt': dbt.version.__version__,
+        },
+        **results,
+    }
+
+    output = args.output or os.path.join(RESULTS_FOLDER, f"pipeline_{started_at:%Y%m%dT%H%M%SZ}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'stage':<40}{'seconds':>10}")
+    for stage, seconds in results['stages'].items():
+        print(f"{stage:<40}{seconds:>10.2f}")
+    for name, node in results['dbt_nodes'].items():
+        if node['resource_type'] == 'model':
+            print(f"{'  ' + name:<40}{node['seconds']:>10.2f}")
+    print(f"{'dashboard query':<40}{'first ms':>10}{'median ms':>10}")
+    for name, seconds in results['dashboard_queries'].items():
+        print(f"{name:<40}{seconds['first'] * 1000:>10.1f}{seconds['median'] * 1000:>10.1f}")
+    print(f"rows: {results['rows']}")
+    print(f"results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Compares the native (row-at-a-time) and arrow (vectorized) UDF registrations
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.bench_udfs --games 2000 --workers 4
+"""
+
+import argparse
+import time
+
+import duckdb
+import pandas as pd
+
+from my_custom_functions import register_udfs
+from replay import ReplayEngine
+
+from .synthetic import generate_games
+
+QUERIES = {
+    "pgn_to_fens_udf": """
+        select sum(len(pgn_to_fens_udf(pgn)))
+        from games
+    """,
+    "tcn_to_fens_udf": """
+        select sum(len(tcn_to_fens_udf(tcn, initial_setup)))
+        from games
+    """,
+    "tcn_to_moves_udf": """
+        select sum(len(tcn_to_moves_udf(tcn, initial_setup)))
+        from games
+    """,
+    "get_checkmate_pieces_udf": """
+        select sum(len(get_checkmate_pieces_udf(fen, player_color, player_result, opponent_result)))
+        from games
+    """,
+}
+
+
+def build_corpus(num_games: int) -> pd.DataFrame:
+    rows = []
+    for game in generate_games(num_games):
+        player_color = 'White' if game['white']['username'] == 'synthetic_player' else 'Black'
+        player, opponent = (game['white'], game['black']) if player_color == 'White' else (game['black'], game['white'])
+        rows.append({
+            'game_uuid': game['uuid'],
+            'pgn': game['pgn'],
+            'tcn': game['tcn'],
+            'initial_setup': game['initial_setup'],
+            'fen': game['fen'],
+            'player_color': player_color,
+            'player_result': player['result'],
+            'opponent_result': opponent['result'],
+        })
+    return pd.DataFrame(rows)
+
+
+def run(num_games: int, repeat: int, workers: int) -> dict:
+    games = build_corpus(num_games)
+    modes = {'native': ('native', None), 'arrow': ('arrow', None)}
+    if workers != 1:
+        modes[f'arrow x{workers or "all"}'] = ('arrow', ReplayEngine(workers=workers))
+
+    results = {}
+    for mode, (udf_type, engine) in modes.items():
+        conn = duckdb.connect()
+        register_udfs(conn, udf_type, engine)
+        conn.register('games', games)
+        for name, query in QUERIES.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.sql(query).fetchall()
+                timings.append(time.perf_counter() - start)
+            results.setdefault(mode, {})[name] = min(timings)
+        conn.close()
+        if engine:
+            engine.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=2000, help='number of synthetic games')
+    parser.add_argument('--repeat', type=int, default=3, help='best-of-N timing')
+    parser.add_argument('--workers', type=int, default=1, help='replay workers for an extra arrow run, 0 uses all cores')
+    args = parser.parse_args()
+
+    results = run(args.games, args.repeat, args.workers)
+    print(f"{'function':<28}" + ''.join(f"{mode + ' (s)':>16}" for mode in results))
+    for name in QUERIES:
+        native = results['native'][name]
+        cells = [f"{timings[name]:.3f} {native / timings[name]:.1f}x" for timings in results.values()]
+        print(f"{name:<28}" + ''.join(f"{cell:>16}" for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Local stub of the chess.com public API serving synthetic monthly archives"""
+
+import json
+import multiprocessing
+import re
+import threading
+import time
+import urllib.request
+import uuid
+import zlib
+from collections import Counter
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from .synthetic import generate_games
+
+_ARCHIVES_RE = re.compile(r"^/pub/player/([^/]+)/games/archives$")
+_ARCHIVE_RE = re.compile(r"^/pub/player/([^/]+)/games/(\d{4})/(\d{2})$")
+_DATE_HEADER_RE = re.compile(r'\[(Date|UTCDate|EndDate) "([^"]*)"\]')
+
+
+def _move_to_day(pgn: str, day: date) -> str:
+    """Dates the PGN of a pool game on `day`, a game ending after midnight still ends the next day"""
+    dates = dict(_DATE_HEADER_RE.findall(pgn))
+    played = datetime.strptime(dates["Date"], "%Y.%m.%d").date()
+    days = {key: day + (datetime.strptime(value, "%Y.%m.%d").date() - played) for key, value in dates.items()}
+    return _DATE_HEADER_RE.sub(lambda match: f'[{match.group(1)} "{days[match.group(1)]:%Y.%m.%d}"]', pgn)
+
+
+class StubChessApi:
+    """
+    Serves `months` monthly archives of `games_per_month` synthetic games for any username.
+    Games are drawn from a pool generated once, each month from its own share of it, with fresh
+    uuids and dates in the month, so large histories are cheap to serve. Use as a context manager, `api_url` is then the base url
+    to pass to the `chess` source. The server runs in its own process so it neither competes
+    for the GIL nor shows up in the memory of the process being measured.
+    Args:
+        months (int): Number of monthly archives, ending at `last_month` ("YYYY/MM").
+        games_per_month (int): Games in each archive.
+        latency (float): Seconds to sleep before answering each request.
+        max_requests_per_second (float, optional): Requests above this rate get a 429 with `Retry-After`.
+        error_statuses (List[int], optional): Statuses answered, in order, to the next requests, e.g. `[503, 500]`
+            to fail the next two requests.
+    Archives carry an `ETag` and answer 304 to a matching `If-None-Match`. Raise `games_per_month`
+    with `update()` while serving to simulate new games in the open month.
+    """
+
+    def __init__(
+        self,
+        months: int = 12,
+        games_per_month: int = 50,
+        latency: float = 0.0,
+        max_requests_per_second: Optional[float] = None,
+        last_month: str = "2024/12",
+        pool_size: int = 200,
+        error_statuses: Optional[List[int]] = None,
+    ) -> None:
+        self.months = months
+        self.games_per_month = games_per_month
+        self.latency = latency
+        self.max_requests_per_second = max_requests_per_second
+        self.last_month = last_month
+        self.pool_size = pool_size
+        self.error_statuses = list(error_statuses or [])
+        self.stats: Counter = Counter()
+        self._pools: Dict[str, List[Dict[str, Any]]] = {}
+        self._window: List[float] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._process: Optional[multiprocessing.Process] = None
+        self._address: Optional[tuple] = None
+
+    @property
+    def api_url(self) -> str:
+        host, port = self._address
+        return f"http://{host}:{port}/pub/"
+
+    def _control(self, path: str, settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        host, port = self._address
+        data = json.dumps(settings).encode() if settings is not None else None
+        with urllib.request.urlopen(f"http://{host}:{port}{path}", data=data) as r:
+            return json.loads(r.read())
+
+    def get_stats(self) -> Counter:
+        """Request counters of the server process: requests, archives, not_modified, throttled, errors"""
+        return Counter(self._control("/__stats"))
+
+    def update(self, **settings: Any) -> None:
+        """Changes settings such as `games_per_month` or `error_statuses` of the running server"""
+        self._control("/__settings", settings)
+
+    def month_list(self) -> List[str]:
+        year, month = (int(part) for part in self.last_month.split("/"))
+        result = []
+        for _ in range(self.months):
+            result.append(f"{year:04d}/{month:02d}")
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        return result[::-1]
+
+    def archive(self, username: str, month: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            if username not in self._pools:
+                self._pools[username] = list(generate_games(self.pool_size, username=username))
+            pool = self._pools[username]
+
+        year, mon = (int(part) for part in month.split("/"))
+        # each month starts at its own share of the pool, a pool as large as every game served
+        # gives distinct games
+        offset = self.month_list().index(month) * max(1, len(pool) // self.months)
+        games = []
+        for i in range(self.games_per_month):
+            game = dict(pool[(offset + i) % len(pool)])
+            game_id = f"{username}-{month}-{i}"
+            day = date(year, mon, 1 + i % 28)
+            game["uuid"] = str(uuid.uuid5(uuid.NAMESPACE_URL, game_id))
+            game["url"] = f"https://www.chess.com/game/live/{zlib.crc32(game_id.encode())}"
+            game["end_time"] = int(time.mktime((year, mon, day.day, 12, 0, 0, 0, 0, 0)))
+            game["pgn"] = _move_to_day(game["pgn"], day)
+            games.append(game)
+        return games
+
+    def _next_error(self) -> Optional[int]:
+        with self._lock:
+            return self.error_statuses.pop(0) if self.error_statuses else None
+
+    def _throttled(self) -> bool:
+        if not self.max_requests_per_second:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.max_requests_per_second:
+                return True
+            self._window.append(now)
+            return False
+
+    def _handler(self) -> type:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _send(self, status: int, body: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None) -> None:
+                payload = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if status != 304:
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self) -> None:
+                if self.path == "/__settings":
+                    settings = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                    for key, value in settings.items():
+                        setattr(api, key, value)
+                    self._send(200, settings)
+                    return
+                self._send(404, {"message": "Not Found"})
+
+            def do_GET(self) -> None:
+                if self.path == "/__stats":
+                    self._send(200, dict(api.stats))
+                    return
+
+                api.stats["requests"] += 1
+                if api.latency:
+                    time.sleep(api.latency)
+                status = api._next_error()
+                if status is not None:
+                    api.stats["errors"] += 1
+                    self._send(status, {"message": "Injected error"})
+                    return
+                if api._throttled():
+                    api.stats["throttled"] += 1
+                    self._send(429, {"message": "Too Many Requests"}, {"Retry-After": "1"})
+                    return
+
+                match = _ARCHIVES_RE.match(self.path)
+                if match:
+                    base = api.api_url
+                    archives = [f"{base}player/{match.group(1)}/games/{month}" for month in api.month_list()]
+                    self._send(200, {"archives": archives})
+                    return
+
+                match = _ARCHIVE_RE.match(self.path)
+                if match and f"{match.group(2)}/{match.group(3)}" in api.month_list():
+                    body = {"games": api.archive(match.group(1), f"{match.group(2)}/{match.group(3)}")}
+                    etag = f'"{zlib.crc32(json.dumps(body).encode()):08x}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        api.stats["not_modified"] += 1
+                        self._send(304, headers={"ETag": etag})
+                        return
+                    api.stats["archives"] += 1
+                    self._send(200, body, {"ETag": etag})
+                    return
+
+                self._send(404, {"message": "Not Found"})
+
+        return Handler
+
+    def _serve(self, address_queue: Any) -> None:
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._address = self._server.server_address[:2]
+        address_queue.put(self._address)
+        self._server.serve_forever()
+
+    def __enter__(self) -> "StubChessApi":
+        context = multiprocessing.get_context("fork")
+        address_queue = context.Queue()
+        self._process = context.Process(target=self._serve, args=(address_queue,), daemon=True)
+        self._process.start()
+        self._address = address_queue.get(timeout=30)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._process.terminate()
+        self._process.join()
@@ -0,0 +1,189 @@
+"""Synthetic chess.com-shaped games for benchmarks"""
+
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+import chess
+
+from tcn import encode_tcn
+
+STARTING_FEN = chess.STARTING_FEN
+
+TIME_CONTROLS = {
+    "bullet": [(60, 0), (60, 1), (120, 1)],
+    "blitz": [(180, 0), (180, 2), (300, 0), (300, 5)],
+    "rapid": [(600, 0), (600, 5), (900, 10)],
+}
+
+OPENINGS = [
+    ("C50", "Italian-Game"),
+    ("B20", "Sicilian-Defense"),
+    ("C00", "French-Defense"),
+    ("D00", "Queens-Pawn-Opening"),
+    ("A00", "Van-Geet-Opening"),
+    ("B01", "Scandinavian-Defense"),
+]
+
+
+def _format_clock(seconds: float) -> str:
+    seconds = max(seconds, 0.0)
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    if secs == int(secs):
+        return f"{int(hours)}:{int(minutes):02d}:{int(secs):02d}"
+    return f"{int(hours)}:{int(minutes):02d}:{secs:04.1f}"
+
+
+def _play_random_game(rng: random.Random, max_plies: int) -> List[chess.Move]:
+    board = chess.Board()
+    moves = []
+    for _ in range(max_plies):
+        legal = list(board.legal_moves)
+        if not legal:
+            break
+
+        # Prefer mates and promotions so they show up in the corpus
+        move = None
+        for candidate in legal:
+            board.push(candidate)
+            is_mate = board.is_checkmate()
+            board.pop()
+            if is_mate:
+                move = candidate
+                break
+        if move is None:
+            promotions = [m for m in legal if m.promotion]
+            move = rng.choice(promotions) if promotions else rng.choice(legal)
+
+        board.push(move)
+        moves.append(move)
+        if board.is_game_over(claim_draw=False):
+            break
+    return moves
+
+
+def _results(board: chess.Board, rng: random.Random) -> tuple:
+    if board.is_checkmate():
+        # side to move is checkmated
+        return ("checkmated", "win") if board.turn == chess.WHITE else ("win", "checkmated")
+    if board.is_stalemate():
+        return "stalemate", "stalemate"
+    if board.is_insufficient_material():
+        return "insufficient", "insufficient"
+    loser_reason = rng.choice(["resigned", "timeout", "abandoned"])
+    if rng.random() < 0.1:
+        return "agreed", "agreed"
+    return (loser_reason, "win") if rng.random() < 0.5 else ("win", loser_reason)
+
+
+def generate_game(
+    rng: random.Random,
+    username: str = "synthetic_player",
+    game_id: int = 0,
+    start: Optional[datetime] = None,
+    max_plies: int = 120,
+) -> Dict[str, Any]:
+    """Generates a single game dict in the chess.com archive format"""
+    time_class = rng.choice(list(TIME_CONTROLS))
+    base, increment = rng.choice(TIME_CONTROLS[time_class])
+    time_control = f"{base}+{increment}" if increment else str(base)
+    eco, eco_name = rng.choice(OPENINGS)
+
+    opponent = f"opponent_{rng.randint(1, 500)}"
+    if rng.random() < 0.5:
+        white, black = username, opponent
+    else:
+        white, black = opponent, username
+
+    moves = _play_random_game(rng, rng.randint(10, max_plies))
+    board = chess.Board()
+    clocks = [float(base), float(base)]
+    tokens = []
+    for ply, move in enumerate(moves):
+        san = board.san(move)
+        board.push(move)
+        side = ply % 2
+        clocks[side] = clocks[side] - rng.uniform(0.1, base / 40) + increment
+        clock = _format_clock(round(clocks[side], 1))
+        number = ply // 2 + 1
+        prefix = f"{number}." if side == 0 else f"{number}..."
+        tokens.append(f"{prefix} {san} {{[%clk {clock}]}}")
+
+    white_result, black_result = _results(board, rng)
+    if white_result == "win":
+        result = "1-0"
+    elif black_result == "win":
+        result = "0-1"
+    else:
+        result = "1/2-1/2"
+
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+    end = start + timedelta(seconds=sum(rng.uniform(1, base / 40) for _ in moves) + 1)
+    white_rating, black_rating = rng.randint(800, 2400), rng.randint(800, 2400)
+
+    headers = [
+        ("Event", "Live Chess"),
+        ("Site", "Chess.com"),
+        ("Date", start.strftime("%Y.%m.%d")),
+        ("Round", "-"),
+        ("White", white),
+        ("Black", black),
+        ("Result", result),
+        ("CurrentPosition", board.fen()),
+        ("Timezone", "UTC"),
+        ("ECO", eco),
+        ("ECOUrl", f"https://www.chess.com/openings/{eco_name}"),
+        ("UTCDate", start.strftime("%Y.%m.%d")),
+        ("UTCTime", start.strftime("%H:%M:%S")),
+        ("WhiteElo", str(white_rating)),
+        ("BlackElo", str(black_rating)),
+        ("TimeControl", time_control),
+        ("Termination", f"{white if result == '1-0' else black} won"),
+        ("StartTime", start.strftime("%H:%M:%S")),
+        ("EndDate", end.strftime("%Y.%m.%d")),
+        ("EndTime", end.strftime("%H:%M:%S")),
+        ("Link", f"https://www.chess.com/game/live/{game_id}"),
+    ]
+    header = "\n".join(f'[{key} "{value}"]' for key, value in headers)
+    pgn = f"{header}\n\n{' '.join(tokens + [result])}\n"
+
+    def _player(name: str, rating: int, result: str) -> Dict[str, Any]:
+        return {
+            "rating": rating,
+            "result": result,
+            "@id": f"https://api.chess.com/pub/player/{name.lower()}",
+            "username": name,
+            "uuid": str(uuid.UUID(int=rng.getrandbits(128))),
+        }
+
+    return {
+        "url": f"https://www.chess.com/game/live/{game_id}",
+        "pgn": pgn,
+        "time_control": time_control,
+        "end_time": int(end.timestamp()),
+        "rated": True,
+        "accuracies": {"white": round(rng.uniform(40, 99), 2), "black": round(rng.uniform(40, 99), 2)},
+        "tcn": encode_tcn(moves),
+        "uuid": str(uuid.UUID(int=rng.getrandbits(128))),
+        "initial_setup": STARTING_FEN,
+        "fen": board.fen(),
+        "time_class": time_class,
+        "rules": "chess",
+        "white": _player(white, white_rating, white_result),
+        "black": _player(black, black_rating, black_result),
+    }
+
+
+def generate_games(
+    num_games: int,
+    username: str = "synthetic_player",
+    seed: int = 42,
+    start: Optional[datetime] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yields `num_games` reproducible synthetic games spread an hour apart"""
+    rng = random.Random(seed)
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(num_games):
+        yield generate_game(rng, username=username, game_id=seed * 10_000_000 + i, start=start + timedelta(hours=i))
@@ -0,0 +1,75 @@
+"""
+Minimal PGN movetext reader for the replay hot path.
+
+`chess.pgn.read_game` builds a full GameNode tree (headers, comments, clock annotations,
+variations) through its visitor machinery. The UDFs only ever walk the mainline, so this
+module strips comments and move numbers and pushes the SAN tokens straight onto a `Board`.
+"""
+
+import re
+from typing import Iterator
+
+import chess
+
+# Comments (`{[%clk 0:02:59.9]}`), rest-of-line comments and variations
+_COMMENT_RE = re.compile(r"\{[^}]*\}|;[^\n]*|\([^()]*\)")
+# Move numbers glued to the SAN token, e.g. `1.e4` or `12...Nf6`
+_MOVE_NUMBER_RE = re.compile(r"^\d+\.+")
+_HEADER_RE = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+_RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+
+
+def split_pgn(pgn: str) -> tuple:
+    """Splits a PGN into its header tag pairs (as a dict) and the movetext"""
+    headers = {}
+    lines = pgn.lstrip().splitlines()
+    i = 0
+    while i < len(lines) and lines[i].startswith("["):
+        match = _HEADER_RE.match(lines[i])
+        if match:
+            headers[match.group(1)] = match.group(2)
+        i += 1
+    return headers, "\n".join(lines[i:])
+
+
+def iter_sans(movetext: str) -> Iterator[str]:
+    """Yields the SAN tokens of the mainline, skipping comments, move numbers, NAGs and results"""
+    for token in _COMMENT_RE.sub(" ", movetext).split():
+        token = _MOVE_NUMBER_RE.sub("", token)
+        if not token or token in _RESULTS or token.startswith("$"):
+            continue
+        token = token.rstrip("!?")
+        if token:
+            yield token
+
+
+def starting_board(headers: dict) -> chess.Board:
+    """Returns the starting position declared by the `FEN`/`Variant` headers"""
+    chess960 = "960" in headers.get("Variant", "")
+    fen = headers.get("FEN")
+    if fen:
+        return chess.Board(fen, chess960=chess960)
+    return chess.Board(chess960=chess960)
+
+
+def push_movetext(board: chess.Board, movetext: str) -> Iterator[chess.Move]:
+    """
+    Pushes every mainline move of `movetext` onto `board`, yielding each move after it is pushed.
+    Like `read_game`, the replay stops at the first illegal or unparsable move.
+    """
+    for san in iter_sans(movetext):
+        try:
+            move = board.parse_san(san)
+        except ValueError:
+            return
+        board.push(move)
+        yield move
+
+
+def pgn_to_board(pgn: str) -> chess.Board:
+    """Returns the board after the last mainline move of a PGN or a bare movetext such as "1. e4 1... e5" """
+    headers, movetext = split_pgn(pgn)
+    board = starting_board(headers)
+    for _ in push_movetext(board, movetext):
+        pass
+    return board
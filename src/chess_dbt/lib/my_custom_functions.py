@@ -1,38 +1,167 @@
+from functools import reduce, wraps
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
 from duckdb import DuckDBPyConnection
+from duckdb.typing import VARCHAR
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 
 from dbt.adapters.duckdb.plugins import BasePlugin
 from dbt.adapters.duckdb.utils import TargetConfig
 
 import chess.pgn
+import chess.polyglot
 from io import StringIO
 import chess
 
-from collections import Counter
-import re
+from movetext import push_movetext, split_pgn, starting_board
+from replay import ReplayEngine
+from tcn import push_tcn
+
+# Reports the number of games replayed into moves by each call, e.g. for the progress of a refresh
+replay_logger = logging.getLogger('chess_dbt.replay')
+
+def _log_replayed(games: int) -> None:
+    replay_logger.info("replayed %d games", games, extra={'games': games})
+
+# Reports the rows and seconds of every call of a registered UDF, e.g. for the metrics of a refresh
+udf_logger = logging.getLogger('chess_dbt.udf')
+
+def _timed(name: str, func: Callable, vectorized: bool) -> Callable:
+    @wraps(func)
+    def timed_udf(*args):
+        if not udf_logger.isEnabledFor(logging.INFO):
+            return func(*args)
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            rows = len(args[0]) if vectorized else 1
+            udf_logger.info("%s: %d rows", name, rows, extra={'udf': name, 'rows': rows, 'seconds': time.perf_counter() - start})
+    return timed_udf
+
+def _create_function(conn: DuckDBPyConnection, name: str, func: Callable, *args, **kwargs) -> None:
+    # an arrow UDF gets a chunk of rows per call, a native one a single row
+    conn.create_function(name, _timed(name, func, kwargs.get('type') == 'arrow'), *args, **kwargs)
 
 def pgn_to_fens_udf(pgn) -> list[str]:
     arr = []
+    headers, movetext = split_pgn(pgn)
+    board = starting_board(headers)
+    
+    for move in push_movetext(board, movetext):
+        arr.append(board.fen())
+
+    return arr
+
+def tcn_to_fens_udf(tcn, initial_setup) -> list[str]:
+    # TCN holds from/to squares, so the replay needs no SAN parsing or disambiguation
+    board = chess.Board(initial_setup or chess.STARTING_FEN)
+    return [board.fen() for _ in push_tcn(board, tcn)]
+
+BITBOARDS = ('white', 'black', 'pawns', 'knights', 'bishops', 'rooks', 'queens', 'kings')
+
+def _bitboards(board: chess.Board) -> dict:
+    # One 64-bit mask per color and piece type, bit i set when square i (a1=0 ... h8=63) holds such a piece
+    return {
+        'white': board.occupied_co[chess.WHITE],
+        'black': board.occupied_co[chess.BLACK],
+        'pawns': board.pawns,
+        'knights': board.knights,
+        'bishops': board.bishops,
+        'rooks': board.rooks,
+        'queens': board.queens,
+        'kings': board.kings,
+    }
+
+def _piece_at(bitboards: dict, square: int) -> Optional[chess.Piece]:
+    mask = chess.BB_SQUARES[square]
+    for piece_type, piece_name in zip(chess.PIECE_TYPES, BITBOARDS[2:]):
+        if bitboards[piece_name] & mask:
+            return chess.Piece(piece_type, bool(bitboards['white'] & mask))
+    return None
+
+def _is_castling(bitboards: dict, move: chess.Move) -> bool:
+    # `Board.is_castling` on the position before the move: the king moves two files or,
+    # as python-chess encodes Chess960 castling, onto a rook of its own color
+    mask = chess.BB_SQUARES[move.from_square]
+    if not bitboards['kings'] & mask:
+        return False
+    own = bitboards['white'] if bitboards['white'] & mask else bitboards['black']
+    return abs(chess.square_file(move.from_square) - chess.square_file(move.to_square)) > 1 \
+        or bool(bitboards['rooks'] & own & chess.BB_SQUARES[move.to_square])
+
+def _replay_moves(board: chess.Board, moves: Iterator[chess.Move]) -> list[dict]:
+    """
+    Describes every move of `moves`, an iterator pushing them onto `board`. The moved and the
+    captured piece are read from the bitboards of the position before the move, so no move is undone.
+    """
+    arr = []
+    prev = _bitboards(board)
+    for move in moves:
+        bitboards = _bitboards(board)
+        moved_piece = _piece_at(prev, move.from_square)
+        if _is_castling(prev, move):
+            # a Chess960 castling king "takes" its own rook and may leave `to_square` empty
+            captured_piece = None
+        else:
+            captured_piece = _piece_at(prev, move.to_square)
+            if captured_piece is None and moved_piece.piece_type == chess.PAWN \
+                    and chess.square_file(move.from_square) != chess.square_file(move.to_square):
+                # en passant, the captured pawn is beside the from-square
+                captured_piece = chess.Piece(chess.PAWN, not moved_piece.color)
+        if move.promotion:
+            moved_piece = chess.Piece(move.promotion, moved_piece.color)
+
+        arr.append({
+            'uci': move.uci(),
+            'from_square': move.from_square,
+            'to_square': move.to_square,
+            'moved_piece': moved_piece.symbol(),
+            'captured_piece': captured_piece.symbol() if captured_piece else None,
+            'is_check': board.is_check(),
+            # Polyglot Zobrist hash: the same 64-bit key for the same position whatever the move order
+            'position_hash': chess.polyglot.zobrist_hash(board),
+            'bitboards': bitboards,
+        })
+        prev = bitboards
+    return arr
+
+def bitboards_to_fen_udf(bitboards) -> str:
+    # The piece placement field of the FEN, for display of a stored board
+    board = chess.BaseBoard.empty()
+    for color, color_name in zip(chess.COLORS, ('white', 'black')):
+        for piece_type, piece_name in zip(chess.PIECE_TYPES, BITBOARDS[2:]):
+            for square in chess.scan_forward(bitboards[color_name] & bitboards[piece_name]):
+                board.set_piece_at(square, chess.Piece(piece_type, color))
+    return board.board_fen()
+
+def pgn_to_moves_udf(pgn) -> list[dict]:
+    headers, movetext = split_pgn(pgn)
+    board = starting_board(headers)
+    return _replay_moves(board, push_movetext(board, movetext))
+
+def tcn_to_moves_udf(tcn, initial_setup) -> list[dict]:
+    board = chess.Board(initial_setup or chess.STARTING_FEN)
+    return _replay_moves(board, push_tcn(board, tcn))
+
+def start_position_hash_udf(pgn) -> int:
+    # Zobrist hash of the position before the first move (ply 0), the Chess960 one included
+    headers, _ = split_pgn(pgn)
+    return chess.polyglot.zobrist_hash(starting_board(headers))
+
+def pgn_to_fens_reference_udf(pgn) -> list[str]:
+    # Full `read_game` replay, used by dbt tests to check `pgn_to_fens_udf` for conformance
     game = chess.pgn.read_game(StringIO(pgn)).game()
     board = game.board()
-    
+    arr = []
     for move in game.mainline_moves():
         board.push(move)
-        fen = board.fen()
-        # from_square = move.from_square
-        # to_square = move.to_square
-        # moved_piece = board.piece_at(to_square).symbol()
-        # color_move = board.piece_at(to_square).color
-        # x = {
-        #     'move_from_to': move.uci(),
-        #     'from_square': from_square,
-        #     'to_square': to_square,
-        #     'moved_piece': moved_piece,
-        #     'color_move': 'White' if color_move else 'Black',
-        #     'fen': fen
-        # }
-        # arr.append(x)
-        arr.append(fen)
-
+        arr.append(board.fen())
     return arr
 
 def get_checkmate_pieces_udf(fen, player_color, player_result, opponent_result) -> list[str]:
@@ -44,71 +173,147 @@ def get_checkmate_pieces_udf(fen, player_color, player_result, opponent_result)
     if not board.is_checkmate():
         return []
 
-    if player_color == 'White':
-        if player_result == 'win':
-            winning_color = chess.WHITE
-            checkmated_color = chess.BLACK
-        else:
-            winning_color = chess.BLACK
-            checkmated_color = chess.WHITE
-    else:
-        if player_result == 'win':
-            winning_color = chess.BLACK
-            checkmated_color = chess.WHITE
-        else:
-            winning_color = chess.WHITE
-            checkmated_color = chess.BLACK
-
-    # Get position of Checkmated King
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece and piece.piece_type == chess.KING and piece.color == checkmated_color:
-            king_square = square
-            break
-
-    # Get possible moves by king
-    official_king_moves = board.attacks(king_square)
-    attacked_squares = [king_square]
-    for square in official_king_moves:
-        piece = board.piece_at(square)
-
-        if not piece or piece.color != checkmated_color:
-            attacked_squares.append(square)
-
-    # Get attacking pieces
-    attacking_pieces = []
-    for square in attacked_squares:
-        attacker_ids = list(board.attackers(color=winning_color, square=square))
-        attacking_pieces.extend(attacker_ids)
-    attacking_pieces = set(attacking_pieces)  # dedup the board pieces based on position
-
-    return sorted([chess.piece_name(board.piece_at(attacker).piece_type) for attacker in attacking_pieces])
-
-def get_captured_piece_udf(prev_fen, fen) -> str | None:
-    if prev_fen == "":
-        return None
-    
-    prev_fen = prev_fen.split(' ')[0]
-    fen = fen.split(' ')[0]
-    prev_pieces = re.findall(r'[prnbqRNBQP]', prev_fen)
-    current_pieces = re.findall(r'[prnbqRNBQP]', fen)
-    
-    prev = Counter(prev_pieces)
-    curr = Counter(current_pieces)
+    # The side to move is the one checkmated
+    checkmated_color = board.turn
+    king_square = board.king(checkmated_color)
 
-    # find the difference between the two lists
-    diff = prev-curr
-    
-    captured = list(diff.elements())
-    if len(captured) == 0:
-        return None
-    
-    return captured[0]
+    # The king's square and the squares it could move to, those not held by its own pieces
+    squares = chess.BB_SQUARES[king_square] | (board.attacks_mask(king_square) & ~board.occupied_co[checkmated_color])
+
+    # Winning pieces attacking any of them, each piece counted once
+    attackers = 0
+    for square in chess.scan_forward(squares):
+        attackers |= board.attackers_mask(not checkmated_color, square)
+
+    return sorted(chess.piece_name(board.piece_type_at(square)) for square in chess.scan_forward(attackers))
+
+def _map_arrow(func: Callable, arrow_type: pa.DataType, *columns: pa.ChunkedArray, skip_nulls: bool = True, engine: Optional[ReplayEngine] = None) -> pa.Array:
+    # Arrow UDFs get a whole chunk (up to 2048 rows) per call. Rows containing a NULL
+    # are skipped to mirror the default null handling of the scalar UDFs.
+    rows = list(zip(*[column.to_pylist() for column in columns]))
+    result = [None] * len(rows)
+    indices = [i for i, row in enumerate(rows) if not (skip_nulls and None in row)]
+    args = [[rows[i][j] for i in indices] for j in range(len(columns))]
+
+    values = engine.map(func, *args) if engine else [func(*row) for row in zip(*args)]
+    for i, value in zip(indices, values):
+        result[i] = value
+    return pa.array(result, type=arrow_type)
+
+def pgn_to_fens_arrow(pgn: pa.ChunkedArray, engine: Optional[ReplayEngine] = None) -> pa.Array:
+    return _map_arrow(pgn_to_fens_udf, pa.list_(pa.string()), pgn, engine=engine)
+
+def tcn_to_fens_arrow(tcn: pa.ChunkedArray, initial_setup: pa.ChunkedArray, engine: Optional[ReplayEngine] = None) -> pa.Array:
+    return _map_arrow(tcn_to_fens_udf, pa.list_(pa.string()), tcn, initial_setup, engine=engine)
+
+BITBOARDS_TYPE = f"STRUCT({', '.join(f'{name} UBIGINT' for name in BITBOARDS)})"
+BITBOARDS_ARROW_TYPE = pa.struct([(name, pa.uint64()) for name in BITBOARDS])
+MOVE_FIELDS = [
+    ('uci', 'VARCHAR', pa.string()),
+    ('from_square', 'UTINYINT', pa.uint8()),
+    ('to_square', 'UTINYINT', pa.uint8()),
+    ('moved_piece', 'VARCHAR', pa.string()),
+    ('captured_piece', 'VARCHAR', pa.string()),
+    ('is_check', 'BOOLEAN', pa.bool_()),
+    ('position_hash', 'UBIGINT', pa.uint64()),
+    ('bitboards', BITBOARDS_TYPE, BITBOARDS_ARROW_TYPE),
+]
+MOVE_TYPE = f"STRUCT({', '.join(f'{name} {sql_type}' for name, sql_type, _ in MOVE_FIELDS)})[]"
+MOVE_ARROW_TYPE = pa.list_(pa.struct([(name, arrow_type) for name, _, arrow_type in MOVE_FIELDS]))
+
+def pgn_to_moves_arrow(pgn: pa.ChunkedArray, engine: Optional[ReplayEngine] = None) -> pa.Array:
+    return _map_arrow(pgn_to_moves_udf, MOVE_ARROW_TYPE, pgn, engine=engine)
+
+def tcn_to_moves_arrow(tcn: pa.ChunkedArray, initial_setup: pa.ChunkedArray, engine: Optional[ReplayEngine] = None) -> pa.Array:
+    return _map_arrow(tcn_to_moves_udf, MOVE_ARROW_TYPE, tcn, initial_setup, engine=engine)
+
+def start_position_hash_arrow(pgn: pa.ChunkedArray) -> pa.Array:
+    return _map_arrow(start_position_hash_udf, pa.uint64(), pgn)
+
+def bitboards_to_fen_arrow(bitboards: pa.ChunkedArray) -> pa.Array:
+    return _map_arrow(bitboards_to_fen_udf, pa.string(), bitboards)
+
+def get_checkmate_pieces_arrow(fen: pa.ChunkedArray, player_color: pa.ChunkedArray, player_result: pa.ChunkedArray, opponent_result: pa.ChunkedArray) -> pa.Array:
+    # Only the checkmated games leave Arrow: the others get an empty list (NULL with a NULL input)
+    # without a board or a Python call per row
+    columns = [fen, player_color, player_result, opponent_result]
+    has_null = reduce(pc.or_, [pc.is_null(column) for column in columns]).to_numpy()
+    is_mate = pc.fill_null(
+        pc.or_(pc.equal(player_result, 'checkmated'), pc.equal(opponent_result, 'checkmated')), False
+    ).to_numpy() & ~has_null
+
+    rows = [pc.filter(column, is_mate).to_pylist() for column in columns]
+    pieces = [get_checkmate_pieces_udf(*row) for row in zip(*rows)]
+
+    # each row takes its pieces, the empty list or NULL
+    values = pa.array(pieces + [[], None], type=pa.list_(pa.string()))
+    picks = np.where(has_null, len(pieces) + 1, len(pieces))
+    picks[is_mate] = np.arange(len(pieces))
+    return pc.take(values, pa.array(picks))
+
+UDF_TYPES = ('native', 'arrow')
+
+def register_udfs(conn: DuckDBPyConnection, udf_type: str = 'arrow', engine: Optional[ReplayEngine] = None) -> None:
+    """
+    Registers the chess UDFs as row-at-a-time ('native') or vectorized ('arrow') functions.
+    With the arrow UDFs, `engine` spreads the FEN replay of each chunk across worker processes.
+    """
+    if udf_type not in UDF_TYPES:
+        raise ValueError(f"udf_type must be one of {UDF_TYPES}, got '{udf_type}'")
+
+    _create_function(conn, "pgn_to_fens_reference_udf", pgn_to_fens_reference_udf)
+
+    if udf_type == 'native':
+        def pgn_to_moves_logged(pgn) -> list[dict]:
+            _log_replayed(1)
+            return pgn_to_moves_udf(pgn)
+
+        def tcn_to_moves_logged(tcn, initial_setup) -> list[dict]:
+            _log_replayed(1)
+            return tcn_to_moves_udf(tcn, initial_setup)
+
+        _create_function(conn, "pgn_to_fens_udf", pgn_to_fens_udf)
+        _create_function(conn, "tcn_to_fens_udf", tcn_to_fens_udf, [VARCHAR] * 2, 'VARCHAR[]')
+        _create_function(conn, "pgn_to_moves_udf", pgn_to_moves_logged, [VARCHAR], MOVE_TYPE)
+        _create_function(conn, "tcn_to_moves_udf", tcn_to_moves_logged, [VARCHAR] * 2, MOVE_TYPE)
+        _create_function(conn, "start_position_hash_udf", start_position_hash_udf, [VARCHAR], 'UBIGINT')
+        _create_function(conn, "bitboards_to_fen_udf", bitboards_to_fen_udf, [BITBOARDS_TYPE], VARCHAR)
+        _create_function(conn, "get_checkmate_pieces_udf", get_checkmate_pieces_udf)
+        return
+
+    def pgn_to_fens_replay(pgn: pa.ChunkedArray) -> pa.Array:
+        return pgn_to_fens_arrow(pgn, engine)
+
+    def tcn_to_fens_replay(tcn: pa.ChunkedArray, initial_setup: pa.ChunkedArray) -> pa.Array:
+        return tcn_to_fens_arrow(tcn, initial_setup, engine)
+
+    def pgn_to_moves_replay(pgn: pa.ChunkedArray) -> pa.Array:
+        result = pgn_to_moves_arrow(pgn, engine)
+        _log_replayed(len(pgn))
+        return result
+
+    def tcn_to_moves_replay(tcn: pa.ChunkedArray, initial_setup: pa.ChunkedArray) -> pa.Array:
+        result = tcn_to_moves_arrow(tcn, initial_setup, engine)
+        _log_replayed(len(tcn))
+        return result
+
+    _create_function(conn, "pgn_to_fens_udf", pgn_to_fens_replay, [VARCHAR], 'VARCHAR[]', type='arrow')
+    _create_function(conn, "tcn_to_fens_udf", tcn_to_fens_replay, [VARCHAR] * 2, 'VARCHAR[]', type='arrow')
+    _create_function(conn, "pgn_to_moves_udf", pgn_to_moves_replay, [VARCHAR], MOVE_TYPE, type='arrow')
+    _create_function(conn, "tcn_to_moves_udf", tcn_to_moves_replay, [VARCHAR] * 2, MOVE_TYPE, type='arrow')
+    _create_function(conn, "start_position_hash_udf", start_position_hash_arrow, [VARCHAR], 'UBIGINT', type='arrow')
+    _create_function(conn, "bitboards_to_fen_udf", bitboards_to_fen_arrow, [BITBOARDS_TYPE], VARCHAR, type='arrow')
+    _create_function(conn, "get_checkmate_pieces_udf", get_checkmate_pieces_arrow, [VARCHAR] * 4, 'VARCHAR[]', type='arrow')
 
 # The python module that you create must have a class named "Plugin"
 # which extends the `dbt.adapters.duckdb.plugins.BasePlugin` class.
 class Plugin(BasePlugin):
+    def initialize(self, plugin_config: Dict[str, Any]):
+        # `udf_type` is set under the plugin `config` in profiles.yml
+        self.udf_type = plugin_config.get('udf_type', 'arrow')
+        # CHESS_REPLAY_WORKERS overrides `replay_workers`, e.g. the share of the cores of a refresh pool worker
+        replay_workers = os.environ.get('CHESS_REPLAY_WORKERS', plugin_config.get('replay_workers', 1))
+        self.replay_engine = ReplayEngine(workers=int(replay_workers))
+
     def configure_connection(self, conn: DuckDBPyConnection):
-        conn.create_function("pgn_to_fens_udf", pgn_to_fens_udf)
-        conn.create_function("get_checkmate_pieces_udf", get_checkmate_pieces_udf)
-        conn.create_function("get_captured_piece_udf", get_captured_piece_udf, null_handling = 'special')
\ No newline at end of file
+        register_udfs(conn, self.udf_type, self.replay_engine)
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""Process pool used to spread CPU-bound move replay across cores"""
+
+import atexit
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Iterable, List, Optional
+
+
+class ReplayEngine:
+    """
+    Maps a function over a batch of inputs on a pool of worker processes and returns the
+    results in input order. The pool is started lazily on the first batch large enough to be
+    worth splitting and is shut down at interpreter exit.
+    Args:
+        workers (int): Number of worker processes. 0 uses every available core, 1 replays in-process.
+        min_batch_size (int): Batches smaller than this are replayed in-process.
+    """
+
+    def __init__(self, workers: int = 1, min_batch_size: int = 64):
+        if workers < 0:
+            raise ValueError(f"workers must be >= 0, got {workers}")
+        self.workers = workers or os.cpu_count() or 1
+        self.min_batch_size = min_batch_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # DuckDB and dbt run their own threads, forking them is not safe
+                context = multiprocessing.get_context("spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                atexit.register(self.close)
+            return self._pool
+
+    def map(self, func: Callable[..., Any], *iterables: Iterable[Any]) -> List[Any]:
+        """Returns `[func(*args) for args in zip(*iterables)]`, computed across the worker pool"""
+        columns = [list(iterable) for iterable in iterables]
+        size = len(columns[0]) if columns else 0
+        if self.workers <= 1 or size < self.min_batch_size:
+            return [func(*args) for args in zip(*columns)]
+
+        # one contiguous slice per worker keeps the IPC overhead to a single round trip each
+        chunksize = math.ceil(size / self.workers)
+        return list(self._get_pool().map(func, *columns, chunksize=chunksize))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,72 @@
+"""
+Decoder for the chess.com TCN move encoding.
+
+Every move is two characters of `TCN_ALPHABET`. The first is the from-square index
+(a1=0 ... h8=63, the same numbering as python-chess). The second is the to-square index,
+or 64+ for a promotion, in which case it encodes the promoted piece and the file offset
+of the pawn. Decoding therefore yields from/to/promotion moves with no SAN parsing.
+"""
+
+from typing import Iterator, List, Optional
+
+import chess
+
+TCN_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!?{~}(^)[_]@#$,./&-*++="
+_INDEX = {char: index for index, char in reversed(list(enumerate(TCN_ALPHABET)))}
+_PROMOTION_PIECES = "qnrbkp"
+
+
+def iter_tcn_moves(tcn: str) -> Iterator[chess.Move]:
+    """
+    Yields the moves encoded in `tcn`. Piece drops (crazyhouse, bughouse) cannot be replayed
+    on a standard board, decoding stops at the first one.
+    """
+    for i in range(0, len(tcn) - 1, 2):
+        from_index = _INDEX[tcn[i]]
+        to_index = _INDEX[tcn[i + 1]]
+        if from_index > 63:
+            return
+
+        promotion = None
+        if to_index > 63:
+            promotion = chess.Piece.from_symbol(_PROMOTION_PIECES[(to_index - 64) // 3]).piece_type
+            direction = 8 if from_index >= 16 else -8
+            to_index = from_index + direction + (to_index - 1) % 3 - 1
+
+        yield chess.Move(from_index, to_index, promotion=promotion)
+
+
+def tcn_to_uci(tcn: str) -> List[str]:
+    return [move.uci() for move in iter_tcn_moves(tcn)]
+
+
+def push_tcn(board: chess.Board, tcn: str) -> Iterator[chess.Move]:
+    """
+    Pushes every move of `tcn` onto `board`, yielding each move after it is pushed.
+    Moves are trusted as chess.com recorded them, only the piece on the from-square is checked.
+    """
+    for move in iter_tcn_moves(tcn):
+        if board.piece_type_at(move.from_square) is None:
+            return
+        board.push(move)
+        yield move
+
+
+def tcn_to_board(tcn: str, initial_setup: Optional[str] = None) -> chess.Board:
+    board = chess.Board(initial_setup or chess.STARTING_FEN)
+    for _ in push_tcn(board, tcn):
+        pass
+    return board
+
+
+def encode_tcn(moves: List[chess.Move]) -> str:
+    """Encodes moves into TCN, the inverse of `iter_tcn_moves`"""
+    chars = []
+    for move in moves:
+        to_index = move.to_square
+        if move.promotion:
+            offset = chess.square_file(move.to_square) - chess.square_file(move.from_square)
+            piece = chess.piece_symbol(move.promotion)
+            to_index = 64 + 3 * _PROMOTION_PIECES.index(piece) + offset + 1
+        chars.append(TCN_ALPHABET[move.from_square] + TCN_ALPHABET[to_index])
+    return "".join(chars)
@@ -0,0 +1,17 @@
+{% macro new_dlt_loads(player_column, load_id_column='_dlt_load_id') %}
+    {#-
+        On incremental runs, only keep rows from dlt loads newer than the last load already
+        processed for the same player, so players loaded at different times each catch up.
+        `player_column` must be qualified with its table alias, e.g. 'pg.player_username'.
+        `dbt build --full-refresh` replays everything.
+    -#}
+    {%- if is_incremental() %}
+    {{ load_id_column }} > coalesce((
+        select max(processed._dlt_load_id)
+        from {{ this }} as processed
+        where processed.player_username = {{ player_column }}
+    ), 0)
+    {%- else %}
+    true
+    {%- endif %}
+{% endmacro %}
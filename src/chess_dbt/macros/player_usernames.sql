@@ -0,0 +1,20 @@
+{% macro player_usernames() %}
+    {#-
+        The lower cased usernames of the players to build, as a list literal. Taken from the
+        `usernames` var (a list, or a comma separated string) and falling back to `username`.
+    -#}
+    {%- set usernames = var('usernames', []) -%}
+    {%- if usernames is string -%}
+        {%- set usernames = usernames.split(',') -%}
+    {%- endif -%}
+    {%- set usernames = usernames | map('trim') | reject('equalto', '') | list -%}
+    {#- the project may be parsed ahead of the build without any vars, e.g. by a pooled runner -#}
+    {%- if usernames | length == 0 and execute -%}
+        {%- set usernames = [var('username')] -%}
+    {%- endif -%}
+    [
+        {%- for username in usernames | map('lower') | unique -%}
+        '{{ username | replace("'", "''") }}'{{ ', ' if not loop.last }}
+        {%- endfor -%}
+    ]
+{%- endmacro %}
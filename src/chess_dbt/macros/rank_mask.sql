@@ -0,0 +1,6 @@
+{% macro rank_mask(rank) %}
+    {#-
+        The squares of a rank (1 to 8) as a UBIGINT bitboard, bit i being square i (a1=0 ... h8=63)
+    -#}
+    {{- 255 * 2 ** (8 * (rank - 1)) -}}::ubigint
+{%- endmacro %}
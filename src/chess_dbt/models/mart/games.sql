@@ -2,41 +2,45 @@
     config(
         materialized='incremental',
         incremental_strategy='delete+insert',
-        unique_key='game_uuid'
+        unique_key=['game_uuid', 'player_username']
     )
 }}
 
 with game_moves as (
     select
         game_uuid
+        , player_username
         , game_move_index
         , game_phase
 
         , color_move
         , move_time_seconds
-    from {{ ref('prep_game_moves') }}
+    from {{ ref('prep_game_moves') }} as moves
 
-    where player_username = '{{ var("username") }}'
+    where {{ new_dlt_loads('moves.player_username') }}
 )
 
 , game_moves_pivot as (
     pivot game_moves
-    on color_move
+    on color_move in ('White', 'Black')
     using sum(move_time_seconds) as total_move_time, count(*) as num_moves
-    group by game_uuid
+    group by game_uuid, player_username
 )
 
 , ended_game_phase as (
     select
         game_uuid
+        , player_username
         , max_by(game_phase, game_move_index) as ended_game_phase
     from game_moves
-    group by game_uuid
+    group by game_uuid, player_username
 )
 
 , player_games as (
     select *
-    from {{ ref('prep_player_games') }}
+    from {{ ref('prep_player_games') }} as player_games
+
+    where {{ new_dlt_loads('player_games.player_username') }}
 )
 
 , joined as (
@@ -50,10 +54,14 @@ with game_moves as (
     from player_games as pg
 
     left join game_moves_pivot as gm
-        on pg.game_uuid = gm.game_uuid
+        on
+            pg.game_uuid = gm.game_uuid
+            and pg.player_username = gm.player_username
 
     left join ended_game_phase as egp
-        on pg.game_uuid = egp.game_uuid
+        on
+            pg.game_uuid = egp.game_uuid
+            and pg.player_username = egp.player_username
 )
 
 , final as (
@@ -149,5 +157,6 @@ select
     , accuracies__white
     , accuracies__black
     , floor(opponent_rating / 100) * 100 as opponent_rating_bin
+    , _dlt_load_id
 
 from final
@@ -0,0 +1,46 @@
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy='delete+insert',
+        unique_key=['player_username', 'game_start_date']
+    )
+}}
+
+-- Only the days with new games are rebuilt, the rollups of the other days are kept as they are
+with updated_days as (
+    select distinct
+        player_username
+        , game_start_date
+    from {{ ref('games') }} as games
+
+    where {{ new_dlt_loads('games.player_username') }}
+)
+
+, player_games as (
+    select games.*
+    from {{ ref('games') }} as games
+
+    semi join updated_days
+        on
+            games.player_username = updated_days.player_username
+            and games.game_start_date = updated_days.game_start_date
+)
+
+, final as (
+    select
+        player_username
+        , time_class
+        , player_color
+        , game_start_date
+
+        , max_by(player_rating, game_start_timestamp) as last_player_rating
+        , max(game_start_timestamp) as last_game_start_timestamp
+        , count(1) as num_games
+        , max(_dlt_load_id) as _dlt_load_id
+
+    from player_games
+    group by all
+)
+
+select *
+from final
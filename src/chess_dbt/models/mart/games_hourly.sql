@@ -0,0 +1,56 @@
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy='delete+insert',
+        unique_key=['player_username', 'game_start_date']
+    )
+}}
+
+-- Games are bucketed by UTC quarter hour, not by hour: the dashboard shifts the buckets to the
+-- player's timezone, and offsets such as +05:30 or +05:45 would split a UTC hour across two local ones.
+
+-- Only the days with new games are rebuilt, the rollups of the other days are kept as they are
+with updated_days as (
+    select distinct
+        player_username
+        , game_start_date
+    from {{ ref('games') }} as games
+
+    where {{ new_dlt_loads('games.player_username') }}
+)
+
+, player_games as (
+    select games.*
+    from {{ ref('games') }} as games
+
+    semi join updated_days
+        on
+            games.player_username = updated_days.player_username
+            and games.game_start_date = updated_days.game_start_date
+)
+
+, final as (
+    select
+        player_username
+        , time_class
+        , player_color
+        , game_start_date
+        , hour(game_start_timestamp) as game_start_hour
+        , minute(game_start_timestamp) // 15 * 15 as game_start_minute
+        , dayofweek(game_start_date) * 24 + game_start_hour as game_start_hour_of_week
+        , player_wdl
+        , player_wdl_reason
+        , ended_game_phase
+        , checkmate_pieces
+
+        , count(1) as num_games
+        , coalesce(sum(player_num_moves), 0)::bigint as player_num_moves
+        , coalesce(sum(player_total_move_time), 0) as player_total_move_time
+        , max(_dlt_load_id) as _dlt_load_id
+
+    from player_games
+    group by all
+)
+
+select *
+from final
@@ -0,0 +1,84 @@
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy='delete+insert',
+        unique_key=['player_username', 'game_start_date']
+    )
+}}
+
+-- Opening tree of each player: one node per move sequence of the first
+-- `opening_tree_depth` plies, with the games and results that went through it.
+-- A game shorter than a depth is counted at that depth under its full move sequence,
+-- the same as slicing the first N moves of it.
+
+-- Only the nodes of the days with new games are rebuilt, like the rollups in games_daily.
+-- The rest of the tree is kept, so a refresh costs the new days' games, not the player's history.
+-- The date is part of the grain for the date range filter of the Openings tab. With 12k distinct
+-- games it costs ~12% more nodes than summing over the dates (180k vs 161k), a depth 15 lookup
+-- stays at ~3 ms, against ~15 ms slicing the moves of games and ~50 ms from prep_game_moves
+-- (benchmarks/bench_opening_tree.py).
+with updated_days as (
+    select distinct
+        player_username
+        , game_start_date
+    from {{ ref('games') }} as games
+
+    where {{ new_dlt_loads('games.player_username') }}
+)
+
+, player_games as (
+    select
+        games.player_username
+        , games.time_class
+        , games.player_color
+        , games.game_start_date
+        , games.game_start_timestamp
+        , games.player_wdl
+        , games.game_analysis_url
+        , games.pgn_move_extract
+        , games._dlt_load_id
+    from {{ ref('games') }} as games
+
+    semi join updated_days
+        on
+            games.player_username = updated_days.player_username
+            and games.game_start_date = updated_days.game_start_date
+
+    where len(games.pgn_move_extract) > 0
+)
+
+, nodes as (
+    select
+        *
+        , unnest(range(1, {{ var('opening_tree_depth', 15) }} + 1)) as depth
+        , array_to_string(pgn_move_extract[1:depth], ' ') as opening_prefix
+        , array_to_string(pgn_move_extract[1:depth - 1], ' ') as parent_prefix
+        , pgn_move_extract[least(depth, len(pgn_move_extract))] as last_move
+    from player_games
+)
+
+, final as (
+    select
+        player_username
+        , time_class
+        , player_color
+        , game_start_date
+        , depth
+        , opening_prefix
+        , parent_prefix
+        , last_move
+        , player_wdl
+
+        , count(1) as num_games
+        -- the latest games through the node, to list them without scanning the games
+        , list(game_analysis_url order by game_start_timestamp desc)[1:5] as game_analysis_urls
+        , max(_dlt_load_id) as _dlt_load_id
+
+    from nodes
+    group by all
+)
+
+select *
+from final
+-- clustered so that a lookup of one player's depth only reads a few row groups
+order by player_username, depth, opening_prefix
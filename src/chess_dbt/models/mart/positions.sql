@@ -0,0 +1,94 @@
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy='delete+insert',
+        unique_key=['game_uuid', 'player_username'],
+        pre_hook="{% if should_full_refresh() %}drop index if exists {{ this.identifier }}_position_hash_idx{% endif %}",
+        post_hook="create index if not exists {{ this.identifier }}_position_hash_idx on {{ this }} (position_hash)"
+    )
+}}
+
+-- Position index of each player: one row per position reached in a game, keyed on the
+-- Zobrist hash of the position. Transpositions share a hash, so a lookup finds every game
+-- that reached the position whatever the move order.
+
+with player_games as (
+    select
+        game_uuid
+        , player_username
+        , time_class
+        , player_color
+        , game_start_date
+        , game_start_timestamp
+        , player_wdl
+        , game_analysis_url
+        , pgn
+        , _dlt_load_id
+    from {{ ref('games') }} as player_games
+
+    where {{ new_dlt_loads('player_games.player_username') }}
+)
+
+, game_moves as (
+    select
+        game_uuid
+        , player_username
+        , position_hash
+        , game_move_index
+    from {{ ref('prep_game_moves') }}
+
+    where game_uuid in (select game_uuid from player_games)
+)
+
+-- The position before the first move (ply 0), the standard or the Chess960 start position,
+-- so that a search on the initial board finds the games too
+, start_positions as (
+    select
+        game_uuid
+        , player_username
+        , start_position_hash_udf(pgn) as position_hash
+        , 0 as game_move_index
+    from player_games
+)
+
+, moves as (
+    select
+        game_uuid
+        , player_username
+        , position_hash
+        -- a position repeated within a game is indexed once, at its first occurrence
+        , min(game_move_index) as game_move_index
+    from (
+        select * from game_moves
+        union all
+        select * from start_positions
+    )
+    group by all
+)
+
+, final as (
+    select
+        moves.player_username
+        , moves.position_hash
+        , moves.game_uuid
+        , moves.game_move_index
+        , player_games.time_class
+        , player_games.player_color
+        , player_games.game_start_date
+        , player_games.game_start_timestamp
+        , player_games.player_wdl
+        , player_games.game_analysis_url
+        , player_games._dlt_load_id
+
+    from moves
+    inner join player_games
+        on
+            moves.game_uuid = player_games.game_uuid
+            and moves.player_username = player_games.player_username
+)
+
+select *
+from final
+-- clustered so that a lookup of a position only reads a few row groups,
+-- the ART index on position_hash serves the point lookups of the dashboard
+order by player_username, position_hash
@@ -2,7 +2,7 @@
     config(
         materialized='incremental',
         incremental_strategy='delete+insert',
-        unique_key='id'
+        unique_key=['game_uuid', 'player_username']
     )
 }}
 
@@ -13,19 +13,36 @@ with prep_player_games as (
         , time_class
         , time_control_base
         , time_control_add_seconds
+        , rules
         , pgn
+        , tcn
+        , initial_setup
         , pgn_header
         , pgn_move_extract
         , pgn_clock_extract
-    from {{ ref('prep_player_games') }}
-    
-    where player_username = '{{ var("username") }}'
+        , _dlt_load_id
+    from {{ ref('prep_player_games') }} as player_games
+
+    where {{ new_dlt_loads('player_games.player_username') }}
 )
 
-, fens_data as (
+, replayed as (
     select
         *
-        , pgn_to_fens_udf(pgn) as fens
+        -- TCN decodes straight to from/to squares without SAN parsing,
+        -- the PGN replay is kept for variants and games without TCN.
+        -- The replay describes each move (uci, squares, pieces, check) and the position
+        -- it leads to (Zobrist hash and piece bitboards).
+        , if(
+            rules = 'chess' and coalesce(tcn, '') <> ''
+            , tcn_to_moves_udf(tcn, initial_setup)
+            , pgn_to_moves_udf(pgn)
+        ) as replayed_moves
+        -- The clock after each move, with the increment added
+        , list_transform(
+            pgn_clock_extract
+            , clock -> epoch(cast(replace(split(clock, ' ')[2], ']}}', '') as interval))
+        ) as clocks_post_move
     from prep_player_games
 )
 
@@ -36,24 +53,34 @@ with prep_player_games as (
         -- Move details
         , generate_subscripts(pgn_move_extract, 1) as game_move_index
         , unnest(pgn_move_extract) as move_unnest
-        , unnest(pgn_clock_extract) as clock_unnest
-        , unnest(fens) as fen
+        , unnest(clocks_post_move) as clock_interval_post_move
+        , unnest(replayed_moves) as replayed_move
         , split(move_unnest, ' ')[1] as color_move_index_raw
         , regexp_replace(color_move_index_raw, '\.+', '') as color_move_index_str
         , if(
             regexp_matches(color_move_index_raw, '\.\.\.'), 'Black', 'White'
         ) as color_move
         , split(move_unnest, ' ')[2] as game_move
-
-        -- This is the clock after the addition of time
-        , epoch(
-            cast(replace(split(clock_unnest, ' ')[2], ']}}', '') as interval)
-        ) as clock_interval_post_move
+        , replayed_move['uci'] as game_move_uci
+        , replayed_move['from_square'] as from_square
+        , replayed_move['to_square'] as to_square
+        , replayed_move['moved_piece'] as moved_piece
+        , replayed_move['captured_piece'] as captured_piece
+        , replayed_move['is_check'] as is_check
+        , replayed_move['position_hash'] as position_hash
+        , replayed_move['bitboards'] as bitboards
 
         -- To get the clock before the addition of time
         , clock_interval_post_move - time_control_add_seconds as clock_interval_move
 
-    from fens_data
+        -- The colors alternate, so the mover's previous clock is the one two plies back,
+        -- read from the game's list instead of a window over every move
+        , coalesce(
+            if(game_move_index > 2, clocks_post_move[game_move_index - 2], null)
+            , time_control_base
+        ) as prev_clock_interval_post_move
+
+    from replayed
 )
 
 , board_details as (
@@ -74,29 +101,19 @@ with prep_player_games as (
         , game_uuid || '_' || game_move_index as id
 
         -- Clock details
-        , string_agg(move_unnest, ' ')
-            over (partition by game_uuid order by game_move_index)
-            as pgn_cum_move
         , if(time_class = 'daily', 0, clock_interval_move) as clock_interval_move
         , if(time_class = 'daily', 0, clock_interval_post_move) as clock_interval_post_move
-        , if(
-            time_class = 'daily'
-            , 0
-            , coalesce(
-                lag(clock_interval_post_move)
-                    over (
-                        partition by game_uuid, color_move order by color_move_index
-                    )
-                , time_control_base
-            )
-        ) as prev_clock_interval
+        , if(time_class = 'daily', 0, prev_clock_interval_post_move) as prev_clock_interval
 
         , if(time_class = 'daily', 0, prev_clock_interval - clock_interval_move)
             as move_time_seconds
-        , split(fen, ' ')[1] as fen_board
-        , len(regexp_extract_all(split(fen_board, ' ')[1], '[rnbqRNBQ]')) as major_minor_cnt
-        , len(regexp_extract_all(split(fen_board, '/')[1], '[rnbq]')) as black_major_minor
-        , len(regexp_extract_all(split(fen_board, '/')[-1], '[RNBQ]')) as white_major_minor
+        -- Knights, bishops, rooks and queens counted with popcounts of the bitboards,
+        -- on the whole board and on each side's back rank (rank 8 for black, rank 1 for white)
+        , bitboards['knights'] | bitboards['bishops'] | bitboards['rooks'] | bitboards['queens']
+            as major_minor_mask
+        , bit_count(major_minor_mask) as major_minor_cnt
+        , bit_count(major_minor_mask & bitboards['black'] & {{ rank_mask(8) }}) as black_major_minor
+        , bit_count(major_minor_mask & bitboards['white'] & {{ rank_mask(1) }}) as white_major_minor
         , black_major_minor < 4 or white_major_minor < 4 as is_backrank_sparse
         , major_minor_cnt <= 10 or is_backrank_sparse as is_midgame
         , is_midgame and major_minor_cnt <= 6 as is_endgame
@@ -106,11 +123,6 @@ with prep_player_games as (
             when is_midgame then 'Midgame'
             else 'Opening'
         end as game_phase
-        , coalesce(
-            lag(fen) over (partition by game_uuid order by game_move_index)
-            , ''
-        ) as prev_fen
-        , get_captured_piece_udf(prev_fen, fen) as captured_piece
 
     from unnest
 )
@@ -128,11 +140,15 @@ select
     -- Move details
     , game_move_index
     , pgn_header
-    , pgn_cum_move
     , color_move
     , color_move_index
     , game_move
+    , game_move_uci
+    , from_square
+    , to_square
+    , moved_piece
     , captured_piece
+    , is_check
 
     -- Clock details
     , clock_interval_move
@@ -141,7 +157,8 @@ select
     , move_time_seconds
 
     -- Board details
-    , fen
+    , bitboards
+    , position_hash
     , major_minor_cnt
     , black_major_minor
     , white_major_minor
@@ -150,4 +167,7 @@ select
     , is_endgame
     , game_phase
 
+    -- Load details
+    , _dlt_load_id
+
 from board_details
@@ -2,21 +2,39 @@
     config(
         materialized='incremental',
         incremental_strategy='delete+insert',
-        unique_key='game_uuid'
+        unique_key=['game_uuid', 'player_username']
     )
 }}
 
-with player_games as (
-    select *
-    from {{ ref('stg_player_games') }}
-    
-    where lower(white__username) = lower('{{ var("username") }}')
-        or lower(black__username) = lower('{{ var("username") }}')
+with players as (
+    select unnest({{ player_usernames() }}) as player_username
 )
 
-, final as (
+-- A game between two of the players is kept once for each of them
+, player_games as (
+    select
+        stg.*
+        , players.player_username
+    from {{ ref('stg_player_games') }} as stg
+
+    inner join players
+        on players.player_username in (lower(stg.white__username), lower(stg.black__username))
+
+    where {{ new_dlt_loads('players.player_username', 'stg._dlt_load_id') }}
+)
+
+-- The PGN is split into its header block and movetext once, every extraction below
+-- reads only the section it needs
+, pgn_sections as (
     select
         *
+        , string_split(pgn, E'\n\n') as pgn_sections
+    from player_games
+)
+
+, final as (
+    select
+        * exclude (pgn_sections)
 
         -- Time control details
         , case
@@ -38,8 +56,7 @@ with player_games as (
         end as game_mode
 
         -- PLAYER details
-        , lower('{{ var("username") }}') as player_username
-        , if(lower(white__username) = '{{ var("username") }}', 'White', 'Black')
+        , if(lower(white__username) = player_username, 'White', 'Black')
             as player_color
         , if(player_color = 'White', white__rating, black__rating)
             as player_rating
@@ -64,13 +81,13 @@ with player_games as (
             as player_wdl_reason
 
         -- PGN details
-        , regexp_split_to_array(pgn, '\n\n')[1] as pgn_header
-        , regexp_split_to_array(pgn, '\n\n')[2] as pgn_moves
+        , pgn_sections[1] as pgn_header
+        , pgn_sections[2] as pgn_moves
         , regexp_extract_all(pgn_moves, '\d+\.+ [\S]+') as pgn_move_extract
         , regexp_extract_all(pgn_moves, '{\[%clk \S+\]}') as pgn_clock_extract
         , if(
             len(pgn_move_extract) > 0
-            , list_reduce(pgn_move_extract, (s, x) -> s || ' ' || x)
+            , array_to_string(pgn_move_extract, ' ')
             , ''
         ) as pgn_move_extract_string
         , 'https://lichess.org/analysis/pgn/'
@@ -79,14 +96,14 @@ with player_games as (
         || lower(player_color) as game_analysis_url
 
         -- PGN ECO details
-        , regexp_extract(pgn, '(ECO )"(.*)"', 2) as eco
-        , regexp_extract(pgn, '(ECOUrl )"(.*)"', 2) as eco_url
+        , regexp_extract(pgn_header, '(ECO )"(.*)"', 2) as eco
+        , regexp_extract(pgn_header, '(ECOUrl )"(.*)"', 2) as eco_url
         , replace(eco_url, 'https://www.chess.com/openings/', '') as eco_name
 
         -- GAME TIME DETAILS
-        , replace(regexp_extract(pgn, '(UTCDate )"(.*)"', 2), '.', '-')::date
+        , replace(regexp_extract(pgn_header, '(UTCDate )"(.*)"', 2), '.', '-')::date
             as game_start_date
-        , regexp_extract(pgn, '(StartTime )"(.*)"', 2) as game_start_time
+        , regexp_extract(pgn_header, '(StartTime )"(.*)"', 2) as game_start_time
         , concat(game_start_date, ' ', game_start_time)::timestamp
             as game_start_timestamp
         , end_time::timestamp as game_end_timestamp
@@ -97,7 +114,7 @@ with player_games as (
             as checkmate_pieces
 
 
-    from player_games
+    from pgn_sections
 )
 
 select *
@@ -0,0 +1,36 @@
+-- prep_game_moves stores each position as bitboards, they must decode to the piece placement of the replayed FEN
+with sampled as (
+    select
+        game_uuid
+        , player_username
+        , pgn
+    from {{ ref('prep_player_games') }}
+    -- the same 200 games on every run, a failing game cannot pass on a rerun
+    order by hash(game_uuid)
+    limit 200
+)
+
+, replayed as (
+    select
+        game_uuid
+        , player_username
+        , generate_subscripts(fens, 1) as game_move_index
+        , unnest(fens) as fen
+    from (
+        select
+            *
+            , pgn_to_fens_udf(pgn) as fens
+        from sampled
+    )
+)
+
+select
+    replayed.game_uuid
+    , replayed.game_move_index
+from replayed
+inner join {{ ref('prep_game_moves') }} as moves
+    on
+        replayed.game_uuid = moves.game_uuid
+        and replayed.player_username = moves.player_username
+        and replayed.game_move_index = moves.game_move_index
+where split(replayed.fen, ' ')[1] <> bitboards_to_fen_udf(moves.bitboards)
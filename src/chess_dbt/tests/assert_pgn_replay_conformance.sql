@@ -0,0 +1,75 @@
+-- pgn_to_fens_udf uses a movetext-only parser, it must replay exactly like chess.pgn.read_game.
+-- Games with promotions, castling or mates are checked against the reference replay, and so are
+-- the positions pgn_to_moves_udf stores for them.
+with games as (
+    select
+        game_uuid
+        , pgn
+    from {{ ref('prep_player_games') }}
+
+    where regexp_matches(pgn_moves, '=[QRBN]|O-O|#')
+)
+
+, sampled as (
+    select *
+    from games
+    -- the same 1000 games on every run, a failing game cannot pass on a rerun
+    order by hash(game_uuid)
+    limit 1000
+)
+
+-- Chess960 castling is encoded as the king taking its own rook, which can leave the
+-- rook's square empty once pushed (start positions 2, 6 and 9)
+, chess960_castling as (
+    select *
+    from (
+        values
+        ('chess960-sp2', '[Variant "Chess960"]
+[SetUp "1"]
+[FEN "bqnnrbkr/pppppppp/8/8/8/8/PPPPPPPP/BQNNRBKR w KQkq - 0 1"]
+
+1. Nc3 Nd6 2. Ne4 e6 3. Nc3 a5 4. g3 Ne4 5. f4 Nc6 6. d4 Bc5 7. h4 O-O *')
+        , ('chess960-sp6', '[Variant "Chess960"]
+[SetUp "1"]
+[FEN "qnbnrbkr/pppppppp/8/8/8/8/PPPPPPPP/QNBNRBKR w KQkq - 0 1"]
+
+1. b4 Nbc6 2. g3 g6 3. Bh3 Bg7 4. O-O *')
+        , ('chess960-sp9', '[Variant "Chess960"]
+[SetUp "1"]
+[FEN "qnnbbrkr/pppppppp/8/8/8/8/PPPPPPPP/QNNBBRKR w KQkq - 0 1"]
+
+1. f4 a5 2. h3 g6 3. Rf2 Na6 4. O-O *')
+    ) as fixtures (game_uuid, pgn)
+)
+
+, replayed as (
+    select
+        game_uuid
+        , pgn_to_fens_udf(pgn) as fens
+        , pgn_to_fens_reference_udf(pgn) as reference_fens
+        , pgn_to_moves_udf(pgn) as moves
+    from (
+        select * from sampled
+        union all
+        select * from chess960_castling
+    )
+)
+
+select game_uuid
+from replayed
+where fens <> reference_fens
+    or len(moves) <> len(reference_fens)
+
+union
+
+select game_uuid
+from (
+    select
+        game_uuid
+        , unnest(moves) as move
+        , unnest(reference_fens) as reference_fen
+    from replayed
+)
+where split(reference_fen, ' ')[1] <> bitboards_to_fen_udf(move.bitboards)
+    -- no move captures a piece of its own color, castling onto a rook included
+    or (upper(move.captured_piece) = move.captured_piece) = (upper(move.moved_piece) = move.moved_piece)
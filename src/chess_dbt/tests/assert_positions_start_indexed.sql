@@ -0,0 +1,12 @@
+-- Every game indexes its start position at ply 0, so a search on the initial board finds it
+select
+    games.game_uuid
+    , games.player_username
+from {{ ref('games') }} as games
+left join {{ ref('positions') }} as positions
+    on
+        games.game_uuid = positions.game_uuid
+        and games.player_username = positions.player_username
+        and positions.game_move_index = 0
+        and positions.position_hash = start_position_hash_udf(games.pgn)
+where positions.game_uuid is null
@@ -0,0 +1,24 @@
+-- prep_game_moves replays standard games from the TCN, it must reach the same positions as the PGN replay
+with games as (
+    select
+        game_uuid
+        , pgn
+        , tcn
+        , initial_setup
+    from {{ ref('prep_player_games') }}
+
+    where rules = 'chess'
+        and coalesce(tcn, '') <> ''
+)
+
+, sampled as (
+    select *
+    from games
+    -- the same 1000 games on every run, a failing game cannot pass on a rerun
+    order by hash(game_uuid)
+    limit 1000
+)
+
+select game_uuid
+from sampled
+where tcn_to_fens_udf(tcn, initial_setup) <> pgn_to_fens_udf(pgn)
@@ -1,15 +1,30 @@
 """A source loading player profiles and games from chess.com api"""
 
-from typing import Any, Callable, Dict, Iterator, List, Sequence
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Union
 import logging
+import time
 
 import dlt
+from dlt.common.libs.pyarrow import py_arrow_to_table_schema_columns
 from dlt.common.typing import TDataItem
 from dlt.sources import DltResource
 from dlt.sources.helpers import requests
 
-from .helpers import get_path_with_retry, get_url_with_retry
-from .data_contracts import PlayersGames
+from .helpers import (
+    configure_client,
+    games_to_arrow,
+    get_path_with_retry,
+    get_response_if_modified,
+    is_archive_closed,
+    iter_response_batches,
+)
+from .data_contracts import PLAYERS_GAMES_ARROW_SCHEMA, PlayersGames
+from .settings import (
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_REQUESTS_PER_SECOND,
+    DEFAULT_STREAM_BATCH_SIZE,
+    OFFICIAL_CHESS_API_URL,
+)
 
 # Create a logger
 logger = logging.getLogger('dlt')
@@ -24,24 +39,56 @@ handler = logging.FileHandler('data/dlt.log')
 logger.addHandler(handler)
 
 
+# Called with (username, archive url, number of games, seconds spent) once an archive is extracted
+ArchiveCallback = Callable[[str, str, int, float], None]
+# Called with (username, number of archives to extract) once the player's archive list is known
+ArchivesCallback = Callable[[str, int], None]
+
+
 @dlt.source(name="chess")
 def source(
-    username: str
+    username: Union[str, Sequence[str]],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    api_url: str = OFFICIAL_CHESS_API_URL,
+    stream_archives: bool = False,
+    batch_size: int = DEFAULT_STREAM_BATCH_SIZE,
+    on_archive: Optional[ArchiveCallback] = None,
+    arrow: bool = False,
+    on_archives: Optional[ArchivesCallback] = None,
 ) -> Sequence[DltResource]:
     """
     A dlt source for the chess.com api. It groups several resources (in this case chess.com API endpoints) containing
     various types of data: user profiles or chess match results
     Args:
-        players (List[str]): A list of the player usernames for which to get the data.
-        start_month (str, optional): Filters out all the matches happening before `start_month`. Defaults to None.
-        end_month (str, optional): Filters out all the matches happening after `end_month`. Defaults to None.
+        username (Union[str, Sequence[str]]): The player username, or a list of usernames, for which to get the data.
+            Players are fetched concurrently.
+        max_workers (int, optional): Maximum number of concurrent requests, also the size of the HTTP connection pool.
+            Archives are fetched by dlt's deferred workers, see `[extract] workers` in config.toml.
+        requests_per_second (float, optional): Maximum request rate per host. 0 disables the limit.
+        api_url (str, optional): Base url of the public API. Defaults to the official chess.com API.
+        stream_archives (bool, optional): Parse each monthly archive incrementally and yield its games in
+            batches of `batch_size`, so memory stays flat however large an archive is.
+        batch_size (int, optional): Games per batch when `stream_archives` is set.
+        on_archive (ArchiveCallback, optional): Called from the extract workers after each archive, e.g. to
+            report per player throughput.
+        arrow (bool, optional): Yield each page of games as a `pyarrow.Table` checked against the Arrow schema of
+            the contract instead of validating every game with pydantic. dlt then loads the tables as parquet.
+            Set `normalize.parquet_normalizer.add_dlt_id` and `add_dlt_load_id` so the rows get the dlt columns.
+        on_archives (ArchivesCallback, optional): Called with the number of archives to extract for each player,
+            with `on_archive` e.g. to report progress.
     Returns:
         Sequence[DltResource]: A sequence of resources that can be selected from including players_profiles,
         players_archives, players_games, players_online_status
     """
-    return (
-        players_games(username),
-    )
+    configure_client(max_workers, requests_per_second)
+    games = players_games(username, api_url, stream_archives, batch_size, on_archive, arrow, on_archives)
+    if arrow:
+        # the tables are checked against the Arrow schema when they are built,
+        # hinting its columns instead of the pydantic model drops the per game validation
+        games.apply_hints(columns=py_arrow_to_table_schema_columns(PLAYERS_GAMES_ARROW_SCHEMA))
+        games.validator = None
+    return (games,)
 
 
 @dlt.resource(
@@ -51,11 +98,12 @@ def source(
         "joined": {"data_type": "timestamp"},
     },
 )
-def players_profiles(username: str) -> TDataItem:
+def players_profiles(username: str, api_url: str = OFFICIAL_CHESS_API_URL) -> TDataItem:
     """
     Yields player profile for a given player usernames.
     Args:
         username (str): player username to retrieve profile for.
+        api_url (str, optional): Base url of the public API.
     Yields:
         TDataItem: Player profiles data.
     """
@@ -63,22 +111,23 @@ def players_profiles(username: str) -> TDataItem:
     # get archives in parallel by decorating the http request with defer
     @dlt.defer
     def _get_profile(username: str) -> TDataItem:
-        return get_path_with_retry(f"player/{username}")
+        return get_path_with_retry(f"player/{username}", api_url)
 
     yield _get_profile(username)
 
 
 @dlt.resource(write_disposition="replace", selected=False)
-def players_archives(username: str) -> Iterator[List[TDataItem]]:
+def players_archives(username: str, api_url: str = OFFICIAL_CHESS_API_URL) -> Iterator[List[TDataItem]]:
     """
     Yields url to game archives for a specified player username.
     Args:
         username: str: Player username to retrieve archives for.
+        api_url: str: Base url of the public API.
     Yields:
         List[TDataItem]: List of player archive data.
     """
 
-    data = get_path_with_retry(f"player/{username}/games/archives")
+    data = get_path_with_retry(f"player/{username}/games/archives", api_url)
     yield data.get("archives", [])
 
 
@@ -88,43 +137,123 @@ def players_archives(username: str) -> Iterator[List[TDataItem]]:
     columns=PlayersGames
 )
 def players_games(
-    username: str
+    username: Union[str, Sequence[str]],
+    api_url: str = OFFICIAL_CHESS_API_URL,
+    stream_archives: bool = False,
+    batch_size: int = DEFAULT_STREAM_BATCH_SIZE,
+    on_archive: Optional[ArchiveCallback] = None,
+    arrow: bool = False,
+    on_archives: Optional[ArchivesCallback] = None,
 ) -> Iterator[Callable[[], List[TDataItem]]]:
     """
     Yields player's `username` games.
     Args:
-        username: str: Player username to retrieve games for.
+        username: Union[str, Sequence[str]]: Player username, or list of usernames, to retrieve games for.
+        api_url: str: Base url of the public API.
+        stream_archives: bool: Stream each archive in batches of `batch_size` games instead of parsing it whole.
+        batch_size: int: Games per batch when streaming.
+        on_archive: ArchiveCallback: Called after each archive with its number of games and fetch time.
+        arrow: bool: Yield the games of each archive, or of each batch when streaming, as one Arrow table.
+        on_archives: ArchivesCallback: Called with the number of archives that will be extracted for each player.
     Yields:
         Iterator[Callable[[], List[TDataItem]]]: An iterator over callables that return a list of games for a player.
     """
 
     # get a list of already checked archives
     # from your point of view, the state is python dictionary that will have the same content the next time this function is called
-    checked_archives = dlt.current.resource_state().setdefault("archives", [])
-    # get player archives, note that you can call the resource like any other function and just iterate it like a list
-    archives = players_archives(username)
+    state = dlt.current.resource_state()
+    checked_archives = state.setdefault("archives", [])
+    # ETag/Last-Modified of archives whose month was still open when they were fetched
+    archive_validators = state.setdefault("archive_validators", {})
+    # a checked archive is never fetched again, drop the validators a previous run left for it
+    for url in checked_archives:
+        archive_validators.pop(url, None)
+    usernames = [username] if isinstance(username, str) else list(username)
+
+    def _remember(url: str, validators: Dict[str, str], is_closed: bool) -> None:
+        if is_closed:
+            archive_validators.pop(url, None)
+        else:
+            archive_validators[url] = validators
+
+    def _report(username: str, url: str, games: int, started: float) -> None:
+        if on_archive is not None:
+            on_archive(username, url, games, time.perf_counter() - started)
+
+    def _stream_archive(
+        response: requests.Response, username: str, url: str, validators: Dict[str, str], is_closed: bool, started: float
+    ) -> Iterator[List[TDataItem]]:
+        games = 0
+        for batch in iter_response_batches(response, "games", batch_size):
+            games += len(batch)
+            yield games_to_arrow(batch) if arrow else batch
+        # only keep the validators once every game of the archive went through
+        _remember(url, validators, is_closed)
+        _report(username, url, games, started)
 
     # get archives in parallel by decorating the http request with defer
     @dlt.defer
-    def _get_archive(url: str) -> List[TDataItem]:
+    def _get_archive(
+        username: str, url: str, is_closed: bool, validators: Dict[str, str]
+    ) -> Union[List[TDataItem], Iterator[List[TDataItem]]]:
         # logger.warning(f"Getting archive from {url}")
+        started = time.perf_counter()
         try:
-            games = get_url_with_retry(url).get("games", [])
-            return games  # type: ignore
+            response, validators = get_response_if_modified(url, validators, stream=stream_archives)
         except requests.HTTPError as http_err:
             # sometimes archives are not available and the error seems to be permanent
             if http_err.response.status_code == 404:
+                _report(username, url, 0, started)
                 return []
             raise
 
-    # enumerate the archives
-    for url in archives:
-        # the `url` format is https://api.chess.com/pub/player/{username}/games/{YYYY}/{MM}
-        
-        # do not download archive again
-        if url in checked_archives:
-            continue
-        checked_archives.append(url)
-        
-        # get the filtered archive
-        yield _get_archive(url)
\ No newline at end of file
+        # 304 Not Modified, nothing new since the last run
+        if response is None:
+            _report(username, url, 0, started)
+            return []
+
+        # dlt iterates a returned generator as a new source, so the body is parsed batch by batch
+        if stream_archives:
+            return _stream_archive(response, username, url, validators, is_closed, started)
+
+        _remember(url, validators, is_closed)
+        games = response.json().get("games", [])
+        _report(username, url, len(games), started)
+        if arrow and games:
+            return games_to_arrow(games)
+        return games  # type: ignore
+
+    def _iter_archives(username: str, archives: List[str]) -> Iterator[Callable[[], List[TDataItem]]]:
+        # enumerate the archives
+        for url in archives:
+            # the `url` format is https://api.chess.com/pub/player/{username}/games/{YYYY}/{MM}
+
+            # do not download archive again
+            if url in checked_archives:
+                continue
+
+            # archives of past months are final, the open month is refreshed with a conditional request
+            # on every run and games already loaded are deduplicated by the merge on `uuid`
+            is_closed = is_archive_closed(url)
+            validators = archive_validators.get(url, {})
+            if is_closed:
+                checked_archives.append(url)
+                # the last fetch of the month still sends its validators, whatever its answer
+                # (200, 304 or 404) the state no longer keeps them
+                archive_validators.pop(url, None)
+
+            # get the filtered archive
+            yield _get_archive(username, url, is_closed, validators)
+
+    # list the archives of every player in parallel too, the returned generator is added as a new
+    # source by dlt and yields the deferred archive fetches
+    @dlt.defer
+    def _get_player_archives(username: str) -> Iterator[Callable[[], List[TDataItem]]]:
+        # the `players_archives` resource cannot be iterated off the main thread, call its endpoint directly
+        archives = get_path_with_retry(f"player/{username}/games/archives", api_url).get("archives", [])
+        if on_archives is not None:
+            on_archives(username, sum(url not in checked_archives for url in archives))
+        return _iter_archives(username, archives)
+
+    for username in usernames:
+        yield _get_player_archives(username)
@@ -1,8 +1,10 @@
-from typing import Optional
+from typing import List, Optional, Tuple, Type, get_args
 from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import ClassVar
+import pyarrow as pa
 from dlt.common.libs.pydantic import DltConfig
+from dlt.common.normalizers.naming.snake_case import NamingConvention
 
 
 class Accuracies(BaseModel):
@@ -34,3 +36,43 @@ class PlayersGamesBase(BaseModel):
 
 class PlayersGames(PlayersGamesBase):
   dlt_config: ClassVar[DltConfig] = {"skip_nested_types": True}
+
+
+# Arrow types of the contract fields, timestamps are read from epoch seconds
+ARROW_TYPES = {
+    str: pa.string(),
+    int: pa.int64(),
+    float: pa.float64(),
+    bool: pa.bool_(),
+    datetime: pa.timestamp("us", tz="UTC"),
+}
+
+_naming = NamingConvention()
+
+
+def arrow_fields(
+    model: Type[BaseModel], path: Tuple[str, ...] = (), nullable: bool = False
+) -> List[Tuple[Tuple[str, ...], pa.Field]]:
+    """
+    Flattens `model` into (key path in the API json, Arrow field) pairs. Nested models become
+    columns named the way dlt normalizes nested json, e.g. `white.@id` is `white__aid`, and
+    every field of an optional model is nullable.
+    """
+    fields = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        optional = type(None) in get_args(annotation)
+        if optional:
+            annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+        key_path = path + (field.alias or name,)
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            fields.extend(arrow_fields(annotation, key_path, nullable or optional))
+        else:
+            column = _naming.normalize_path(_naming.PATH_SEPARATOR.join(key_path))
+            fields.append((key_path, pa.field(column, ARROW_TYPES[annotation], nullable=nullable or optional)))
+    return fields
+
+
+# The games contract as the Arrow schema of the columnar load path
+PLAYERS_GAMES_ARROW_FIELDS = arrow_fields(PlayersGamesBase)
+PLAYERS_GAMES_ARROW_SCHEMA = pa.schema([field for _, field in PLAYERS_GAMES_ARROW_FIELDS])
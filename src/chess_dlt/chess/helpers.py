@@ -1,18 +1,255 @@
 """Chess source helpers"""
 
-from dlt.common.typing import StrAny
+import codecs
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import pyarrow as pa
+from dlt.common.typing import StrAny, TDataItem
 from dlt.sources.helpers import requests
+from dlt.sources.helpers.requests import Client
+
+from .data_contracts import PLAYERS_GAMES_ARROW_FIELDS
+from .settings import (
+    ARCHIVE_GRACE_PERIOD_HOURS,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_REQUESTS_PER_SECOND,
+    OFFICIAL_CHESS_API_URL,
+    REQUEST_BACKOFF_FACTOR,
+    REQUEST_MAX_ATTEMPTS,
+    REQUEST_MAX_RETRY_DELAY,
+    REQUEST_TIMEOUT,
+    RETRY_STATUS_CODES,
+    STREAM_CHUNK_SIZE,
+)
+
+
+class RateLimiter:
+    """Spaces out requests so that at most `requests_per_second` start per host. 0 disables the limit."""
+
+    def __init__(self, requests_per_second: float) -> None:
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ChessApiClient:
+    """
+    HTTP client shared by every request of the source. The connection pool is sized to
+    `max_workers` so keep-alive connections are reused across the deferred archive fetches,
+    and at most `max_workers` requests are in flight at once. 429/5xx responses and
+    connection errors are retried with exponential backoff, honouring `Retry-After` but
+    never waiting more than REQUEST_MAX_RETRY_DELAY. Every attempt goes through the rate limiter.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+    ) -> None:
+        self.max_workers = max_workers
+        self.requests_per_second = requests_per_second
+        # dlt keeps one session per thread on top of a single pooled adapter,
+        # retries are handled below so they are rate limited too
+        self.client = Client(
+            request_timeout=REQUEST_TIMEOUT,
+            max_connections=max_workers,
+            raise_for_status=False,
+            request_max_attempts=1,
+        )
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self._slots = threading.BoundedSemaphore(max_workers)
 
-from .settings import OFFICIAL_CHESS_API_URL
+    @staticmethod
+    def _backoff(attempt: int, response: Optional[requests.Response]) -> float:
+        delay = REQUEST_BACKOFF_FACTOR * 2**attempt
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.strip().isdigit():
+            delay = max(delay, int(retry_after))
+        return min(delay, REQUEST_MAX_RETRY_DELAY)
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, stream: bool = False) -> requests.Response:
+        for attempt in range(REQUEST_MAX_ATTEMPTS):
+            response = None
+            try:
+                with self._slots:
+                    self.rate_limiter.wait(url)
+                    response = self.client.get(url, headers=headers, stream=stream)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == REQUEST_MAX_ATTEMPTS - 1:
+                    raise
+            if attempt < REQUEST_MAX_ATTEMPTS - 1:
+                time.sleep(self._backoff(attempt, response))
+
+        response.raise_for_status()
+        return response
+
+
+_client = ChessApiClient()
+
+
+def configure_client(
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+) -> ChessApiClient:
+    """Replaces the shared client if the settings changed and returns it"""
+    global _client
+    if (_client.max_workers, _client.requests_per_second) != (max_workers, requests_per_second):
+        _client = ChessApiClient(max_workers, requests_per_second)
+    return _client
 
 
 def get_url_with_retry(url: str) -> StrAny:
-    r = requests.get(url)
+    r = _client.get(url)
     return r.json()  # type: ignore
 
 
-def get_path_with_retry(path: str) -> StrAny:
-    return get_url_with_retry(f"{OFFICIAL_CHESS_API_URL}{path}")
+def get_path_with_retry(path: str, api_url: str = OFFICIAL_CHESS_API_URL) -> StrAny:
+    return get_url_with_retry(f"{api_url}{path}")
+
+
+def get_response_if_modified(
+    url: str, validators: Dict[str, str], stream: bool = False
+) -> Tuple[Optional[requests.Response], Dict[str, str]]:
+    """
+    Conditional GET using the `etag`/`last_modified` validators of a previous response.
+    Returns the response and its validators, or `None` and the old validators on 304 Not Modified.
+    """
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    r = _client.get(url, headers=headers, stream=stream)
+    if r.status_code == 304:
+        r.close()
+        return None, validators
+
+    new_validators = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+    return r, {key: value for key, value in new_validators.items() if value}
+
+
+def iter_json_array(chunks: Iterable[str], key: str) -> Iterator[Any]:
+    """
+    Yields the items of the `key` array of a JSON object such as `{"games": [...]}` one at a time,
+    reading `chunks` of text only as far as needed. At most one chunk and one item are buffered.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+
+    buffer = ""
+    while True:
+        match = array_start.search(buffer)
+        if match:
+            break
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        buffer += chunk
+
+    buffer, pos = buffer[match.end():], 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # the item is split across chunks
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield item
+
+
+def iter_response_batches(response: requests.Response, key: str, batch_size: int) -> Iterator[List[Any]]:
+    """Streams the `key` array of a json `response` in lists of at most `batch_size` items"""
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    try:
+        chunks = (utf8.decode(chunk) for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+        batch = []
+        for item in iter_json_array(chunks, key):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        response.close()
+
+
+def games_to_arrow(
+    games: List[TDataItem], fields: List[Tuple[Tuple[str, ...], pa.Field]] = PLAYERS_GAMES_ARROW_FIELDS
+) -> pa.Table:
+    """
+    Converts a page of games into an Arrow table with one column per contract field, nested
+    objects flattened. Values of the wrong type and missing required fields raise a ValueError,
+    fields outside the contract are dropped like the pydantic models do.
+    """
+    # the values at each key path, nested objects are looked up once for all of their fields
+    values: Dict[Tuple[str, ...], List[Any]] = {(): games}
+
+    def _values(path: Tuple[str, ...]) -> List[Any]:
+        if path not in values:
+            values[path] = [(item or {}).get(path[-1]) for item in _values(path[:-1])]
+        return values[path]
+
+    arrays = []
+    for path, field in fields:
+        try:
+            if pa.types.is_timestamp(field.type):
+                # the API has epoch seconds
+                array = pa.array(_values(path), pa.int64()).cast(pa.timestamp("s", tz="UTC")).cast(field.type)
+            else:
+                array = pa.array(_values(path), field.type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ValueError(f"Column `{field.name}` does not match the games contract: {e}") from e
+        if not field.nullable and array.null_count:
+            raise ValueError(f"Column `{field.name}` is required but missing from {array.null_count} games")
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, schema=pa.schema([field for _, field in fields]))
+
+
+_ARCHIVE_MONTH_RE = re.compile(r"/(\d{4})/(\d{2})/?$")
+
+
+def is_archive_closed(url: str, now: Optional[datetime] = None) -> bool:
+    """
+    Whether the monthly archive at `url` (.../games/{YYYY}/{MM}) can no longer change,
+    i.e. its month ended more than ARCHIVE_GRACE_PERIOD_HOURS ago
+    """
+    match = _ARCHIVE_MONTH_RE.search(url)
+    if not match:
+        return True
+    year, month = int(match.group(1)), int(match.group(2))
+    month_end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return now >= month_end + timedelta(hours=ARCHIVE_GRACE_PERIOD_HOURS)
 
 
 def validate_month_string(string: str) -> None:
@@ -2,3 +2,20 @@
 
 OFFICIAL_CHESS_API_URL = "https://api.chess.com/pub/"
 UNOFFICIAL_CHESS_API_URL = "https://www.chess.com/callback/"
+
+# HTTP client
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+REQUEST_TIMEOUT = 30
+REQUEST_MAX_ATTEMPTS = 5
+REQUEST_BACKOFF_FACTOR = 1
+REQUEST_MAX_RETRY_DELAY = 30
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# A monthly archive is final once this long has passed since the month ended (UTC).
+# Until then it is fetched again on every run with conditional requests
+ARCHIVE_GRACE_PERIOD_HOURS = 24
+
+# Streaming of monthly archives
+DEFAULT_STREAM_BATCH_SIZE = 500
+STREAM_CHUNK_SIZE = 64 * 1024
@@ -0,0 +1,504 @@
+"""
+Loads chess.com games for one or many players into DuckDB and builds the dbt models over them.
+
+Used by the "Get Data" button of the dashboard and as a headless batch entry point:
+
+    python src/chess_pipeline.py magnuscarlsen hikaru
+    python src/chess_pipeline.py --file usernames.txt --max-workers 16 --requests-per-second 20
+    python src/chess_pipeline.py --arrow magnuscarlsen
+
+By default every player has their own warehouse, `data/players/<username>/chess.duckdb`, so players
+are refreshed in parallel processes instead of queueing for the single writer of a shared file.
+Set CHESS_WAREHOUSE_LAYOUT=single to keep every player in `data/chess.duckdb`.
+
+Every refresh writes its metrics and trace to `data/metrics` (see metrics.py). To profile a run:
+
+    python src/chess_pipeline.py --profile refresh.prof magnuscarlsen
+    py-spy record --subprocesses -o refresh.svg -- python src/chess_pipeline.py magnuscarlsen
+
+py-spy also samples the threads DuckDB runs the UDFs on, which cProfile does not see.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock, RLock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import dlt
+import duckdb
+from dlt.common.pipeline import LoadInfo
+from dbt.cli.main import dbtRunner, dbtRunnerResult
+from dbt.contracts.graph.manifest import Manifest
+from dbt_common.events.base_types import EventMsg
+
+from chess_dlt.chess import source
+from chess_dlt.chess.settings import DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND, OFFICIAL_CHESS_API_URL
+from metrics import RefreshMetrics, profiled
+
+DATA_FOLDER = 'data'
+DB_PATH = f'{DATA_FOLDER}/chess.duckdb'
+
+# 'sharded' keeps each player in their own DuckDB file under SHARDS_FOLDER, 'single' everyone in DB_PATH
+WAREHOUSE_LAYOUTS = ('sharded', 'single')
+WAREHOUSE_LAYOUT = os.environ.get('CHESS_WAREHOUSE_LAYOUT', 'sharded')
+if WAREHOUSE_LAYOUT not in WAREHOUSE_LAYOUTS:
+    raise ValueError(f"CHESS_WAREHOUSE_LAYOUT must be one of {WAREHOUSE_LAYOUTS}, got {WAREHOUSE_LAYOUT}")
+SHARDS_FOLDER = f'{DATA_FOLDER}/players'
+PIPELINE_NAME = 'chess_pipeline'
+
+# chess.com usernames, the name of a player's shard
+_USERNAME_RE = re.compile(r'^[a-z0-9_-]+$')
+
+DBT_PROJECT_DIR = 'src/chess_dbt'
+DBT_PROFILES_DIR = 'src/chess_dbt/profiles'
+DBT_TARGET = 'prod'
+DBT_ARGS = ['--project-dir', DBT_PROJECT_DIR, '--profiles-dir', DBT_PROFILES_DIR, '--target', DBT_TARGET]
+
+# Called with the name of each phase of a refresh as it starts, e.g. 'dlt_extract' or 'dbt_build'
+PhaseCallback = Callable[[str], None]
+
+# Runner holding the parsed manifest, shared by every build of the process
+_dbt_runner: Optional[dbtRunner] = None
+_dbt_lock = RLock()
+
+
+@dataclass
+class PlayerStats:
+    """Extract throughput of a single player, summed over the player's archives"""
+    username: str
+    archives: int = 0
+    games: int = 0
+    seconds: float = 0.0
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class RefreshResult:
+    """Outcome of loading and building the players of one warehouse, picklable so it can come back from a worker"""
+    db_path: str
+    load_info: str
+    stats: Dict[str, PlayerStats]
+    timings: Dict[str, float] = field(default_factory=dict)
+    dbt_error: Optional[str] = None
+
+    @property
+    def success(self) -> bool:
+        return self.dbt_error is None
+
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], phase: str, on_phase: Optional[PhaseCallback] = None) -> Iterator[None]:
+    """Adds the seconds spent in the block to `timings[phase]`"""
+    if on_phase is not None:
+        on_phase(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+def normalize_usernames(usernames: Iterable[str]) -> List[str]:
+    """Lower cases and de-duplicates usernames, keeping their order and dropping blanks"""
+    result = {}
+    for username in usernames:
+        username = username.strip().lower()
+        if username:
+            result[username] = None
+    return list(result)
+
+
+def read_usernames(path: str) -> List[str]:
+    """Reads one username per line, ignoring blank lines and `#` comments"""
+    with open(path) as f:
+        return [line.split('#', 1)[0].strip() for line in f]
+
+
+def warehouse_path(username: str) -> str:
+    """
+    Routes a player to their warehouse: their shard in the sharded layout, DB_PATH otherwise.
+    Raises a ValueError for names that are not chess.com usernames.
+    """
+    if WAREHOUSE_LAYOUT == 'single':
+        return DB_PATH
+    username = username.strip().lower()
+    if not _USERNAME_RE.match(username):
+        raise ValueError(f"Not a chess.com username: {username!r}")
+    # every warehouse file is named like DB_PATH, dbt names the database after it and the
+    # manifest parsed once serves the builds of any warehouse
+    return f'{SHARDS_FOLDER}/{username}/{os.path.basename(DB_PATH)}'
+
+
+def group_by_warehouse(usernames: List[str]) -> Dict[str, List[str]]:
+    """The players of each warehouse, a single group holding everyone in the single layout"""
+    groups: Dict[str, List[str]] = {}
+    for username in usernames:
+        groups.setdefault(warehouse_path(username), []).append(username)
+    return groups
+
+
+def _pipeline_name(db_path: str) -> str:
+    # the dlt state, e.g. the archives already loaded, belongs to the warehouse it was loaded into
+    if db_path == DB_PATH:
+        return PIPELINE_NAME
+    return f"{PIPELINE_NAME}_{os.path.basename(os.path.dirname(db_path))}"
+
+
+def staging_path(db_path: str) -> str:
+    """Where a staged refresh writes its copy of the warehouse at `db_path`, named like it for dbt"""
+    return os.path.join(os.path.dirname(db_path), '.staging', os.path.basename(db_path))
+
+
+def stage_warehouse(db_path: str) -> str:
+    """
+    Returns the path of a copy of the warehouse at `db_path` for a refresh to write to, see
+    `publish_warehouse`. Readers of `db_path` never meet the write lock of the refresh.
+
+    A refresh that failed leaves its copy behind with whatever dlt loaded into it, as the dlt
+    state already counts those archives as loaded. The next refresh writes to that copy
+    again, and its dbt build picks up those loads too. A copy older than the warehouse, which
+    another writer changed since, is replaced by a new one.
+
+    A new copy reads and writes the whole file once, linear in the size of the warehouse:
+    about 0.1s for the 158 MB of 12k games (benchmarks.bench_pipeline, 24 months of 500
+    games, 1 core), whose first dbt build took 86s.
+    """
+    path = staging_path(db_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    published = [db_path + suffix for suffix in ('', '.wal') if os.path.exists(db_path + suffix)]
+    if os.path.exists(path) and all(os.path.getmtime(path) >= os.path.getmtime(p) for p in published):
+        return path
+
+    for suffix in ('', '.wal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    # the write-ahead log first, the copy is only taken up again once the file itself is whole
+    for suffix in ('.wal', ''):
+        if os.path.exists(db_path + suffix):
+            shutil.copyfile(db_path + suffix, f'{path}{suffix}.tmp')
+            os.replace(f'{path}{suffix}.tmp', path + suffix)
+    return path
+
+
+def publish_warehouse(db_path: str) -> None:
+    """
+    Replaces the warehouse at `db_path` with the copy of `stage_warehouse` in a single rename,
+    readers see either the previous warehouse or the whole refresh
+    """
+    path = staging_path(db_path)
+    # folds the write-ahead log into the file, the rename moves a single file
+    duckdb.connect(path).execute('checkpoint').close()
+    if os.path.exists(db_path + '.wal'):
+        os.remove(db_path + '.wal')
+    os.replace(path, db_path)
+
+
+def load_players(
+    usernames: List[str],
+    db_path: str = DB_PATH,
+    timings: Optional[Dict[str, float]] = None,
+    on_phase: Optional[PhaseCallback] = None,
+    pipeline_name: Optional[str] = None,
+    **source_kwargs: Any,
+) -> Tuple[LoadInfo, Dict[str, PlayerStats]]:
+    """
+    Fetches the games of every player in `usernames` concurrently through the `chess` source
+    and loads them into `db_path` in a single dlt run.
+    Args:
+        usernames (List[str]): Players to load.
+        db_path (str, optional): DuckDB database to load into, use `warehouse_path` to route players.
+        timings (Dict[str, float], optional): Receives the seconds spent in the dlt extract, normalize and load steps.
+        on_phase (PhaseCallback, optional): Called as each of the steps starts.
+        pipeline_name (str, optional): The dlt pipeline, by default the one of `db_path`.
+        source_kwargs: Passed on to the `chess` source, e.g. `max_workers`, `requests_per_second` or `arrow`.
+            An `on_archive` callback is called after the stats of the archive are counted.
+    Returns:
+        Tuple[LoadInfo, Dict[str, PlayerStats]]: The dlt load info and the extract stats of each player.
+    """
+    stats = {username: PlayerStats(username) for username in usernames}
+    lock = Lock()
+    forward_archive = source_kwargs.pop('on_archive', None)
+
+    def on_archive(username: str, url: str, games: int, seconds: float) -> None:
+        with lock:
+            player = stats[username]
+            player.archives += 1
+            player.games += games
+            player.seconds += seconds
+        if forward_archive is not None:
+            forward_archive(username, url, games, seconds)
+
+    if source_kwargs.get('arrow'):
+        # Arrow tables only get the dlt columns the models read when asked, e.g. `_dlt_load_id`
+        dlt.config["normalize.parquet_normalizer.add_dlt_id"] = True
+        dlt.config["normalize.parquet_normalizer.add_dlt_load_id"] = True
+
+    # configure the pipeline: provide the destination and dataset name to which the data should go
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    pipeline = dlt.pipeline(
+        pipeline_name=pipeline_name or _pipeline_name(db_path),
+        destination=dlt.destinations.duckdb(db_path),
+        dataset_name="chess_data_raw",
+    )
+    # the steps of `pipeline.run`, run one by one to time them
+    with timed(timings, 'dlt_extract', on_phase):
+        pipeline.extract(source(username=usernames, on_archive=on_archive, **source_kwargs))
+    with timed(timings, 'dlt_normalize', on_phase):
+        pipeline.normalize()
+    with timed(timings, 'dlt_load', on_phase):
+        info = pipeline.load()
+    return info, stats
+
+
+def get_dbt_runner(timings: Optional[Dict[str, float]] = None, on_phase: Optional[PhaseCallback] = None) -> dbtRunner:
+    """
+    Returns a dbt runner that reuses the parsed manifest of the project across builds. The first
+    call checks the connection and parses the project, with partial parsing reusing the previous
+    parse kept on disk.
+    """
+    global _dbt_runner
+    with _dbt_lock:
+        if _dbt_runner is None:
+            with timed(timings, 'dbt_parse', on_phase):
+                dbt = dbtRunner()
+                res: dbtRunnerResult = dbt.invoke(['debug', '--connection'] + DBT_ARGS)
+                if not res.success:
+                    raise RuntimeError(f"dbt cannot connect to {DBT_TARGET}: {res.exception or 'see the dbt logs'}")
+
+                res = dbt.invoke(['parse'] + DBT_ARGS)
+                if not res.success:
+                    raise RuntimeError(f"dbt parse failed: {res.exception or 'see the dbt logs'}")
+                manifest: Manifest = res.result
+                _dbt_runner = dbtRunner(manifest=manifest)
+        return _dbt_runner
+
+
+def reset_dbt_runner() -> None:
+    """Drops the pooled runner, the next build parses the project again"""
+    global _dbt_runner
+    with _dbt_lock:
+        _dbt_runner = None
+
+
+def build_models(
+    usernames: List[str],
+    timings: Optional[Dict[str, float]] = None,
+    db_path: str = DB_PATH,
+    on_phase: Optional[PhaseCallback] = None,
+    callbacks: Optional[List[Callable[[EventMsg], None]]] = None,
+) -> dbtRunnerResult:
+    """
+    Runs a single `dbt build` over every player in `usernames`, in the warehouse at `db_path`.
+    `callbacks` receive the dbt events of the build, e.g. `LogStartLine` as each node starts.
+    """
+    # model SQL is rendered at execution time, so the vars do not require a new parse
+    json_str = json.dumps({"usernames": usernames})
+    args = ['--vars', json_str]
+
+    build = ["build"] + DBT_ARGS + args
+    with _dbt_lock:
+        # the profile is rendered on every invocation, its `path` reads CHESS_DB_PATH
+        os.environ['CHESS_DB_PATH'] = db_path
+        dbt = get_dbt_runner(timings, on_phase)
+        dbt.callbacks = callbacks or []
+        try:
+            with timed(timings, 'dbt_build', on_phase):
+                return dbt.invoke(build)
+        finally:
+            dbt.callbacks = []
+
+
+def refresh_warehouse(
+    db_path: str,
+    usernames: List[str],
+    build: bool = True,
+    on_phase: Optional[PhaseCallback] = None,
+    dbt_callbacks: Optional[List[Callable[[EventMsg], None]]] = None,
+    staged: bool = False,
+    **source_kwargs: Any,
+) -> RefreshResult:
+    """
+    Loads the games of `usernames` into the warehouse at `db_path` and builds its models. The
+    metrics and the trace of the refresh go to the metrics folder, see metrics.py.
+    With `staged`, the refresh writes a copy of the warehouse that replaces it once the dbt build
+    succeeded, see `stage_warehouse`, so the warehouse stays readable meanwhile and readers never
+    see the models of a failed build.
+    """
+    timings: Dict[str, float] = {}
+    metrics = RefreshMetrics(db_path, _pipeline_name(db_path))
+    forward_phase = on_phase
+    forward_archive = source_kwargs.pop('on_archive', None)
+
+    def on_phase(phase: str) -> None:
+        metrics.on_phase(phase)
+        if forward_phase is not None:
+            forward_phase(phase)
+
+    def on_archive(username: str, url: str, games: int, seconds: float) -> None:
+        metrics.on_archive(username, url, games, seconds)
+        if forward_archive is not None:
+            forward_archive(username, url, games, seconds)
+
+    error = None
+    try:
+        build_path = stage_warehouse(db_path) if staged else db_path
+        info, stats = load_players(
+            usernames, build_path, timings, on_phase, _pipeline_name(db_path), on_archive=on_archive, **source_kwargs
+        )
+        result = RefreshResult(db_path, str(info), stats, timings)
+        if build:
+            with metrics.udf_calls():
+                res = build_models(usernames, timings, build_path, on_phase, dbt_callbacks)
+            metrics.add_dbt_result(res)
+            if not res.success:
+                result.dbt_error = error = str(res.exception or 'see the dbt logs')
+        if staged and error is None:
+            publish_warehouse(db_path)
+        return result
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        metrics.add_timings(timings)
+        metrics.write(error)
+
+
+def _init_refresh_worker(slots: Any, processes: int) -> None:
+    # builds of concurrent workers must not share dbt's target folder, a worker keeps its own
+    # across refreshes so partial parsing still applies
+    slot = slots.get()
+    os.environ['DBT_TARGET_PATH'] = f'target/worker_{slot}'
+    os.environ['DBT_LOG_PATH'] = f'{DBT_PROJECT_DIR}/logs/worker_{slot}'
+    if processes > 1:
+        # the cores are split between the workers, otherwise the replay pool of every worker's
+        # build would start a process per core (see `replay_workers` in profiles.yml)
+        os.environ['CHESS_REPLAY_WORKERS'] = str(max(1, (os.cpu_count() or 1) // processes))
+
+
+def start_refresh_pool(processes: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Worker processes running `refresh_warehouse`, one warehouse at a time each. Defaults to a
+    worker per core, but a single one in the single layout as DuckDB allows only one writer.
+    With several workers, each replays moves on its share of the cores.
+    """
+    if WAREHOUSE_LAYOUT == 'single':
+        processes = 1
+    processes = processes or os.cpu_count() or 1
+    # spawned, forking a process running dlt, dbt or DuckDB threads is not safe
+    context = multiprocessing.get_context('spawn')
+    slots = context.Queue()
+    for slot in range(processes):
+        slots.put(slot)
+    return ProcessPoolExecutor(
+        processes, mp_context=context, initializer=_init_refresh_worker, initargs=(slots, processes)
+    )
+
+
+def refresh_players(
+    usernames: List[str], processes: Optional[int] = None, build: bool = True, **source_kwargs: Any
+) -> List[RefreshResult]:
+    """
+    Loads and builds every player in `usernames`, the warehouses in parallel processes. Each
+    warehouse is a single dlt run and a single dbt build over its players.
+    """
+    groups = group_by_warehouse(usernames)
+    processes = min(processes or os.cpu_count() or 1, len(groups))
+    if processes <= 1:
+        return [refresh_warehouse(db_path, players, build, **source_kwargs) for db_path, players in groups.items()]
+
+    # the workers share the request rate to the API
+    requests_per_second = source_kwargs.get('requests_per_second', DEFAULT_REQUESTS_PER_SECOND)
+    source_kwargs['requests_per_second'] = requests_per_second / processes
+    with start_refresh_pool(processes) as pool:
+        futures = [
+            pool.submit(refresh_warehouse, db_path, players, build, **source_kwargs)
+            for db_path, players in groups.items()
+        ]
+        return [future.result() for future in futures]
+
+
+def print_report(stats: Dict[str, PlayerStats], timings: Dict[str, float], elapsed: Optional[float] = None) -> None:
+    print(f"{'username':>24} {'archives':>9} {'games':>8} {'seconds':>9} {'games/s':>9}")
+    for player in stats.values():
+        print(f"{player.username:>24} {player.archives:>9} {player.games:>8} {player.seconds:>9.2f} {player.games_per_second:>9.1f}")
+
+    games = sum(player.games for player in stats.values())
+    print()
+    print(f"players: {len(stats)}, games: {games}")
+    for phase, seconds in timings.items():
+        print(f"{phase:>14}: {seconds:>8.2f}s ({games / seconds if seconds else 0:.1f} games/s)")
+    total = sum(timings.values())
+    print(f"{'total':>14}: {total:>8.2f}s ({games / total if total else 0:.1f} games/s)")
+    if elapsed is not None:
+        # the phases of warehouses refreshed in parallel overlap
+        print(f"{'elapsed':>14}: {elapsed:>8.2f}s ({games / elapsed if elapsed else 0:.1f} games/s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load chess.com games for many players and build the dbt models")
+    parser.add_argument("usernames", nargs="*", help="chess.com usernames")
+    parser.add_argument("--file", help="file with one username per line")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="concurrent requests")
+    parser.add_argument("--requests-per-second", type=float, default=DEFAULT_REQUESTS_PER_SECOND)
+    parser.add_argument("--api-url", default=OFFICIAL_CHESS_API_URL)
+    parser.add_argument("--stream", action="store_true", help="stream large archives in batches")
+    parser.add_argument("--arrow", action="store_true", help="load the games as Arrow tables, skipping pydantic")
+    parser.add_argument("--processes", type=int, default=None, help="warehouses refreshed in parallel, defaults to the cores")
+    parser.add_argument("--skip-dbt", action="store_true", help="only extract and load")
+    parser.add_argument(
+        "--profile", metavar="PATH",
+        help="write a cProfile of the run to PATH, the warehouses are then refreshed in this process",
+    )
+    args = parser.parse_args()
+
+    usernames = normalize_usernames(args.usernames + (read_usernames(args.file) if args.file else []))
+    if not usernames:
+        parser.error("no usernames given")
+
+    try:
+        group_by_warehouse(usernames)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    with profiled(args.profile):
+        results = refresh_players(
+            usernames,
+            # the profiler only sees this process
+            processes=1 if args.profile else args.processes,
+            build=not args.skip_dbt,
+            max_workers=args.max_workers,
+            requests_per_second=args.requests_per_second,
+            api_url=args.api_url,
+            stream_archives=args.stream,
+            arrow=args.arrow,
+        )
+    elapsed = time.perf_counter() - start
+
+    stats: Dict[str, PlayerStats] = {}
+    timings: Dict[str, float] = {}
+    for result in results:
+        print(result.load_info)
+        if not result.success:
+            raise SystemExit(f"dbt build of {result.db_path} failed: {result.dbt_error}")
+        stats.update(result.stats)
+        for phase, seconds in result.timings.items():
+            timings[phase] = timings.get(phase, 0.0) + seconds
+
+    print_report(stats, timings, elapsed if len(results) > 1 else None)
+
+
+if __name__ == "__main__":
+    main()
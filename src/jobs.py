@@ -0,0 +1,240 @@
+"""
+Local queue of refresh jobs, run outside of the Streamlit script thread.
+
+A job loads a player's games and builds their models in a worker process of the refresh pool
+(see `start_refresh_pool` in chess_pipeline.py). The worker reports its progress through a
+managed queue: the archives fetched out of the archives to fetch, the games replayed by the move
+UDFs and the dbt node running. A thread of the dashboard process applies the reports to the job,
+which every session polls with `JobQueue.get`. A player has at most one active job, asking again
+while it runs returns that job.
+
+A job writes a copy of the player's warehouse and swaps it in once its dbt build succeeded
+(`stage_warehouse` in chess_pipeline.py). The dashboard keeps reading the previous data during the
+refresh instead of failing on the job's write lock, and after a failed one.
+"""
+
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional
+
+from dbt_common.events.base_types import EventMsg
+
+from chess_pipeline import RefreshResult, refresh_warehouse, start_refresh_pool, warehouse_path
+
+# Logger of the games replayed by the move UDFs in my_custom_functions.py
+REPLAY_LOGGER = 'chess_dbt.replay'
+
+# Share of the progress bar taken by each phase, the dbt build gets the rest
+PHASE_PROGRESS = {'dlt_extract': 0.0, 'dlt_normalize': 0.4, 'dlt_load': 0.45, 'dbt_parse': 0.5, 'dbt_build': 0.5}
+
+
+@dataclass
+class Job:
+    """Status of a refresh of one player, updated from the worker's reports"""
+    id: str
+    username: str
+    # queued, running, done or failed
+    state: str = 'queued'
+    phase: Optional[str] = None
+    archives_total: Optional[int] = None
+    archives_done: int = 0
+    games_fetched: int = 0
+    games_replayed: int = 0
+    models_total: Optional[int] = None
+    models_done: int = 0
+    current_model: Optional[str] = None
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.state in ('queued', 'running')
+
+    @property
+    def progress(self) -> float:
+        """Rough share of the job done, between 0 and 1"""
+        if not self.is_active:
+            return 1.0
+        if self.phase is None:
+            return 0.0
+        if self.phase == 'dbt_build':
+            return 0.5 + 0.5 * self.models_done / self.models_total if self.models_total else 0.5
+        if self.phase == 'dlt_extract' and self.archives_total:
+            return PHASE_PROGRESS['dlt_normalize'] * self.archives_done / self.archives_total
+        return PHASE_PROGRESS[self.phase]
+
+    def describe(self) -> str:
+        if self.state == 'queued':
+            return f'Waiting for a free worker to get data for {self.username}'
+        if self.state == 'failed':
+            return f'Getting data for {self.username} failed: {self.error}'
+        if self.state == 'done':
+            return f'Got the data of {self.username}'
+        if self.phase in (None, 'dlt_extract'):
+            archives = f'{self.archives_done}/{self.archives_total}' if self.archives_total is not None else self.archives_done
+            return f'Getting data for {self.username}: {archives} monthly archives, {self.games_fetched} games'
+        if self.phase in ('dlt_normalize', 'dlt_load'):
+            return f'Loading {self.games_fetched} games of {self.username}'
+        if self.phase == 'dbt_parse':
+            return 'Getting insights... parsing the dbt project'
+        model = f', running {self.current_model}' if self.current_model else ''
+        return (
+            f'Getting insights... {self.models_done}/{self.models_total or "?"} dbt nodes done{model}, '
+            f'{self.games_replayed} games replayed'
+        )
+
+
+class _ReplayedGames(logging.Handler):
+    """Forwards the games replayed by the move UDFs of the dbt build"""
+
+    def __init__(self, report: Callable[..., None]) -> None:
+        super().__init__(logging.INFO)
+        self.report = report
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.report('replayed', games=getattr(record, 'games', 0))
+
+
+def _run_job(job_id: str, db_path: str, usernames: List[str], reports: Any, **source_kwargs: Any) -> RefreshResult:
+    """Runs in a refresh pool worker, `reports` is the managed queue read by the JobQueue"""
+
+    def report(kind: str, **values: Any) -> None:
+        reports.put((job_id, kind, values))
+
+    def on_dbt_event(event: EventMsg) -> None:
+        if event.info.name == 'LogStartLine':
+            report('node', name=event.data.node_info.node_name, total=event.data.total)
+        elif event.info.name == 'NodeFinished':
+            report('node_done')
+
+    replay_logger = logging.getLogger(REPLAY_LOGGER)
+    handler = _ReplayedGames(report)
+    replay_logger.addHandler(handler)
+    replay_logger.setLevel(logging.INFO)
+    report('started')
+    try:
+        return refresh_warehouse(
+            db_path,
+            usernames,
+            on_phase=lambda phase: report('phase', phase=phase),
+            dbt_callbacks=[on_dbt_event],
+            staged=True,
+            on_archives=lambda username, archives: report('archives', total=archives),
+            on_archive=lambda username, url, games, seconds: report('archive', games=games),
+            **source_kwargs,
+        )
+    finally:
+        replay_logger.removeHandler(handler)
+
+
+class JobQueue:
+    """
+    Runs refresh jobs on a pool of worker processes, sized like `start_refresh_pool`.
+    Args:
+        processes (int, optional): Worker processes, defaults to one per core.
+        on_done (Callable[[Job, RefreshResult], None], optional): Called in the dashboard process
+            when a job succeeded, before it is marked done, e.g. to export the player's data.
+        source_kwargs: Passed on to the `chess` source of every job.
+    """
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        on_done: Optional[Callable[[Job, RefreshResult], None]] = None,
+        **source_kwargs: Any,
+    ) -> None:
+        self.on_done = on_done
+        self.processes = processes
+        self.source_kwargs = source_kwargs
+        self._pool = start_refresh_pool(processes)
+        self._manager = multiprocessing.get_context('spawn').Manager()
+        self._reports = self._manager.Queue()
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read_reports, name='job-reports', daemon=True).start()
+
+    def submit(self, username: str) -> Job:
+        """Queues a refresh of `username`, or returns the refresh already queued or running"""
+        username = username.strip().lower()
+        db_path = warehouse_path(username)
+        with self._lock:
+            job = self._jobs.get(username)
+            if job is not None and job.is_active:
+                return replace(job)
+            job = Job(uuid.uuid4().hex, username)
+            self._jobs[username] = self._active[job.id] = job
+        try:
+            future = self._pool.submit(_run_job, job.id, db_path, [username], self._reports, **self.source_kwargs)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # a worker died abruptly, e.g. killed for its memory, the next jobs get a new pool
+                self._pool = start_refresh_pool(self.processes)
+            # never picked up by a worker, the job must not stay active
+            self._end(job, None, f'{type(e).__name__}: {e}')
+            return replace(job)
+        future.add_done_callback(lambda future: self._finish(job, future))
+        return replace(job)
+
+    def get(self, username: str) -> Optional[Job]:
+        """A snapshot of the latest job of `username`"""
+        with self._lock:
+            job = self._jobs.get(username.strip().lower())
+            return replace(job) if job is not None else None
+
+    def _finish(self, job: Job, future: Future) -> None:
+        error = None
+        try:
+            result: RefreshResult = future.result()
+            if not result.success:
+                error = f'dbt build failed: {result.dbt_error}'
+            elif self.on_done is not None:
+                self.on_done(job, result)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            result = None
+        self._end(job, result, error)
+
+    def _end(self, job: Job, result: Optional[RefreshResult], error: Optional[str]) -> None:
+        with self._lock:
+            self._active.pop(job.id, None)
+            job.timings = result.timings if result is not None else {}
+            job.error = error
+            job.state = 'failed' if error else 'done'
+            job.finished_at = time.time()
+
+    def _read_reports(self) -> None:
+        while True:
+            try:
+                job_id, kind, values = self._reports.get()
+            except (EOFError, OSError):
+                # the manager process is gone, the dashboard is shutting down
+                return
+            with self._lock:
+                job = self._active.get(job_id)
+                if job is None:
+                    continue
+                if kind == 'started':
+                    job.state = 'running'
+                elif kind == 'phase':
+                    job.phase = values['phase']
+                elif kind == 'archives':
+                    job.archives_total = (job.archives_total or 0) + values['total']
+                elif kind == 'archive':
+                    job.archives_done += 1
+                    job.games_fetched += values['games']
+                elif kind == 'replayed':
+                    job.games_replayed += values['games']
+                elif kind == 'node':
+                    job.current_model = values['name']
+                    job.models_total = values['total']
+                elif kind == 'node_done':
+                    job.models_done += 1
@@ -0,0 +1,352 @@
+"""
+Metrics of refreshes and dashboard queries, written to local files that monitoring tools read.
+
+Every refresh of a warehouse (see `refresh_warehouse` in chess_pipeline.py) writes two files named
+after its dlt pipeline in the metrics folder:
+- `<pipeline>.prom`: gauges of the last refresh in the Prometheus text format, e.g. for the textfile
+  collector of node_exporter. They hold the seconds of each phase, the archives, games and fetch
+  seconds of each player, the calls, rows and seconds of each UDF and the seconds of each dbt node.
+- `<pipeline>.traces.jsonl`: a line per refresh in the OTLP JSON format of OpenTelemetry, e.g. for
+  the `otlpjsonfile` receiver of the collector. The span of the refresh holds a span per phase,
+  archive fetch and dbt node.
+
+The dashboard adds up the count and seconds of each query it runs in `dashboard.prom`, written a few
+seconds after the queries of a rerun.
+The metrics folder is `data/metrics`, set CHESS_METRICS_FOLDER to move it or to an empty string to
+turn the metrics off.
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from dbt.cli.main import dbtRunnerResult
+
+METRICS_FOLDER = os.environ.get('CHESS_METRICS_FOLDER', 'data/metrics')
+
+# Logger of the calls of the UDFs in my_custom_functions.py
+UDF_LOGGER = 'chess_dbt.udf'
+
+logger = logging.getLogger(__name__)
+
+# Type and help of every metric
+METRICS = {
+    'chess_refresh_timestamp_seconds': ('gauge', 'End of the last refresh of the warehouse'),
+    'chess_refresh_success': ('gauge', '1 when the last refresh of the warehouse succeeded'),
+    'chess_refresh_phase_seconds': ('gauge', 'Seconds of each phase of the last refresh'),
+    'chess_refresh_archives': ('gauge', 'Archives fetched for each player by the last refresh'),
+    'chess_refresh_games': ('gauge', 'Games fetched for each player by the last refresh'),
+    'chess_refresh_archive_fetch_seconds': ('gauge', 'Seconds of the archive fetches of each player, summed over concurrent fetches'),
+    'chess_udf_calls': ('gauge', 'Calls of each UDF in the last dbt build, an arrow UDF is called per chunk of rows'),
+    'chess_udf_rows': ('gauge', 'Rows passed to each UDF in the last dbt build'),
+    'chess_udf_seconds': ('gauge', 'Seconds spent in each UDF in the last dbt build, summed over DuckDB threads'),
+    'chess_dbt_node_seconds': ('gauge', 'Seconds of each node of the last dbt build'),
+    'chess_dashboard_query_seconds': ('summary', 'Seconds of the dashboard queries run since it started, cached results excluded'),
+}
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Samples:
+    """Values of metrics by name and labels, rendered in the Prometheus text format"""
+
+    def __init__(self, **labels: Any) -> None:
+        # labels of every sample, e.g. the warehouse
+        self.labels = labels
+        self._values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return name, tuple((key, str(value)) for key, value in {**self.labels, **labels}.items())
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(name, labels)] = value
+
+    def add(self, name: str, value: float, **labels: Any) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> str:
+        families: Dict[str, List[str]] = {}
+        with self._lock:
+            for (name, labels), value in sorted(self._values.items()):
+                # the samples of a summary are its `_sum` and `_count`
+                family = name.rsplit('_', 1)[0] if name not in METRICS else name
+                rendered = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+                families.setdefault(family, []).append(f'{name}{{{rendered}}} {value!r}')
+        lines = []
+        for family, samples in families.items():
+            metric_type, help = METRICS[family]
+            lines += [f'# HELP {family} {help}', f'# TYPE {family} {metric_type}', *samples]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # replaced whole, a collector never reads half a file
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+@dataclass
+class Span:
+    """A timed operation, `start` and `end` in seconds since the epoch"""
+    name: str
+    start: float
+    end: Optional[float] = None
+    parent_id: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    id: str = field(default_factory=lambda: secrets.token_hex(8))
+
+    def otlp(self, trace_id: str) -> Dict[str, Any]:
+        span = {
+            'traceId': trace_id,
+            'spanId': self.id,
+            'name': self.name,
+            # SPAN_KIND_INTERNAL
+            'kind': 1,
+            'startTimeUnixNano': str(int(self.start * 1e9)),
+            'endTimeUnixNano': str(int((self.end or self.start) * 1e9)),
+            'attributes': _otlp_attributes(self.attributes),
+            # STATUS_CODE_OK or STATUS_CODE_ERROR
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _epoch(value: datetime) -> float:
+    # dbt times its nodes in naive UTC
+    return value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp()
+
+
+class _UdfCalls(logging.Handler):
+    """Adds up the calls of the UDFs reported by my_custom_functions.py"""
+
+    def __init__(self, samples: Samples) -> None:
+        super().__init__(logging.INFO)
+        self.samples = samples
+
+    def emit(self, record: logging.LogRecord) -> None:
+        udf = getattr(record, 'udf', None)
+        if udf is None:
+            return
+        self.samples.add('chess_udf_calls', 1, udf=udf)
+        self.samples.add('chess_udf_rows', record.rows, udf=udf)
+        self.samples.add('chess_udf_seconds', record.seconds, udf=udf)
+
+
+class RefreshMetrics:
+    """
+    Metrics and spans of one refresh of the warehouse at `db_path`. Pass `on_phase` and `on_archive`
+    to the load and build, add the dbt result and call `write` once the refresh is over.
+    """
+
+    def __init__(self, db_path: str, name: str) -> None:
+        self.name = name
+        self.samples = Samples(warehouse=db_path)
+        self.trace_id = secrets.token_hex(16)
+        self.root = Span('refresh', time.time(), attributes={'chess.warehouse': db_path})
+        self.spans: List[Span] = [self.root]
+        self._phases: Dict[str, Span] = {}
+        self._lock = threading.Lock()
+
+    def on_phase(self, phase: str) -> None:
+        """A PhaseCallback, the phase span ends when its seconds are known in `add_timings`"""
+        span = Span(phase, time.time(), parent_id=self.root.id)
+        with self._lock:
+            self._phases[phase] = span
+            self.spans.append(span)
+
+    def on_archive(self, username: str, url: str, games: int, seconds: float) -> None:
+        """An ArchiveCallback of the `chess` source, called as each archive fetch ends"""
+        end = time.time()
+        with self._lock:
+            extract = self._phases.get('dlt_extract')
+            self.spans.append(Span(
+                'archive_fetch', end - seconds, end, extract.id if extract else self.root.id,
+                {'chess.username': username, 'chess.archive_url': url, 'chess.games': games},
+            ))
+        self.samples.add('chess_refresh_archives', 1, username=username)
+        self.samples.add('chess_refresh_games', games, username=username)
+        self.samples.add('chess_refresh_archive_fetch_seconds', seconds, username=username)
+
+    def add_timings(self, timings: Dict[str, float]) -> None:
+        for phase, seconds in timings.items():
+            self.samples.set('chess_refresh_phase_seconds', seconds, phase=phase)
+            span = self._phases.get(phase)
+            if span is not None:
+                span.end = span.start + seconds
+
+    def add_dbt_result(self, res: dbtRunnerResult) -> None:
+        """The node timings of a `dbt build`"""
+        build = self._phases.get('dbt_build')
+        for result in getattr(res.result, 'results', None) or []:
+            node = result.node
+            self.samples.set(
+                'chess_dbt_node_seconds', result.execution_time,
+                node=node.name, resource_type=str(node.resource_type), status=str(result.status),
+            )
+            timing = [t for t in result.timing if t.started_at and t.completed_at]
+            if timing:
+                self.spans.append(Span(
+                    f'dbt {node.resource_type} {node.name}',
+                    min(_epoch(t.started_at) for t in timing),
+                    max(_epoch(t.completed_at) for t in timing),
+                    build.id if build else self.root.id,
+                    {'dbt.unique_id': node.unique_id, 'dbt.status': str(result.status)},
+                    error=result.message if str(result.status) in ('error', 'fail') else None,
+                ))
+
+    @contextmanager
+    def udf_calls(self) -> Iterator[None]:
+        """Counts the UDF calls of the dbt build run in the block"""
+        if not METRICS_FOLDER:
+            # the UDFs only time their calls for a listener
+            yield
+            return
+        udf_logger = logging.getLogger(UDF_LOGGER)
+        handler = _UdfCalls(self.samples)
+        level = udf_logger.level
+        udf_logger.addHandler(handler)
+        udf_logger.setLevel(logging.INFO)
+        try:
+            yield
+        finally:
+            # back to untimed UDF calls outside of the build
+            udf_logger.removeHandler(handler)
+            udf_logger.setLevel(level)
+
+    def write(self, error: Optional[str] = None, folder: str = METRICS_FOLDER) -> None:
+        """Ends the refresh, replaces the metrics of its warehouse and appends its trace"""
+        if not folder:
+            return
+        self.root.end = time.time()
+        self.root.error = error
+        for span in self.spans:
+            # a phase cut short by an error
+            span.end = span.end or self.root.end
+        self.samples.set('chess_refresh_timestamp_seconds', self.root.end)
+        self.samples.set('chess_refresh_success', 0 if error else 1)
+        trace = {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': 'chess_pipeline'})},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [span.otlp(self.trace_id) for span in self.spans],
+            }],
+        }]}
+        try:
+            self.samples.write(os.path.join(folder, f'{self.name}.prom'))
+            with open(os.path.join(folder, f'{self.name}.traces.jsonl'), 'a') as f:
+                f.write(json.dumps(trace) + '\n')
+        except OSError as e:
+            # the refresh itself went through
+            logger.warning(f"Could not write the metrics of {self.name}: {e}")
+
+
+# Queries run by this dashboard process
+_dashboard_queries = Samples()
+
+# Seconds from a query to the write of `dashboard.prom`, the queries of a rerun are written at once
+DASHBOARD_WRITE_INTERVAL = 5.0
+
+_dashboard_write: Optional[threading.Timer] = None
+_dashboard_write_lock = threading.Lock()
+
+
+def _write_dashboard_queries() -> None:
+    global _dashboard_write
+    with _dashboard_write_lock:
+        if _dashboard_write is not None:
+            _dashboard_write.cancel()
+            _dashboard_write = None
+    try:
+        _dashboard_queries.write(os.path.join(METRICS_FOLDER, 'dashboard.prom'))
+    except OSError as e:
+        logger.warning(f"Could not write the metrics of the dashboard: {e}")
+
+
+def _schedule_dashboard_write() -> None:
+    global _dashboard_write
+    with _dashboard_write_lock:
+        if _dashboard_write is None:
+            _dashboard_write = threading.Timer(DASHBOARD_WRITE_INTERVAL, _write_dashboard_queries)
+            _dashboard_write.daemon = True
+            _dashboard_write.start()
+
+
+def timed_query(func: Callable) -> Callable:
+    """
+    Adds the seconds of every call of a dashboard query to `dashboard.prom`, under `st.cache_data` only
+    misses count. The file is written `DASHBOARD_WRITE_INTERVAL` seconds after a query, and at exit.
+    """
+    if not METRICS_FOLDER:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _dashboard_queries.add('chess_dashboard_query_seconds_sum', time.perf_counter() - start, query=func.__name__)
+            _dashboard_queries.add('chess_dashboard_query_seconds_count', 1, query=func.__name__)
+            _schedule_dashboard_write()
+
+    return wrapper
+
+
+@atexit.register
+def _flush_dashboard_queries() -> None:
+    # the queries of a write still pending
+    if _dashboard_write is not None:
+        _write_dashboard_queries()
+
+
+@contextmanager
+def profiled(path: Optional[str]) -> Iterator[None]:
+    """
+    Profiles the block with cProfile into `path`, read it with `python -m pstats` or snakeviz. Only
+    the calling thread is profiled, the UDFs run on DuckDB threads, use py-spy to see those.
+    """
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
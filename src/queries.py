@@ -0,0 +1,469 @@
+"""
+Cached queries behind the dashboard.
+
+Streamlit reruns `app.py` on every widget change. Each query here is cached on the player, the
+version of the player's data (so a "Get Data" refresh invalidates it) and only the filters it
+depends on, so moving the opening slider does not recompute the overview and changing the
+timezone only recomputes the day/hour charts.
+
+The games are never loaded whole. Every query reads them through the lazy `user_df` CTE, either
+from `main.games` in the player's warehouse or from the player's parquet export, so DuckDB pushes the
+filters down to the scan and only reads the columns that query uses.
+
+DuckDB lets a file have one writing process or any number of read-only ones, never both. Queries of the
+warehouse open a short lived read-only connection, so they only hold the file for the query. If a
+writer (the dlt load or the dbt build of a refresh) holds it, the connection is retried for a few
+seconds and then `WarehouseBusy` is raised. Refreshes started from the dashboard write a copy of the
+warehouse that is swapped in once their build succeeded, so only other writers, e.g. the batch CLI,
+lock readers out.
+
+The seconds of every query that misses the cache are added up in the metrics folder, see metrics.py.
+"""
+
+import os
+import time
+from typing import List, NamedTuple, Tuple
+
+import chess
+import chess.polyglot
+import duckdb
+import pandas as pd
+import streamlit as st
+
+from chess_pipeline import DATA_FOLDER, warehouse_path
+from metrics import timed_query
+
+# 'warehouse' queries main.games in the player's dbt warehouse, 'parquet' the per player export of "Get Data"
+DATA_SOURCES = ('warehouse', 'parquet')
+DATA_SOURCE = os.environ.get('CHESS_DATA_SOURCE', 'warehouse')
+if DATA_SOURCE not in DATA_SOURCES:
+    raise ValueError(f"CHESS_DATA_SOURCE must be one of {DATA_SOURCES}, got {DATA_SOURCE}")
+
+# Bounded cache of many small query results
+QUERY_MAX_ENTRIES = 512
+
+# Attempts to open the warehouse while a writer holds it, waiting twice as long after each one
+WAREHOUSE_LOCK_ATTEMPTS = 5
+WAREHOUSE_LOCK_WAIT = 0.25
+
+
+class WarehouseBusy(RuntimeError):
+    """The player's warehouse is held by a writer, e.g. a refresh of the batch CLI"""
+
+
+class Filters(NamedTuple):
+    """The dashboard filters applied to every query, hashable so it can be part of a cache key"""
+    time_class: str
+    player_color: Tuple[str, ...]
+    date_min: str
+    date_max: str
+
+    def params(self) -> dict:
+        return {
+            'time_class': self.time_class,
+            'player_color': list(self.player_color),
+            'date_min': self.date_min,
+            'date_max': self.date_max,
+        }
+
+
+# CTE name of each table holding the player's rows: the games, the dbt rollups of the Overview
+# and the opening and position indexes
+USER_TABLES = {
+    'user_df': 'games',
+    'user_hourly': 'games_hourly',
+    'user_daily': 'games_daily',
+    'user_tree': 'opening_tree',
+    'user_positions': 'positions',
+}
+
+# Deepest node of the opening tree, the `opening_tree_depth` dbt var
+OPENING_TREE_DEPTH = 15
+
+FILTER = """
+        where time_class = $time_class
+        and list_contains($player_color, player_color)
+        and game_start_date between $date_min::date and $date_max::date
+"""
+FILTERED_GAMES = f"""
+    df as (select * from user_df {FILTER})
+    , hourly as (select * from user_hourly {FILTER})
+    , daily as (select * from user_daily {FILTER})
+    , tree as (select * from user_tree {FILTER})
+    , positions as (select * from user_positions {FILTER})
+"""
+
+
+def position_hash(board: chess.Board) -> int:
+    """Zobrist hash of the position on `board`, the key of the `positions` table"""
+    return chess.polyglot.zobrist_hash(board)
+
+
+def user_data_path(username: str, table: str = 'games') -> str:
+    # named like the warehouse, after the username as the refresh jobs normalise it
+    username = username.strip().lower()
+    if table == 'games':
+        return f'{DATA_FOLDER}/{username}.parquet'
+    return f'{DATA_FOLDER}/{username}.{table}.parquet'
+
+
+def _source_path(username: str) -> str:
+    return warehouse_path(username) if DATA_SOURCE == 'warehouse' else user_data_path(username)
+
+
+def user_data_mtime(username: str) -> float:
+    """Part of every cache key, a new build or export of the player's data invalidates the cached results"""
+    path = _source_path(username)
+    # writes may still sit in the warehouse's write-ahead log
+    return max(os.path.getmtime(p) for p in (path, f'{path}.wal') if os.path.exists(p))
+
+
+def has_user_data(username: str) -> bool:
+    try:
+        if not os.path.exists(_source_path(username)):
+            return False
+    except ValueError:
+        # not a chess.com username, there is no warehouse to look for
+        return False
+    if DATA_SOURCE == 'parquet':
+        return True
+    return bool(_query(username, "select count(*) as num_games from user_df")['num_games'].iloc[0])
+
+
+def export_user_data(conn: duckdb.DuckDBPyConnection, username: str) -> None:
+    """Writes the player's rows of every table in USER_TABLES to parquet, for the parquet data source"""
+    for table in USER_TABLES.values():
+        path = user_data_path(username, table).replace("'", "''")
+        conn.execute(f"""
+            COPY (SELECT * FROM main.{table} WHERE player_username = $username)
+            TO '{path}' (FORMAT parquet)
+        """, {'username': username.strip().lower()})
+
+
+@st.cache_resource
+def get_connection() -> duckdb.DuckDBPyConnection:
+    """In-memory DuckDB shared by every session, queries run on their own cursor"""
+    return duckdb.connect()
+
+
+def connect_warehouse(username: str) -> duckdb.DuckDBPyConnection:
+    """
+    A read-only connection to the player's warehouse, retried while a writer holds the file.
+    Raises WarehouseBusy when the writer still holds it after WAREHOUSE_LOCK_ATTEMPTS.
+    """
+    path = warehouse_path(username)
+    wait = WAREHOUSE_LOCK_WAIT
+    for attempt in range(WAREHOUSE_LOCK_ATTEMPTS):
+        try:
+            return duckdb.connect(path, read_only=True)
+        except duckdb.IOException as e:
+            # "Could not set lock on file", any other IO error is not worth waiting for
+            if 'lock' not in str(e).lower():
+                raise
+            if attempt == WAREHOUSE_LOCK_ATTEMPTS - 1:
+                raise WarehouseBusy(f"The data of {username} is being written, try again in a moment") from e
+        time.sleep(wait)
+        wait *= 2
+
+
+def _query(username: str, query: str, params: dict = None) -> pd.DataFrame:
+    """Runs `query` with the player's rows of USER_TABLES available as CTEs, e.g. the games as `user_df`"""
+    params = dict(params or {})
+    if DATA_SOURCE == 'warehouse':
+        # a short lived read-only connection, a long lived one would lock out the dlt and dbt writers
+        cursor = connect_warehouse(username)
+        user_tables = ", ".join(
+            f"{name} as (select * from main.{table} where player_username = $username)"
+            for name, table in USER_TABLES.items()
+        )
+        params['username'] = username.strip().lower()
+    else:
+        cursor = get_connection().cursor()
+        user_tables = ", ".join(
+            f"""{name} as (select * from read_parquet('{user_data_path(username, table).replace("'", "''")}'))"""
+            for name, table in USER_TABLES.items()
+        )
+    try:
+        return cursor.execute(f"with {user_tables} {query}", params).df()
+    finally:
+        cursor.close()
+
+
+def _filtered_query(username: str, filters: Filters, query: str, params: dict = None) -> pd.DataFrame:
+    return _query(username, f", {FILTERED_GAMES} {query}", {**filters.params(), **(params or {})})
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_distinct_values(username: str, mtime: float, column: str) -> List[str]:
+    df = _query(username, f"select distinct {column} from user_df order by {column}")
+    return df[column].tolist()
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_date_range(username: str, mtime: float, time_class: str, player_color: Tuple[str, ...]) -> Tuple:
+    df = _query(username, """
+        select min(game_start_date), max(game_start_date)
+        from user_df
+        where time_class = $time_class
+        and list_contains($player_color, player_color)
+    """, {'time_class': time_class, 'player_color': list(player_color)})
+    return tuple(df.iloc[0])
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_summary(username: str, mtime: float, filters: Filters) -> dict:
+    return _filtered_query(username, filters, """
+        select
+        coalesce(sum(num_games), 0)::bigint as num_games
+        , sum(if(player_wdl = 'win', num_games, 0)) / sum(num_games) as win_perc
+        , coalesce(sum(player_num_moves), 0)::bigint as num_moves
+        , coalesce(sum(player_total_move_time), 0) as total_move_time
+        from hourly
+    """).to_dict('records')[0]
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_daily_games(username: str, mtime: float, filters: Filters) -> pd.DataFrame:
+    return _filtered_query(username, filters, """
+        select
+        game_start_date
+        , max_by(last_player_rating, last_game_start_timestamp) as player_rating
+        , sum(num_games)::bigint as num_games
+        from daily
+        group by game_start_date
+    """)
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_wdl(username: str, mtime: float, filters: Filters) -> pd.DataFrame:
+    return _filtered_query(username, filters, """
+        SELECT
+        player_wdl
+        , sum(num_games)::bigint as num_games
+        , 100.0 * sum(num_games) / sum(sum(num_games)) over() as win_perc
+        FROM hourly
+        group by player_wdl
+    """)
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_wdl_reason(username: str, mtime: float, filters: Filters) -> pd.DataFrame:
+    return _filtered_query(username, filters, """
+        SELECT
+        player_wdl
+        , player_wdl_reason
+        , sum(num_games)::bigint as num_games
+        , 100.0 * sum(num_games) / sum(sum(num_games)) over() as win_perc
+        FROM hourly
+        group by player_wdl, player_wdl_reason
+    """)
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_dow_hour(username: str, mtime: float, filters: Filters, timezone: str) -> pd.DataFrame:
+    # cast in the query instead of `set timezone`, the cursor's session is shared with other queries
+    return _filtered_query(username, filters, """
+        , base as (
+            select
+            timezone(
+                $timezone
+                , ((game_start_date + to_hours(game_start_hour) + to_minutes(game_start_minute))::VARCHAR || ' UTC')::TIMESTAMPTZ
+            ) as ts
+            , player_wdl
+            , num_games
+            from hourly
+        )
+        select
+            hour(ts) as ts_hour
+            , dayofweek(ts) as ts_day_of_week
+            , case ts_day_of_week
+                when 0 then 'Sunday'
+                when 1 then 'Monday'
+                when 2 then 'Tuesday'
+                when 3 then 'Wednesday'
+                when 4 then 'Thursday'
+                when 5 then 'Friday'
+                when 6 then 'Saturday'
+                else 'Unknown'
+            end as ts_day_of_week_name
+            , player_wdl
+            , sum(num_games)::bigint as num_games
+        from base
+        group by all;
+    """, {'timezone': timezone})
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_dow_hour_heatmap(username: str, mtime: float, filters: Filters, timezone: str) -> pd.DataFrame:
+    df_dow_hour = get_dow_hour(username, mtime, filters, timezone)
+    cursor = get_connection().cursor()
+    try:
+        cursor.register('df_dow_hour', df_dow_hour)
+        return cursor.sql("""
+            select
+            ts_day_of_week_name
+            , ts_hour
+            , 100.0 * sum(if(player_wdl = 'win', num_games, 0)) / sum(num_games) as perc
+            , sum(num_games)::bigint as num_games
+            from df_dow_hour
+            group by ts_day_of_week_name, ts_hour
+        """).df()
+    finally:
+        cursor.close()
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_checkmate_pieces(username: str, mtime: float, filters: Filters) -> pd.DataFrame:
+    return _filtered_query(username, filters, """
+        select
+        player_wdl
+        , checkmate_pieces
+        , sum(num_games)::bigint as num_games
+        from hourly
+        where player_wdl_reason = 'checkmated'
+        group by all
+        order by player_wdl, num_games desc;
+    """)
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_game_phase(username: str, mtime: float, filters: Filters) -> pd.DataFrame:
+    return _filtered_query(username, filters, """
+        select
+        ended_game_phase
+        , player_wdl
+        , sum(num_games)::bigint as num_games
+        , sum(sum(num_games)) over()::bigint as total_games
+        from hourly
+        group by all
+    """)
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_starting_moves(username: str, mtime: float, filters: Filters, move_num: int) -> pd.DataFrame:
+    return _filtered_query(username, filters, """
+        , cte as (
+            SELECT
+            player_color
+            , player_wdl
+            , opening_prefix as starting_moves
+            , sum(num_games)::bigint as wdl_num_games
+            , sum(sum(num_games)) over(partition by player_color, starting_moves)::bigint as num_games
+            FROM tree
+            where depth = $move_num
+            group by player_color, player_wdl, starting_moves
+        )
+        select
+            *
+            , dense_rank() over(partition by player_color order by num_games desc) as rn
+            , 100.0 * wdl_num_games / num_games as perc
+        from cte
+        qualify rn <= 5
+    """, {'move_num': move_num})
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_top_openings(username: str, mtime: float, filters: Filters, move_num: int, player_color: str, player_wdl: str) -> pd.DataFrame:
+    """The 3 starting moves with the highest share of `player_wdl` results among the most played ones"""
+    df_starting_moves = get_starting_moves(username, mtime, filters, move_num)
+    cursor = get_connection().cursor()
+    try:
+        cursor.register('df_starting_moves', df_starting_moves)
+        return cursor.execute("""
+            select
+            *
+            , row_number() over(order by perc desc) as wdl_order
+            from df_starting_moves
+            where player_color = $color
+            and player_wdl = $wdl
+            qualify wdl_order <= 3
+        """, {'color': player_color, 'wdl': player_wdl}).df()
+    finally:
+        cursor.close()
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_opening_games(
+    username: str, mtime: float, filters: Filters, move_num: int, player_color: str, player_wdl: str, opening: str
+) -> pd.DataFrame:
+    return _filtered_query(username, filters, """
+        select *
+        from (
+            select
+            unnest(flatten(list(game_analysis_urls))) as game_analysis_url
+            from tree
+            where depth = $move_num
+            and player_color = $color
+            and player_wdl = $wdl
+            and opening_prefix = $opening
+        )
+        using sample 5 rows;
+    """, {'move_num': move_num, 'color': player_color, 'wdl': player_wdl, 'opening': opening})
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_latest_games(username: str, mtime: float, filters: Filters) -> pd.DataFrame:
+    return _filtered_query(username, filters, """
+        select
+        player_color
+        , player_wdl
+        , player_wdl_reason
+        , opponent_rating
+        , game_analysis_url
+        from df
+        order by game_start_timestamp desc
+        limit 20;
+    """)
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_position_wdl(username: str, mtime: float, filters: Filters, position_hash: int) -> pd.DataFrame:
+    """Results of the games that reached the position, by any move order"""
+    return _filtered_query(username, filters, """
+        select
+        player_color
+        , player_wdl
+        , count(1) as num_games
+        , 100.0 * num_games / sum(num_games) over(partition by player_color) as perc
+        from positions
+        where position_hash = $position_hash
+        group by player_color, player_wdl
+        order by player_color, player_wdl
+    """, {'position_hash': position_hash})
+
+
+@st.cache_data(max_entries=QUERY_MAX_ENTRIES)
+@timed_query
+def get_position_games(username: str, mtime: float, filters: Filters, position_hash: int) -> pd.DataFrame:
+    return _filtered_query(username, filters, """
+        select
+        player_color
+        , player_wdl
+        , game_move_index
+        , game_analysis_url
+        from positions
+        where position_hash = $position_hash
+        order by game_start_timestamp desc
+        limit 20;
+    """, {'position_hash': position_hash})
+
+
+def get_position_num_games(username: str, mtime: float, filters: Filters, position_hash: int, player_color: str) -> int:
+    """Games of `player_color` that reached the position, including through transpositions"""
+    df = get_position_wdl(username, mtime, filters, position_hash)
+    return int(df.loc[df['player_color'] == player_color, 'num_games'].sum())
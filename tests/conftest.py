@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# the modules of the app are imported from `src` as the app and the benchmarks do,
+# the tests run from the root of the repository like them (dbt is pointed at `src/chess_dbt`)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+# dlt would otherwise hold the exit of the test run until its usage events are sent
+os.environ.setdefault('RUNTIME__DLTHUB_TELEMETRY', 'false')
+
+from benchmarks.stub_api import StubChessApi  # noqa: E402
+
+
+@pytest.fixture
+def stub_api():
+    with StubChessApi(months=3, games_per_month=5) as api:
+        yield api
+
+
+@pytest.fixture
+def dlt_dirs(tmp_path, monkeypatch):
+    """Fresh dlt state and dbt target/log folders for the test"""
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv('DLT_DATA_DIR', str(tmp_path / 'dlt'))
+    monkeypatch.setenv('DBT_TARGET_PATH', str(tmp_path / 'target'))
+    monkeypatch.setenv('DBT_LOG_PATH', str(tmp_path / 'logs'))
+    return tmp_path
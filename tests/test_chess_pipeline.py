@@ -0,0 +1,43 @@
+import os
+from types import SimpleNamespace
+
+import duckdb
+
+import chess_dlt.chess as chess_source
+import chess_pipeline
+from chess_pipeline import refresh_warehouse, staging_path
+
+
+def _games(db_path: str) -> int:
+    with duckdb.connect(db_path, read_only=True) as conn:
+        return conn.sql("select count(*) from main.games").fetchone()[0]
+
+
+def test_failed_build_is_not_published(stub_api, dlt_dirs, monkeypatch):
+    db_path = str(dlt_dirs / 'players' / 'alice' / 'chess.duckdb')
+    # the months stay open, a refresh fetches the new games of every archive
+    monkeypatch.setattr(chess_source, 'is_archive_closed', lambda url: False)
+
+    def refresh() -> chess_pipeline.RefreshResult:
+        return refresh_warehouse(db_path, ['alice'], staged=True, api_url=stub_api.api_url, requests_per_second=0)
+
+    assert refresh().dbt_error is None
+    assert _games(db_path) == 15
+    assert not os.path.exists(staging_path(db_path))
+
+    # the games loaded by a refresh whose build fails stay in the copy, not in the published warehouse
+    stub_api.update(games_per_month=8)
+    build_models = chess_pipeline.build_models
+    monkeypatch.setattr(chess_pipeline, 'build_models', lambda *args: SimpleNamespace(success=False, exception='boom', result=None))
+    assert refresh().dbt_error == 'boom'
+    assert _games(db_path) == 15
+    assert os.path.exists(staging_path(db_path))
+
+    # the next refresh builds over the copy it left, nothing new is fetched (304)
+    monkeypatch.setattr(chess_pipeline, 'build_models', build_models)
+    copies = []
+    monkeypatch.setattr(chess_pipeline.shutil, 'copyfile', lambda *args: copies.append(args))
+    assert refresh().dbt_error is None
+    assert copies == []
+    assert _games(db_path) == 24
+    assert not os.path.exists(staging_path(db_path))
@@ -0,0 +1,112 @@
+import time
+
+import dlt
+import pytest
+from dlt.sources.helpers import requests
+
+import chess_dlt.chess as chess_source
+from chess_dlt.chess import helpers
+from chess_dlt.chess.helpers import ChessApiClient, RateLimiter, configure_client, get_response_if_modified
+from chess_dlt.chess.settings import REQUEST_MAX_ATTEMPTS
+from chess_pipeline import load_players
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(helpers, 'REQUEST_BACKOFF_FACTOR', 0.01)
+
+
+def _archives_url(api) -> str:
+    return f'{api.api_url}player/alice/games/archives'
+
+
+def test_client_retries_server_errors(stub_api, fast_backoff):
+    stub_api.update(error_statuses=[503, 500, 502])
+    response = ChessApiClient(requests_per_second=0).get(_archives_url(stub_api))
+
+    assert response.status_code == 200
+    assert len(response.json()['archives']) == 3
+    stats = stub_api.get_stats()
+    assert (stats['requests'], stats['errors']) == (4, 3)
+
+
+def test_client_retries_throttled_after_retry_after(stub_api, fast_backoff):
+    stub_api.update(max_requests_per_second=1)
+    client = ChessApiClient(requests_per_second=0)
+    client.get(_archives_url(stub_api))
+
+    started = time.perf_counter()
+    response = client.get(_archives_url(stub_api))
+
+    assert response.status_code == 200
+    # the 429 asks for `Retry-After: 1`, longer than the backoff
+    assert time.perf_counter() - started >= 1.0
+    assert stub_api.get_stats()['throttled'] >= 1
+
+
+def test_client_gives_up_after_max_attempts(stub_api, fast_backoff):
+    stub_api.update(error_statuses=[503] * REQUEST_MAX_ATTEMPTS)
+
+    with pytest.raises(requests.HTTPError) as error:
+        ChessApiClient(requests_per_second=0).get(_archives_url(stub_api))
+
+    assert error.value.response.status_code == 503
+    assert stub_api.get_stats()['requests'] == REQUEST_MAX_ATTEMPTS
+
+
+def test_conditional_request_not_modified(stub_api):
+    configure_client(requests_per_second=0)
+    url = f'{stub_api.api_url}player/alice/games/{stub_api.month_list()[-1]}'
+
+    response, validators = get_response_if_modified(url, {})
+    assert len(response.json()['games']) == 5
+    assert validators['etag']
+
+    response, not_modified_validators = get_response_if_modified(url, validators)
+    assert response is None
+    assert not_modified_validators == validators
+    assert stub_api.get_stats()['not_modified'] == 1
+
+
+def test_rate_limiter_spaces_out_requests():
+    rate_limiter = RateLimiter(20)
+    started = time.perf_counter()
+    for _ in range(5):
+        rate_limiter.wait('https://api.chess.com/pub/player/alice')
+    # the first request starts at once, the next four 1/20s apart
+    assert time.perf_counter() - started >= 0.19
+
+
+def test_source_loads_every_game_through_errors(stub_api, dlt_dirs, fast_backoff):
+    stub_api.update(error_statuses=[429, 503, 500])
+    _, stats = load_players(
+        ['alice'], str(dlt_dirs / 'chess.duckdb'), pipeline_name='test_errors',
+        api_url=stub_api.api_url, requests_per_second=0,
+    )
+
+    assert (stats['alice'].archives, stats['alice'].games) == (3, 15)
+    assert stub_api.get_stats()['errors'] == 3
+
+
+def _resource_state(pipeline_name: str) -> dict:
+    state = dlt.attach(pipeline_name).state
+    return state['sources']['chess']['resources']['players_games']
+
+
+def test_validators_dropped_once_archives_close(stub_api, dlt_dirs, monkeypatch):
+    db_path = str(dlt_dirs / 'chess.duckdb')
+
+    # every month still open: the archives keep their validators for the next run
+    monkeypatch.setattr(chess_source, 'is_archive_closed', lambda url: False)
+    load_players(['alice'], db_path, pipeline_name='test_validators', api_url=stub_api.api_url, requests_per_second=0)
+    state = _resource_state('test_validators')
+    assert len(state['archive_validators']) == 3
+    assert state['archives'] == []
+
+    # the months closed since: fetched once more (304) and checked, without their validators
+    monkeypatch.setattr(chess_source, 'is_archive_closed', lambda url: True)
+    load_players(['alice'], db_path, pipeline_name='test_validators', api_url=stub_api.api_url, requests_per_second=0)
+    state = _resource_state('test_validators')
+    assert len(state['archives']) == 3
+    assert state['archive_validators'] == {}
+    assert stub_api.get_stats()['not_modified'] == 3
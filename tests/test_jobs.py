@@ -0,0 +1,75 @@
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import chess_pipeline
+import jobs
+import queries
+from jobs import JobQueue
+
+
+class _BrokenPool:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool('A process in the process pool was terminated abruptly')
+
+
+@pytest.fixture
+def job_queue():
+    queue = JobQueue(processes=1)
+    pool = queue._pool
+    yield queue
+    pool.shutdown(cancel_futures=True)
+    queue._manager.shutdown()
+
+
+def _wait(queue: JobQueue, username: str, timeout: float = 600) -> jobs.Job:
+    deadline = time.monotonic() + timeout
+    job = queue.get(username)
+    while job.is_active and time.monotonic() < deadline:
+        time.sleep(0.5)
+        job = queue.get(username)
+    return job
+
+
+def test_submit_to_broken_pool_fails_job(job_queue, monkeypatch):
+    new_pool = object()
+    job_queue._pool = _BrokenPool()
+    monkeypatch.setattr(jobs, 'start_refresh_pool', lambda processes: new_pool)
+
+    job = job_queue.submit('Alice')
+
+    assert job.state == 'failed'
+    assert 'BrokenProcessPool' in job.error
+    assert job_queue.get('alice').finished_at is not None
+    assert job_queue._active == {}
+    # the next jobs go to a new pool
+    assert job_queue._pool is new_pool
+
+
+def test_refresh_mixed_case_username_parquet(stub_api, dlt_dirs, monkeypatch):
+    monkeypatch.setenv('CHESS_METRICS_FOLDER', str(dlt_dirs / 'metrics'))
+    monkeypatch.setattr(chess_pipeline, 'SHARDS_FOLDER', str(dlt_dirs / 'players'))
+    monkeypatch.setattr(queries, 'DATA_FOLDER', str(dlt_dirs))
+    monkeypatch.setattr(queries, 'DATA_SOURCE', 'parquet')
+
+    def export_user_data(job: jobs.Job, result: chess_pipeline.RefreshResult) -> None:
+        # the hook of app.py
+        conn = queries.connect_warehouse(job.username)
+        queries.export_user_data(conn, job.username)
+        conn.close()
+
+    queue = JobQueue(processes=1, on_done=export_user_data, api_url=stub_api.api_url, requests_per_second=0)
+    try:
+        queue.submit('MagnusCarlsen')
+        job = _wait(queue, 'MagnusCarlsen')
+    finally:
+        queue._pool.shutdown()
+        queue._manager.shutdown()
+
+    assert job.state == 'done', job.error
+    # the dashboard reads the export under the name as it was typed
+    assert queries.has_user_data('MagnusCarlsen')
+    assert queries.user_data_mtime('MagnusCarlsen') > 0
+    df = queries._query('MagnusCarlsen', "select count(*) as num_games from user_df")
+    assert df['num_games'].iloc[0] == 15
@@ -0,0 +1,37 @@
+import logging
+import time
+
+import metrics
+
+
+def test_udf_calls_restores_logger_level(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_FOLDER', str(tmp_path))
+    udf_logger = logging.getLogger(metrics.UDF_LOGGER)
+    level = udf_logger.level
+
+    refresh = metrics.RefreshMetrics(str(tmp_path / 'chess.duckdb'), 'test')
+    with refresh.udf_calls():
+        udf_logger.info("udf: 3 rows", extra={'udf': 'udf', 'rows': 3, 'seconds': 0.5})
+        assert udf_logger.isEnabledFor(logging.INFO)
+
+    assert udf_logger.level == level
+    assert refresh.samples.render().count('chess_udf_rows{warehouse=') == 1
+
+
+def test_dashboard_queries_written_once_per_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_FOLDER', str(tmp_path))
+    monkeypatch.setattr(metrics, 'DASHBOARD_WRITE_INTERVAL', 0.2)
+    monkeypatch.setattr(metrics, '_dashboard_queries', metrics.Samples())
+    path = tmp_path / 'dashboard.prom'
+
+    @metrics.timed_query
+    def get_games() -> int:
+        return 1
+
+    # the misses of a rerun
+    for _ in range(5):
+        get_games()
+    assert not path.exists()
+
+    time.sleep(0.5)
+    assert 'chess_dashboard_query_seconds_count{query="get_games"} 5.0' in path.read_text()